@@ -8,12 +8,17 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime
 import sys
+import time
+from collections import deque
+from itertools import islice
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 try:
-    from src.components.external_ai import ExternalAIIntegrator
+    from src.components.external_ai import (get_integrator, answer_markdown, Source,
+                                            CHAT_CACHE_TTL, GOOGLE_CACHE_TTL)
+    from src.components.llm_cache import LLMCache
 except ImportError:
     st.error("External AI integration module not found!")
     st.stop()
@@ -29,8 +34,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for better appearance
-st.markdown("""
+# Page markup is built once at import instead of on every rerun
+CSS_BLOCK = """
 <style>
 .main-header {
     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -68,19 +73,69 @@ st.markdown("""
     color: #333;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+HEADER_HTML = """
+<div class="main-header">
+    <h1>🌟 Enhanced KnowledgeBase Agent</h1>
+    <h3>Powered by ChatGPT + GitHub Copilot + Google Search</h3>
+    <p>Get comprehensive answers from multiple AI sources</p>
+</div>
+"""
+
+# Badge markup indexed by Source id
+SOURCE_CARDS = [
+    '<div class="source-card chatgpt-card">🤖 ChatGPT</div>',
+    '<div class="source-card copilot-card">⚡ GitHub Copilot</div>',
+    '<div class="source-card google-card">🔍 Google Search</div>',
+    '<div class="source-card kb-card">📚 Knowledge Base</div>',
+]
+
+# Number of conversations kept per session
+MAX_HISTORY = 50
+
+# Query modes whose answer is streamed onto the page as it is generated
+STREAMED_MODES = ("ChatGPT Only", "Copilot Only")
+
+# Quick-action label -> question it fills in
+QUICK_ACTIONS = {
+    "💼 Company Policies": "What are our company policies and procedures?",
+    "🔐 Password Reset": "How do I reset my password and account security?",
+    "💻 Technical Support": "How do I get technical support and IT help?",
+    "📋 HR Benefits": "What employee benefits and HR services are available?",
+}
+
+@st.cache_resource
+def _inject_css():
+    """Emit the page styles; Streamlit replays the cached element on later reruns"""
+    st.markdown(CSS_BLOCK, unsafe_allow_html=True)
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
+
+@st.cache_resource
+def get_llm_cache():
+    """Response cache shared by all sessions so repeated questions skip the network"""
+    return LLMCache(embed_fn=get_integrator().embed_text)
 
 def init_session_state():
     """Initialize session state variables"""
     if 'ai_integrator' not in st.session_state:
-        st.session_state.ai_integrator = ExternalAIIntegrator()
+        st.session_state.ai_integrator = get_integrator()
     
     if 'enhanced_chat_history' not in st.session_state:
-        st.session_state.enhanced_chat_history = []
+        # Bounded so long sessions don't grow memory and session state without limit
+        st.session_state.enhanced_chat_history = deque(maxlen=MAX_HISTORY)
     
     if 'current_question' not in st.session_state:
         st.session_state.current_question = ""
 
+def _on_quick_action():
+    """Copy the picked quick action into the question box and reset the pills"""
+    choice = st.session_state.quick_action
+    if choice:
+        st.session_state.current_question = QUICK_ACTIONS[choice]
+    # Clearing the selection lets the same action be picked again later
+    st.session_state.quick_action = None
+
 def check_api_keys():
     """Check and display API key status"""
     st.sidebar.title("🔑 API Configuration")
@@ -103,23 +158,33 @@ def check_api_keys():
     
     return openai_key is not None
 
+def display_cache_stats():
+    """Show response cache hit/miss counters"""
+    stats = get_llm_cache().stats
+    st.sidebar.markdown("### ⚡ Response Cache")
+    col1, col2 = st.sidebar.columns(2)
+    col1.metric("Hits", stats["hits"])
+    col2.metric("Misses", stats["misses"])
+
 def main():
     """Enhanced main function with AI integration"""
     
-    # Header
-    st.markdown("""
-    <div class="main-header">
-        <h1>🌟 Enhanced KnowledgeBase Agent</h1>
-        <h3>Powered by ChatGPT + GitHub Copilot + Google Search</h3>
-        <p>Get comprehensive answers from multiple AI sources</p>
-    </div>
-    """, unsafe_allow_html=True)
+    # Styles and header
+    _inject_css()
     
     # Initialize
     init_session_state()
     
     # Check API keys
     has_openai = check_api_keys()
+    display_cache_stats()
+    
+    # Question input, quick actions and history redraw on their own
+    chat_fragment(has_openai)
+
+@st.fragment
+def chat_fragment(has_openai: bool):
+    """Interactive part of the page; its reruns skip the header, session setup and sidebar"""
     
     # Main interface
     col1, col2 = st.columns([2, 1])
@@ -151,27 +216,20 @@ def main():
     with col2:
         st.markdown("### 🎯 Quick Actions")
         
-        # Predefined questions
-        if st.button("💼 Company Policies", use_container_width=True):
-            st.session_state.current_question = "What are our company policies and procedures?"
-            st.rerun()
-            
-        if st.button("🔐 Password Reset", use_container_width=True):
-            st.session_state.current_question = "How do I reset my password and account security?"
-            st.rerun()
-            
-        if st.button("💻 Technical Support", use_container_width=True):
-            st.session_state.current_question = "How do I get technical support and IT help?"
-            st.rerun()
-            
-        if st.button("📋 HR Benefits", use_container_width=True):
-            st.session_state.current_question = "What employee benefits and HR services are available?"
-            st.rerun()
+        # Predefined questions as one pills widget; the callback fills the question box
+        st.pills(
+            "Quick questions",
+            list(QUICK_ACTIONS),
+            selection_mode="single",
+            key="quick_action",
+            on_change=_on_quick_action,
+            label_visibility="collapsed"
+        )
         
         # Clear history
         if st.button("🗑️ Clear History", use_container_width=True):
-            st.session_state.enhanced_chat_history = []
-            st.rerun()
+            st.session_state.enhanced_chat_history.clear()
+            st.rerun(scope="fragment")
     
     # Process question
     if submitted and question:
@@ -187,10 +245,20 @@ def process_enhanced_query(question: str, query_mode: str, has_openai: bool):
         st.error("❌ OpenAI API key required for ChatGPT and Copilot integration")
         return
     
-    start_time = datetime.now()
+    # Monotonic clock for the elapsed time; wall-clock ns kept as an int and only formatted when shown
+    start_ns = time.monotonic_ns()
+    started_at_ns = time.time_ns()
+    
+    cache = get_llm_cache()
     
     try:
-        if query_mode == "All Sources":
+        # Knowledge base answers are local, so only external modes go through the cache
+        cached_response, question_vector = (cache.lookup(question, query_mode)
+                                            if query_mode != "Knowledge Base Only" else (None, None))
+        
+        if cached_response:
+            final_response = cached_response
+        elif query_mode == "All Sources":
             # Query all sources
             st.info("🔍 Querying multiple AI sources... This may take a moment.")
             
@@ -198,7 +266,7 @@ def process_enhanced_query(question: str, query_mode: str, has_openai: bool):
             kb_response = {
                 "success": True,
                 "answer": f"**Knowledge Base Response:** Based on our internal documents, here's what I found about '{question}'. In a real implementation, this would search through uploaded documents using vector similarity and provide relevant information with citations.",
-                "sources": ["Internal Documents"],
+                "sources": [Source.KB],
                 "timestamp": datetime.now().isoformat()
             }
             
@@ -214,27 +282,57 @@ def process_enhanced_query(question: str, query_mode: str, has_openai: bool):
             )
             
         elif query_mode == "ChatGPT Only":
-            with st.spinner("🤖 Asking ChatGPT..."):
-                final_response = st.session_state.ai_integrator.query_chatgpt(question)
+            # Render tokens as they arrive instead of waiting for the full completion
+            st.markdown("**🤖 ChatGPT:**")
+            answer = st.write_stream(st.session_state.ai_integrator.stream_chatgpt(question))
+            final_response = {
+                "success": True,
+                "answer": answer,
+                "source": "ChatGPT (OpenAI)",
+                "source_id": Source.CHATGPT,
+                "model": "gpt-3.5-turbo",
+                "timestamp": datetime.now().isoformat()
+            }
                 
         elif query_mode == "Copilot Only":
-            with st.spinner("⚡ Consulting GitHub Copilot..."):
-                final_response = st.session_state.ai_integrator.simulate_copilot_response(question)
+            answer = st.write_stream(st.session_state.ai_integrator.stream_copilot(question))
+            final_response = {
+                "success": True,
+                "answer": answer,
+                "source": "GitHub Copilot",
+                "source_id": Source.COPILOT,
+                "model": "gpt-3.5-turbo (Copilot-style)",
+                "timestamp": datetime.now().isoformat()
+            }
                 
         elif query_mode == "Google Only":
+            # "a; b; c" searches each part and merges the results
+            queries = [q.strip() for q in question.split(";") if q.strip()]
             with st.spinner("🔍 Searching Google..."):
-                final_response = st.session_state.ai_integrator.query_google_search(question)
+                if len(queries) > 1:
+                    search_results = st.session_state.ai_integrator.batch_google(queries)
+                    final_response = st.session_state.ai_integrator.format_multi_source_response(
+                        question, search_results
+                    )
+                else:
+                    final_response = st.session_state.ai_integrator.query_google_search(question)
                 
         else:  # Knowledge Base Only
             final_response = {
                 "success": True,
                 "answer": f"**Knowledge Base Response:** This would search through your uploaded documents for information about '{question}'. In the full implementation, vector search would find relevant chunks from PDFs, DOCs, and text files, then use AI to generate a comprehensive answer with proper citations.",
-                "sources": ["Internal Knowledge Base"],
+                "sources": [Source.KB],
                 "timestamp": datetime.now().isoformat()
             }
         
+        if not cached_response and query_mode != "Knowledge Base Only":
+            # Same freshness as the integrator's own caches; failures are never cached here,
+            # so they still reach its short-lived negative cache
+            ttl = GOOGLE_CACHE_TTL if query_mode == "Google Only" else CHAT_CACHE_TTL
+            cache.set(question, query_mode, final_response, ttl=ttl, vector=question_vector)
+        
         # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
+        processing_time = (time.monotonic_ns() - start_ns) / 1e9
         
         # Store in history
         chat_entry = {
@@ -242,12 +340,15 @@ def process_enhanced_query(question: str, query_mode: str, has_openai: bool):
             "response": final_response,
             "query_mode": query_mode,
             "processing_time": processing_time,
-            "timestamp": start_time.isoformat()
+            "timestamp": started_at_ns
         }
         
         st.session_state.enhanced_chat_history.append(chat_entry)
         st.success(f"✅ Response generated in {processing_time:.2f} seconds!")
-        st.rerun()
+        
+        # A rerun would wipe the streamed answer off the page before the user has read it
+        if cached_response or query_mode not in STREAMED_MODES:
+            st.rerun(scope="fragment")
         
     except Exception as e:
         st.error(f"❌ Error processing query: {str(e)}")
@@ -267,47 +368,41 @@ def display_enhanced_chat_history():
     st.markdown("---")
     st.markdown("## 💬 Enhanced Chat History")
     
-    # Display recent conversations
-    for i, chat in enumerate(reversed(st.session_state.enhanced_chat_history[-5:])):
-        chat_num = len(st.session_state.enhanced_chat_history) - i
-        
-        with st.expander(f"🔍 Query {chat_num}: {chat['question'][:60]}...", expanded=i < 2):
-            
-            # Question
-            st.markdown(f"**❓ Question:** {chat['question']}")
-            
-            # Query info
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Mode", chat['query_mode'])
-            with col2:
-                st.metric("Time", f"{chat['processing_time']:.1f}s")
-            with col3:
-                st.metric("Sources", len(chat['response'].get('sources', [])))
-            
-            # Response
-            response = chat['response']
-            if response.get('success'):
-                st.markdown("**🤖 Response:**")
-                st.markdown(response['answer'])
-                
-                # Source indicators
-                if response.get('sources'):
-                    st.markdown("**📚 Sources Used:**")
-                    source_cols = st.columns(min(len(response['sources']), 4))
-                    
-                    for idx, source in enumerate(response['sources'][:4]):
-                        with source_cols[idx]:
-                            if "ChatGPT" in source:
-                                st.markdown('<div class="source-card chatgpt-card">🤖 ChatGPT</div>', unsafe_allow_html=True)
-                            elif "Copilot" in source:
-                                st.markdown('<div class="source-card copilot-card">⚡ GitHub Copilot</div>', unsafe_allow_html=True)
-                            elif "Google" in source:
-                                st.markdown('<div class="source-card google-card">🔍 Google Search</div>', unsafe_allow_html=True)
-                            else:
-                                st.markdown('<div class="source-card kb-card">📚 Knowledge Base</div>', unsafe_allow_html=True)
-            else:
-                st.error(f"❌ {response.get('error', 'Unknown error')}")
+    # One expander per conversation; user and AI text goes through plain markdown (never
+    # unsafe HTML), only the static source badges are raw HTML
+    history = st.session_state.enhanced_chat_history
+    for i, chat in enumerate(islice(reversed(history), 5)):
+        with st.expander(f"🔍 Query {len(history) - i}: {chat['question'][:60]}...", expanded=i < 2):
+            _render_history_entry(chat)
+
+def _format_timestamp(timestamp_ns: int) -> str:
+    """Wall-clock time of day for a stored time.time_ns() value"""
+    return datetime.fromtimestamp(timestamp_ns / 1e9).strftime("%H:%M:%S")
+
+def _render_history_entry(chat: dict):
+    """Body of one history entry: question, run details and answer as one markdown element"""
+    response = chat['response']
+    sources = response.get('sources', [])
+    parts = [
+        f"**❓ Question:** {chat['question']}",
+        f"**Asked:** {_format_timestamp(chat['timestamp'])} · "
+        f"**Mode:** {chat['query_mode']} · **Time:** {chat['processing_time']:.1f}s · "
+        f"**Sources:** {len(sources)}",
+    ]
+    
+    if not response.get('success'):
+        st.markdown("\n\n".join(parts))
+        st.error(f"❌ {response.get('error', 'Unknown error')}")
+        return
+    
+    parts.append("**🤖 Response:**")
+    parts += answer_markdown(response)
+    st.markdown("\n\n".join(parts))
+    
+    if sources:
+        st.markdown("**📚 Sources Used:**")
+        cards = "".join(f'<div style="flex: 1">{SOURCE_CARDS[source_id]}</div>' for source_id in sources[:4])
+        st.markdown(f'<div style="display: flex; gap: 0.5rem">{cards}</div>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
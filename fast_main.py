@@ -7,6 +7,10 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 from functools import lru_cache
+import threading
+import time
+from collections import deque
+from itertools import islice
 import logging
 from datetime import datetime
 
@@ -21,51 +25,85 @@ st.set_page_config(
 # Load environment variables early
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Page markup is built once at import instead of on every rerun
+CSS_BLOCK = """
+<style>
+.main-header { 
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    padding: 1rem; border-radius: 10px; text-align: center; color: white; margin-bottom: 2rem;
+}
+.fast-input { margin: 1rem 0; }
+.suggestion-btn { margin: 0.2rem; padding: 0.5rem; background: #f0f2f6; border: 1px solid #ddd; border-radius: 5px; }
+</style>
+"""
+
+HEADER_HTML = """
+<div class="main-header">
+    <h1>🚀 KnowledgeBase Agent - Fast Mode</h1>
+    <p>Lightning-fast AI-powered knowledge base</p>
+</div>
+"""
+
+@st.cache_resource
+def _inject_css():
+    """Emit the page styles; Streamlit replays the cached element on later reruns"""
+    st.markdown(CSS_BLOCK, unsafe_allow_html=True)
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
+
 # Cache expensive operations
 @st.cache_resource
 def init_components():
-    """Initialize components once and cache them - simplified version"""
+    """
+    Initialize components once and cache them - simplified version
+
+    Runs first on the warm-up thread, where Streamlit elements are dropped, so failures are
+    logged and returned as 'reason' for main() to display.
+    """
+    # A missing module fails the import directly, no separate find_spec probe needed
     try:
-        # Try to import components, but don't fail if they're not available
-        import sys
-        import importlib.util
-        
-        # Check if components exist
-        components_available = True
-        required_modules = [
-            'src.components.vector_store',
-            'src.components.model_loader', 
-            'src.components.query'
-        ]
-        
-        for module_name in required_modules:
-            spec = importlib.util.find_spec(module_name)
-            if spec is None:
-                components_available = False
-                break
+        from src.components.vector_store import VectorStoreFactory
+        from src.components.model_loader import ModelLoader
+        from src.components.query import QueryEngine
+    except ImportError as e:
+        logger.warning(f"Components unavailable: {e}")
+        return {'available': False, 'reason': str(e)}
+    
+    try:
+        vector_store = VectorStoreFactory.create_vector_store("chromadb")
+        model_loader = ModelLoader()
+        query_engine = QueryEngine(vector_store=vector_store, model_loader=model_loader)
         
-        if components_available:
-            from src.components.vector_store import VectorStoreFactory
-            from src.components.model_loader import ModelLoader
-            from src.components.query import QueryEngine
-            
-            vector_store = VectorStoreFactory.create_vector_store("chromadb")
-            model_loader = ModelLoader()
-            query_engine = QueryEngine(vector_store=vector_store, model_loader=model_loader)
-            
-            return {
-                'vector_store': vector_store,
-                'model_loader': model_loader,
-                'query_engine': query_engine,
-                'available': True
-            }
-        else:
-            return {'available': False, 'reason': 'Components not found'}
+        return {
+            'vector_store': vector_store,
+            'model_loader': model_loader,
+            'query_engine': query_engine,
+            'available': True
+        }
             
     except Exception as e:
-        st.error(f"Failed to initialize components: {e}")
+        logger.error(f"Failed to initialize components: {e}")
         return {'available': False, 'reason': str(e)}
 
+@st.cache_resource
+def _start_warmup():
+    """Build the components in the background once per process, while the first user is still typing"""
+    warmup = threading.Thread(target=init_components, name="components-warmup", daemon=True)
+    warmup.start()
+    return warmup
+
+_start_warmup()
+
+@st.cache_resource
+def get_response_cache():
+    """
+    Exact-match response cache shared across sessions (no embedding calls in fast mode);
+    answers expire after 5 minutes and are dropped when documents are ingested
+    """
+    from src.components.llm_cache import LLMCache
+    return LLMCache(ttl=300)
+
 @st.cache_data(ttl=60)  # Cache for 1 minute
 def get_suggestions():
     """Get cached suggestions"""
@@ -78,28 +116,16 @@ def get_suggestions():
         "Who should I contact for IT support?"
     ]
 
+def _on_suggestion():
+    """Queue the picked suggestion for submission and reset the pills"""
+    st.session_state.pending_question = st.session_state.suggestion
+    st.session_state.suggestion = None
+
 def main():
     """Fast main function"""
     
-    # Quick CSS injection
-    st.markdown("""
-    <style>
-    .main-header { 
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 1rem; border-radius: 10px; text-align: center; color: white; margin-bottom: 2rem;
-    }
-    .fast-input { margin: 1rem 0; }
-    .suggestion-btn { margin: 0.2rem; padding: 0.5rem; background: #f0f2f6; border: 1px solid #ddd; border-radius: 5px; }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Header
-    st.markdown("""
-    <div class="main-header">
-        <h1>🚀 KnowledgeBase Agent - Fast Mode</h1>
-        <p>Lightning-fast AI-powered knowledge base</p>
-    </div>
-    """, unsafe_allow_html=True)
+    # Styles and header
+    _inject_css()
     
     # Quick API key check
     api_key = os.getenv("OPENAI_API_KEY")
@@ -109,7 +135,7 @@ def main():
     
     # Initialize session state
     if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
+        st.session_state.chat_history = deque(maxlen=50)
     
     # Quick question input
     with st.form("quick_question", clear_on_submit=True):
@@ -123,13 +149,21 @@ def main():
     st.markdown("**💡 Quick Suggestions:**")
     suggestions = get_suggestions()
     
-    # Display suggestions in columns for faster rendering
-    cols = st.columns(3)
-    for i, suggestion in enumerate(suggestions[:6]):
-        with cols[i % 3]:
-            if st.button(f"💭 {suggestion[:30]}...", key=f"sugg_{i}"):
-                question = suggestion
-                submitted = True
+    # All suggestions in one pills widget; a pick is submitted like a typed question
+    st.pills(
+        "Quick suggestions",
+        suggestions[:6],
+        selection_mode="single",
+        format_func=lambda suggestion: f"💭 {suggestion}",
+        key="suggestion",
+        on_change=_on_suggestion,
+        label_visibility="collapsed"
+    )
+    
+    pending_question = st.session_state.pop('pending_question', None)
+    if pending_question:
+        question = pending_question
+        submitted = True
     
     # Process question quickly
     if submitted and question:
@@ -137,8 +171,13 @@ def main():
             try:
                 # Try to initialize components
                 components = init_components()
+                response_cache = get_response_cache()
+                from src.components.llm_cache import KB_ANSWER_MODE
+                cached_response = response_cache.get(question, KB_ANSWER_MODE)
                 
-                if components and components.get('available'):
+                if cached_response:
+                    response = cached_response
+                elif components and components.get('available'):
                     # Use real components if available
                     query_engine = components['query_engine']
                     response = query_engine.process_query(
@@ -148,6 +187,8 @@ def main():
                     )
                 else:
                     # Fallback to demo mode
+                    if components and components.get('reason'):
+                        st.error(f"Failed to initialize components: {components['reason']}")
                     st.warning("⚠️ Running in demo mode - components not fully available")
                     response = {
                         'success': True,
@@ -166,11 +207,14 @@ def main():
                         'timestamp': datetime.now().isoformat()
                     }
                 
+                if not cached_response and response.get('model') != 'demo-mode':
+                    response_cache.set(question, KB_ANSWER_MODE, response)
+                
                 # Add to chat history
                 st.session_state.chat_history.append({
                     'question': question,
                     'response': response,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': time.time_ns()
                 })
                 
                 st.success("✅ Answer generated successfully!")
@@ -185,11 +229,11 @@ def main():
         st.markdown("---")
         st.markdown("### 💬 Recent Conversations")
         
-        for i, chat in enumerate(reversed(st.session_state.chat_history[-3:])):  # Show last 3
+        for i, chat in enumerate(islice(reversed(st.session_state.chat_history), 3)):  # Show last 3
             with st.expander(f"Q{len(st.session_state.chat_history)-i}: {chat['question'][:50]}..."):
                 st.markdown(f"**Question:** {chat['question']}")
                 st.markdown(f"**Answer:** {chat['response']['answer']}")
-                st.caption(f"Time: {chat['timestamp']}")
+                st.caption(f"Time: {datetime.fromtimestamp(chat['timestamp'] / 1e9):%H:%M:%S}")
     
     # Quick actions
     st.markdown("---")
@@ -201,7 +245,7 @@ def main():
     
     with col2:
         if st.button("🗑️ Clear History"):
-            st.session_state.chat_history = []
+            st.session_state.chat_history.clear()
             st.rerun()
     
     with col3:
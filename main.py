@@ -6,13 +6,15 @@ A comprehensive AI-powered internal knowledge base system
 import os
 import sys
 import logging
+import random
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import traceback
+import time
 from functools import lru_cache
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
+import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
 
@@ -37,6 +39,66 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Suggestion lists are immutable module constants, shared by every rerun
+_GENERAL_SUGGESTIONS = (
+    "What are the company's core values?",
+    "How do I contact support?",
+    "What are the office hours?",
+    "Where can I find company resources?",
+    "What is the organizational structure?",
+    "How do I access the employee handbook?"
+)
+
+_HR_SUGGESTIONS = (
+    "What is the vacation policy?",
+    "How do I submit a time off request?",
+    "What are the employee benefits?",
+    "How do I update my personal information?",
+    "What is the performance review process?",
+    "How do I report workplace issues?"
+)
+
+_POLICY_SUGGESTIONS = (
+    "What is the remote work policy?",
+    "What is the dress code?",
+    "What are the security guidelines?",
+    "What is the expense policy?",
+    "What are the safety protocols?",
+    "What is the travel policy?"
+)
+
+_IT_SUGGESTIONS = (
+    "How do I reset my password?",
+    "How do I get IT support?",
+    "How do I access the VPN?",
+    "What software can I install?",
+    "How do I report a security issue?",
+    "How do I request new equipment?"
+)
+
+_SAMPLE_QUESTIONS = (
+    "What is the remote work policy?",
+    "How do I get IT support?",
+    "What are the employee benefits?",
+    "What is the vacation policy?",
+    "How do I submit expense reports?",
+    "What are the safety protocols?"
+)
+
+# Window in which repeated stats lookups within a session reuse the last result
+STATS_MEMO_SECONDS = 2.0
+
+# Conversations shown per "load more" page in the chat history
+HISTORY_PAGE_SIZE = 5
+
+# Upper bound on files parsed at once during upload
+MAX_UPLOAD_WORKERS = 8
+
+# Chat export separators
+_EXPORT_RULE = "=" * 50 + "\n\n"
+_CONV_SEP = "\n" + _EXPORT_RULE
+_Q_SEP = "-" * 20 + "\n"
+
 # Page configuration
 st.set_page_config(
     page_title="KnowledgeBase Agent",
@@ -45,8 +107,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS
-st.markdown("""
+# Custom CSS (only the page title is styled; everything else uses native components)
+_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -55,49 +117,41 @@ st.markdown("""
         text-align: center;
         margin-bottom: 2rem;
     }
-    
-    .section-header {
-        font-size: 1.5rem;
-        font-weight: bold;
-        color: #ff7f0e;
-        margin-top: 2rem;
-        margin-bottom: 1rem;
-        border-bottom: 2px solid #ff7f0e;
-        padding-bottom: 0.5rem;
-    }
-    
-    .metric-container {
-        background-color: #f0f2f6;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 0.5rem 0;
-    }
-    
-    .citation {
-        background-color: #e8f4f8;
-        padding: 0.5rem;
-        border-left: 4px solid #1f77b4;
-        margin: 0.5rem 0;
-        border-radius: 0.25rem;
-    }
-    
-    .error-message {
-        background-color: #ffe6e6;
-        padding: 1rem;
-        border-left: 4px solid #ff4444;
-        border-radius: 0.25rem;
-        margin: 1rem 0;
-    }
-    
-    .success-message {
-        background-color: #e6ffe6;
-        padding: 1rem;
-        border-left: 4px solid #44ff44;
-        border-radius: 0.25rem;
-        margin: 1rem 0;
-    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def _inject_css():
+    """Emit the page styles; Streamlit replays the cached element on later reruns"""
+    # st.html injects the stylesheet as-is, skipping the markdown pipeline
+    st.html(_CSS)
+
+
+# Static header markup, built once at import
+_HEADER_HTML = '<h1 class="main-header">🧠 KnowledgeBase Agent</h1>'
+
+
+# Heavy components are process-wide singletons: every session shares the same
+# embedding model, vector store handles and LLM clients
+@st.cache_resource(show_spinner=False)
+def _get_processor():
+    return create_document_processor()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_query_engine():
+    return create_query_engine()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_advanced_query_engine():
+    return create_advanced_query_engine()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_metadata_db():
+    return get_metadata_db()
 
 
 def initialize_session_state():
@@ -107,6 +161,8 @@ def initialize_session_state():
         st.session_state.chat_history = []
         st.session_state.uploaded_files_count = 0
         st.session_state.current_category = "general"
+        # Conversations rendered eagerly; older ones load on demand
+        st.session_state.history_page_size = HISTORY_PAGE_SIZE
         
         # Check API key
         api_key = os.getenv("OPENAI_API_KEY", "")
@@ -126,9 +182,9 @@ def initialize_session_state():
         
         # Initialize components
         try:
-            st.session_state.document_processor = create_document_processor()
-            st.session_state.query_engine = create_query_engine()
-            st.session_state.metadata_db = get_metadata_db()
+            st.session_state.document_processor = _get_processor()
+            st.session_state.query_engine = _get_query_engine()
+            st.session_state.metadata_db = _get_metadata_db()
             
             logger.info("Successfully initialized session state and components")
             
@@ -138,93 +194,121 @@ def initialize_session_state():
             st.stop()
 
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _cached_stats(generation: int, _processor) -> Dict[str, Any]:
+    """
+    Document statistics, recomputed only when the metadata DB's generation changes (or after
+    5 minutes); the generation is process-wide, like this cache, so every session agrees on it
+    """
+    return _processor.get_document_stats()
+
+
+def _get_stats_cached(max_age: float = STATS_MEMO_SECONDS) -> Dict[str, Any]:
+    """Per-session memo over _cached_stats so the sidebar and chat tab share one lookup per rerun"""
+    now = time.monotonic()
+    version = st.session_state.metadata_db.generation
+    memo = st.session_state.get('_stats_memo')
+    
+    if memo and memo['version'] == version and now - memo['at'] < max_age:
+        return memo['stats']
+    
+    stats = _cached_stats(version, st.session_state.document_processor)
+    st.session_state._stats_memo = {'version': version, 'at': now, 'stats': stats}
+    return stats
+
+
 def display_header():
     """Display main application header"""
-    st.markdown('<h1 class="main-header">🧠 KnowledgeBase Agent</h1>', unsafe_allow_html=True)
-    st.markdown("""
-    <div style="text-align: center; font-size: 1.1rem; color: #666; margin-bottom: 2rem;">
-        AI-Powered Internal Knowledge Base System • Upload Documents • Ask Questions • Get Instant Answers
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(_HEADER_HTML, unsafe_allow_html=True)
+    st.caption("AI-Powered Internal Knowledge Base System • Upload Documents • Ask Questions • Get Instant Answers")
 
 
+@st.fragment
 def display_sidebar():
-    """Display sidebar with configuration and stats"""
-    with st.sidebar:
-        st.header("⚙️ Configuration")
-        
-        # Model selection
-        model_provider = st.selectbox(
-            "AI Model Provider",
-            ["OpenAI", "Claude", "Gemini"],
-            help="Select the AI model provider for answering questions"
-        )
-        
-        # Vector store selection
-        vector_store = st.selectbox(
-            "Vector Store",
-            ["ChromaDB", "Pinecone"],
-            help="Select the vector database for document storage"
-        )
-        
-        # Category selection
-        st.session_state.current_category = st.selectbox(
-            "Document Category",
-            ["general", "hr", "policies", "sops", "technical"],
-            help="Select document category for filtering"
-        ).lower()
-        
-        # Retrieval settings
-        st.subheader("🔍 Retrieval Settings")
-        k_documents = st.slider(
-            "Documents to retrieve",
-            min_value=1,
-            max_value=10,
-            value=5,
-            help="Number of relevant documents to retrieve for each query"
-        )
-        
-        # Display statistics
-        st.markdown('<div class="section-header">📊 Statistics</div>', unsafe_allow_html=True)
-        
-        try:
-            stats = st.session_state.document_processor.get_document_stats()
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("📄 Documents", stats.get("total_documents", 0))
-            with col2:
-                st.metric("📝 Chunks", stats.get("total_chunks", 0))
-            
-            # Categories breakdown
-            if stats.get("categories"):
-                st.subheader("Categories")
-                for category, count in stats["categories"].items():
-                    st.write(f"• {category.title()}: {count}")
-            
-            # File types breakdown
-            if stats.get("file_types"):
-                st.subheader("File Types")
-                for file_type, count in stats["file_types"].items():
-                    st.write(f"• {file_type.upper()}: {count}")
-                    
-        except Exception as e:
-            st.error(f"Error loading statistics: {e}")
-        
-        # Quick actions
-        st.markdown('<div class="section-header">⚡ Quick Actions</div>', unsafe_allow_html=True)
-        
-        if st.button("🗑️ Clear Chat History"):
-            st.session_state.chat_history = []
-            st.rerun()
+    """
+    Display sidebar with configuration and stats
+    
+    Runs as a fragment inside the caller's ``st.sidebar`` block, so widget changes here
+    rerun only the sidebar; stats follow the metadata DB's generation on the next run.
+    """
+    st.header("⚙️ Configuration")
+    
+    # Model selection
+    model_provider = st.selectbox(
+        "AI Model Provider",
+        ["OpenAI", "Claude", "Gemini"],
+        help="Select the AI model provider for answering questions"
+    )
+    
+    # Vector store selection
+    vector_store = st.selectbox(
+        "Vector Store",
+        ["ChromaDB", "Pinecone"],
+        help="Select the vector database for document storage"
+    )
+    
+    # Category selection
+    st.session_state.current_category = st.selectbox(
+        "Document Category",
+        ["general", "hr", "policies", "sops", "technical"],
+        help="Select document category for filtering"
+    ).lower()
+    
+    # Retrieval settings
+    st.subheader("🔍 Retrieval Settings")
+    k_documents = st.slider(
+        "Documents to retrieve",
+        min_value=1,
+        max_value=10,
+        value=5,
+        help="Number of relevant documents to retrieve for each query"
+    )
+    
+    # Display statistics
+    st.subheader("📊 Statistics")
+    
+    try:
+        stats = _get_stats_cached()
         
-        if st.button("🔄 Refresh Stats"):
-            st.rerun()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("📄 Documents", stats.get("total_documents", 0))
+        with col2:
+            st.metric("📝 Chunks", stats.get("total_chunks", 0))
+        
+        # Categories breakdown
+        if stats.get("categories"):
+            st.subheader("Categories")
+            for category, count in stats["categories"].items():
+                st.write(f"• {category.title()}: {count}")
+        
+        # File types breakdown
+        if stats.get("file_types"):
+            st.subheader("File Types")
+            for file_type, count in stats["file_types"].items():
+                st.write(f"• {file_type.upper()}: {count}")
+                
+    except Exception as e:
+        st.error(f"Error loading statistics: {e}")
+    
+    # Quick actions
+    st.subheader("⚡ Quick Actions")
+    
+    if st.button("🗑️ Clear Chat History"):
+        st.session_state.chat_history = []
+        st.rerun()
+    
+    if st.button("🔄 Refresh Stats"):
+        _cached_stats.clear()
+        st.session_state.pop('_stats_memo', None)
+        # Full rerun: the chat tab shows the document set too
+        st.rerun()
 
 
+@st.fragment
 def document_upload_section():
-    """Handle document upload and processing"""
-    st.markdown('<div class="section-header">📤 Document Upload</div>', unsafe_allow_html=True)
+    """Handle document upload and processing (a fragment: its widgets rerun only this tab, a successful upload reruns the page)"""
+    st.subheader("📤 Document Upload")
     
     # Show sample document info
     st.info("""
@@ -255,10 +339,18 @@ def document_upload_section():
             status_text = st.empty()
             
             try:
-                # Process files
+                # Parse files in parallel, then embed all their chunks in shared batches
                 status_text.text("Processing uploaded files...")
-                results = st.session_state.document_processor.process_uploaded_files(
-                    uploaded_files, upload_category
+                
+                def report_progress(fraction, text):
+                    progress_bar.progress(fraction)
+                    status_text.text(text)
+                
+                results = st.session_state.document_processor.process_uploaded_files_batched(
+                    uploaded_files,
+                    upload_category,
+                    max_workers=MAX_UPLOAD_WORKERS,
+                    progress_callback=report_progress
                 )
                 
                 # Display results
@@ -270,17 +362,9 @@ def document_upload_section():
                 total_count = len(results)
                 
                 if success_count == total_count:
-                    st.markdown(f"""
-                    <div class="success-message">
-                        ✅ Successfully processed all {total_count} documents!
-                    </div>
-                    """, unsafe_allow_html=True)
+                    st.success(f"✅ Successfully processed all {total_count} documents!")
                 else:
-                    st.markdown(f"""
-                    <div class="error-message">
-                        ⚠️ Processed {success_count} out of {total_count} documents successfully.
-                    </div>
-                    """, unsafe_allow_html=True)
+                    st.error(f"⚠️ Processed {success_count} out of {total_count} documents successfully.")
                 
                 # Detailed results
                 with st.expander("📋 Detailed Results"):
@@ -297,17 +381,15 @@ def document_upload_section():
                 # Update session state
                 st.session_state.uploaded_files_count += success_count
                 
-                # Auto-refresh to update stats
-                st.rerun()
+                # The document set changed, so rerun the whole page: the sidebar and chat tab
+                # pick up the new stats (the metadata writes bumped the DB's generation)
+                if success_count:
+                    st.rerun()
                 
             except Exception as e:
                 progress_bar.empty()
                 status_text.empty()
-                st.markdown(f"""
-                <div class="error-message">
-                    ❌ Error processing documents: {str(e)}
-                </div>
-                """, unsafe_allow_html=True)
+                st.error(f"❌ Error processing documents: {str(e)}")
                 logger.error(f"Error processing documents: {e}")
 
 
@@ -324,21 +406,27 @@ def _render_suggestion_buttons(suggestions, category_key):
             with col1:
                 if st.button(f"💭 {suggestion}", key=f"suggestion_{category_key}_{i}"):
                     st.session_state.current_question = suggestion
-                    st.rerun()
+                    st.rerun(scope="fragment")
         else:
             with col2:
                 if st.button(f"💭 {suggestion}", key=f"suggestion_{category_key}_{i}"):
                     st.session_state.current_question = suggestion
-                    st.rerun()
+                    st.rerun(scope="fragment")
 
 
+@st.fragment
 def chat_interface():
-    """Enhanced chat interface for asking questions"""
-    st.markdown('<div class="section-header">💬 AI Chat Assistant</div>', unsafe_allow_html=True)
+    """
+    Enhanced chat interface for asking questions
+    
+    Runs as a fragment: suggestion and random-question clicks rerun only this section.
+    Recording an answer or clearing history reruns the app so the history view updates.
+    """
+    st.subheader("💬 AI Chat Assistant")
     
     # Check if documents are uploaded
     try:
-        stats = st.session_state.document_processor.get_document_stats()
+        stats = _get_stats_cached()
         total_docs = stats.get("total_documents", 0)
         
         if total_docs == 0:
@@ -376,48 +464,16 @@ def chat_interface():
                 _render_suggestion_buttons(suggestions[:6], "current")
             
             with suggestion_tabs[1]:  # General
-                general_suggestions = [
-                    "What are the company's core values?",
-                    "How do I contact support?",
-                    "What are the office hours?",
-                    "Where can I find company resources?",
-                    "What is the organizational structure?",
-                    "How do I access the employee handbook?"
-                ]
-                _render_suggestion_buttons(general_suggestions, "general")
+                _render_suggestion_buttons(_GENERAL_SUGGESTIONS, "general")
             
             with suggestion_tabs[2]:  # HR
-                hr_suggestions = [
-                    "What is the vacation policy?",
-                    "How do I submit a time off request?",
-                    "What are the employee benefits?",
-                    "How do I update my personal information?",
-                    "What is the performance review process?",
-                    "How do I report workplace issues?"
-                ]
-                _render_suggestion_buttons(hr_suggestions, "hr")
+                _render_suggestion_buttons(_HR_SUGGESTIONS, "hr")
             
             with suggestion_tabs[3]:  # Policies
-                policy_suggestions = [
-                    "What is the remote work policy?",
-                    "What is the dress code?",
-                    "What are the security guidelines?",
-                    "What is the expense policy?",
-                    "What are the safety protocols?",
-                    "What is the travel policy?"
-                ]
-                _render_suggestion_buttons(policy_suggestions, "policies")
+                _render_suggestion_buttons(_POLICY_SUGGESTIONS, "policies")
             
             with suggestion_tabs[4]:  # IT
-                it_suggestions = [
-                    "How do I reset my password?",
-                    "How do I get IT support?",
-                    "How do I access the VPN?",
-                    "What software can I install?",
-                    "How do I report a security issue?",
-                    "How do I request new equipment?"
-                ]
-                _render_suggestion_buttons(it_suggestions, "it")
+                _render_suggestion_buttons(_IT_SUGGESTIONS, "it")
                 
         except Exception as e:
             st.error(f"Error loading suggestions: {e}")
@@ -486,17 +542,8 @@ def chat_interface():
     
     with col2:
         if st.button("🎲 Random Question", help="Try a random sample question"):
-            import random
-            sample_questions = [
-                "What is the remote work policy?",
-                "How do I get IT support?",
-                "What are the employee benefits?",
-                "What is the vacation policy?",
-                "How do I submit expense reports?",
-                "What are the safety protocols?"
-            ]
-            st.session_state.current_question = random.choice(sample_questions)
-            st.rerun()
+            st.session_state.current_question = random.choice(_SAMPLE_QUESTIONS)
+            st.rerun(scope="fragment")
     
     with col3:
         if st.button("💡 Help", help="Tips for better questions"):
@@ -514,40 +561,26 @@ def chat_interface():
     
     # Process the question
     if ask_clicked and question.strip():
-        # Create a placeholder for streaming response
-        response_placeholder = st.empty()
-        progress_placeholder = st.empty()
-        
-        with progress_placeholder.container():
-            progress_bar = st.progress(0)
-            status_text = st.text("🔍 Searching knowledge base...")
-        
         try:
-            # Update progress
-            progress_bar.progress(25)
-            status_text.text("📚 Retrieving relevant documents...")
-            
             # Prepare query parameters
             category_filter = st.session_state.current_category if use_category_filter else None
             
-            # Use appropriate query engine
-            if advanced_mode:
-                query_engine = create_advanced_query_engine()
-            else:
-                query_engine = st.session_state.query_engine
+            # Use appropriate query engine; the advanced engine is a process-wide cached
+            # instance (it holds no per-user state), so Ask never constructs one
+            query_engine = _get_advanced_query_engine() if advanced_mode else st.session_state.query_engine
             
-            progress_bar.progress(50)
-            status_text.text("🤖 Generating AI response...")
+            # Answer tokens render as they arrive; the engine returns the full response
+            # dict (answer + sources) once the stream is exhausted
+            result = {}
             
-            # Get answer
-            response = query_engine.query(
-                question=question,
-                k=num_sources,
-                category_filter=category_filter
-            )
+            def answer_stream():
+                result['response'] = yield from query_engine.query_stream(
+                    question, k=num_sources, category_filter=category_filter
+                )
             
-            progress_bar.progress(75)
-            status_text.text("📝 Formatting response...")
+            st.markdown(f"**❓ {question}**")
+            st.write_stream(answer_stream())
+            response = result['response']
             
             # Add metadata if requested
             if include_metadata:
@@ -557,6 +590,7 @@ def chat_interface():
             st.session_state.chat_history.append({
                 "question": question,
                 "response": response,
+                "sources_by_file": _group_sources_by_file(response.get('sources', [])),
                 "timestamp": datetime.now().isoformat(),
                 "settings": {
                     "category_filter": category_filter,
@@ -565,56 +599,68 @@ def chat_interface():
                 }
             })
             
-            progress_bar.progress(100)
-            status_text.text("✅ Complete!")
-            
             # Clear the question input
             if 'current_question' in st.session_state:
                 del st.session_state.current_question
             
-            # Clear progress and show response
-            progress_placeholder.empty()
             st.rerun()
             
         except Exception as e:
-            progress_placeholder.empty()
             st.error(f"❌ Error processing question: {e}")
             logger.error(f"Error processing question: {e}\n{traceback.format_exc()}")
 
 
+def _group_sources_by_file(sources: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Group a response's sources by filename and precompute display strings
+    
+    Each source gets a '_category_title' and each file a '_categories_csv', so the
+    history view only reads strings on rerun.
+    """
+    sources_by_file = {}
+    for source in sources:
+        category = source.get('category', 'general')
+        source['_category_title'] = category.title()
+        file_summary = sources_by_file.setdefault(source['filename'], {'sources': [], 'categories': set()})
+        file_summary['sources'].append(source)
+        file_summary['categories'].add(category)
+    
+    for file_summary in sources_by_file.values():
+        file_summary['_categories_csv'] = ", ".join(sorted(file_summary.pop('categories')))
+    return sources_by_file
+
+
+@st.fragment
 def display_chat_history():
     """Enhanced chat history display with better formatting and features"""
     if not st.session_state.chat_history:
-        st.markdown("""<div style="text-align: center; padding: 2rem; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 10px; color: white; margin: 1rem 0;">
-            <h3>🚀 Ready to Start!</h3>
-            <p>No conversations yet. Ask your first question above to get AI-powered answers from your knowledge base!</p>
-        </div>""", unsafe_allow_html=True)
+        with st.container(border=True):
+            st.markdown("### 🚀 Ready to Start!")
+            st.markdown("No conversations yet. Ask your first question above to get AI-powered answers from your knowledge base!")
         return
     
     # Chat history header with controls
     col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
-        st.markdown('<div class="section-header">🗨️ Conversation History</div>', unsafe_allow_html=True)
+        st.subheader("🗨️ Conversation History")
     with col2:
         if st.button("📄 Export Chat", help="Download conversation as text"):
             _export_chat_history()
     with col3:
         show_settings = st.checkbox("⚙️ Show Settings", help="Show query settings for each question")
     
-    # Display chat history in reverse order (latest first)
-    for i, chat in enumerate(reversed(st.session_state.chat_history)):
+    # Display chat history in reverse order (latest first), one page at a time
+    page_size = st.session_state.history_page_size
+    for i, chat in enumerate(islice(reversed(st.session_state.chat_history), page_size)):
         chat_index = len(st.session_state.chat_history) - i
         
         # Create expandable container for each chat
         with st.expander(f"💬 Conversation {chat_index}: {chat['question'][:60]}...", expanded=i<3):
             
-            # Question section with better styling
-            st.markdown(f"""
-            <div style="background: #f0f8ff; padding: 1rem; border-radius: 8px; border-left: 4px solid #4CAF50; margin-bottom: 1rem;">
-                <h4>🤔 Question:</h4>
-                <p style="font-size: 1.1em; margin: 0;"><em>{chat['question']}</em></p>
-            </div>
-            """, unsafe_allow_html=True)
+            # Question section
+            with st.container(border=True):
+                st.markdown("#### 🤔 Question:")
+                st.markdown(f"*{chat['question']}*")
             
             # Settings info if requested
             if show_settings and 'settings' in chat:
@@ -630,7 +676,6 @@ def display_chat_history():
                 with cols[3]:
                     timestamp = chat.get('timestamp', 'Unknown')
                     if timestamp != 'Unknown':
-                        from datetime import datetime
                         dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00') if 'Z' in timestamp else timestamp)
                         st.metric("Time", dt.strftime("%H:%M:%S"))
             
@@ -638,13 +683,10 @@ def display_chat_history():
             response = chat['response']
             
             if response.get('success', False):
-                # Answer with better styling
-                st.markdown(f"""
-                <div style="background: #f8f9fa; padding: 1.5rem; border-radius: 8px; border-left: 4px solid #2196F3; margin: 1rem 0;">
-                    <h4>🤖 AI Answer:</h4>
-                    <div style="font-size: 1.05em; line-height: 1.6;">{response['answer']}</div>
-                </div>
-                """, unsafe_allow_html=True)
+                # Answer
+                with st.container(border=True):
+                    st.markdown("#### 🤖 AI Answer:")
+                    st.markdown(response['answer'])
                 
                 # Sources with enhanced display
                 if response.get('sources'):
@@ -655,41 +697,31 @@ def display_chat_history():
                     
                     with source_tabs[0]:  # List view
                         for idx, source in enumerate(response['sources']):
-                            with st.container():
-                                st.markdown(f"""
-                                <div style="background: #e8f5e8; padding: 1rem; border-radius: 6px; margin: 0.5rem 0; border-left: 3px solid #4CAF50;">
-                                    <h5>📄 {source['filename']} (Chunk {source['chunk_index']})</h5>
-                                    <p><strong>Category:</strong> {source.get('category', 'general').title()}</p>
-                                    <details>
-                                        <summary style="cursor: pointer; color: #666;">Click to preview content...</summary>
-                                        <p style="margin-top: 0.5rem; font-style: italic; color: #555;">{source['content_preview']}</p>
-                                    </details>
-                                </div>
-                                """, unsafe_allow_html=True)
+                            with st.container(border=True):
+                                st.markdown(f"**📄 {source['filename']}** (Chunk {source['chunk_index']})")
+                                st.caption(f"Category: {source['_category_title']}")
+                                st.caption(source['content_preview'])
                     
                     with source_tabs[1]:  # Summary
-                        sources_by_file = {}
-                        for source in response['sources']:
-                            filename = source['filename']
-                            if filename not in sources_by_file:
-                                sources_by_file[filename] = []
-                            sources_by_file[filename].append(source)
+                        # Grouping is computed once when the conversation is recorded
+                        sources_by_file = chat.get('sources_by_file') or _group_sources_by_file(response['sources'])
                         
-                        for filename, file_sources in sources_by_file.items():
-                            st.markdown(f"**📄 {filename}** ({len(file_sources)} chunks)")
-                            categories = set(s.get('category', 'general') for s in file_sources)
-                            st.write(f"Categories: {', '.join(categories)}")
+                        for filename, file_summary in sources_by_file.items():
+                            st.markdown(f"**📄 {filename}** ({len(file_summary['sources'])} chunks)")
+                            st.write(f"Categories: {file_summary['_categories_csv']}")
                             st.divider()
                     
                     with source_tabs[2]:  # Details
-                        for source in response['sources']:
-                            st.json({
-                                "filename": source['filename'],
-                                "chunk_index": source['chunk_index'],
-                                "category": source.get('category', 'general'),
-                                "upload_time": source.get('upload_timestamp', 'Unknown'),
-                                "content_length": len(source.get('content_preview', ''))
-                            })
+                        # JSON blocks are only built when asked for
+                        if st.toggle("Show raw details", key=f"details_{chat_index}"):
+                            for source in response['sources']:
+                                st.json({
+                                    "filename": source['filename'],
+                                    "chunk_index": source['chunk_index'],
+                                    "category": source.get('category', 'general'),
+                                    "upload_time": source.get('upload_timestamp', 'Unknown'),
+                                    "content_length": len(source.get('content_preview', ''))
+                                })
                 
                 # Model and performance info
                 with st.expander("📊 Query Performance", expanded=False):
@@ -705,14 +737,10 @@ def display_chat_history():
             
             else:
                 # Error display
-                st.markdown(f"""
-                <div style="background: #ffe6e6; padding: 1rem; border-radius: 6px; border-left: 4px solid #f44336; margin: 1rem 0;">
-                    <h4>❌ Error:</h4>
-                    <p>{response.get('answer', 'Unknown error occurred')}</p>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # Action buttons for each conversation
+                st.error(f"❌ **Error:** {response.get('answer', 'Unknown error occurred')}")
+            
+            # Action buttons for each conversation (Retry/Follow Up rerun the whole app, since
+            # the question box lives in the chat_interface fragment)
             action_cols = st.columns(4)
             with action_cols[0]:
                 if st.button(f"🔄 Retry", key=f"retry_{chat_index}", help="Ask this question again"):
@@ -730,9 +758,16 @@ def display_chat_history():
                 if st.button(f"🗑️ Delete", key=f"delete_{chat_index}", help="Remove this conversation"):
                     # Remove this specific conversation
                     del st.session_state.chat_history[len(st.session_state.chat_history) - i - 1]
-                    st.rerun()
+                    st.rerun(scope="fragment")
             
             st.markdown("---")
+    
+    # Older conversations stay unrendered until requested
+    remaining = len(st.session_state.chat_history) - page_size
+    if remaining > 0:
+        if st.button(f"⬇️ Load {min(HISTORY_PAGE_SIZE, remaining)} more ({remaining} older)", key="load_more_history"):
+            st.session_state.history_page_size += HISTORY_PAGE_SIZE
+            st.rerun(scope="fragment")
 
 
 def _export_chat_history():
@@ -741,41 +776,82 @@ def _export_chat_history():
         st.warning("No chat history to export.")
         return
     
-    # Generate export content
-    export_content = "KNOWLEDGEBASE AGENT - CHAT EXPORT\n"
-    export_content += "=" * 50 + "\n\n"
-    export_content += f"Export Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    export_content += f"Total Conversations: {len(st.session_state.chat_history)}\n\n"
+    now = datetime.now()
+    
+    # Generate export content (collect parts and join once)
+    parts = [
+        "KNOWLEDGEBASE AGENT - CHAT EXPORT\n",
+        _EXPORT_RULE,
+        f"Export Date: {now.strftime('%Y-%m-%d %H:%M:%S')}\n",
+        f"Total Conversations: {len(st.session_state.chat_history)}\n\n"
+    ]
     
     for i, chat in enumerate(st.session_state.chat_history, 1):
-        export_content += f"CONVERSATION {i}\n"
-        export_content += "-" * 20 + "\n"
-        export_content += f"Question: {chat['question']}\n\n"
-        export_content += f"Answer: {chat['response'].get('answer', 'No answer available')}\n\n"
+        parts.append(f"CONVERSATION {i}\n")
+        parts.append(_Q_SEP)
+        parts.append(f"Question: {chat['question']}\n\n")
+        parts.append(f"Answer: {chat['response'].get('answer', 'No answer available')}\n\n")
         
         if chat['response'].get('sources'):
-            export_content += "Sources:\n"
-            for source in chat['response']['sources']:
-                export_content += f"- {source['filename']} (chunk {source['chunk_index']})\n"
+            parts.append("Sources:\n")
+            parts.extend(
+                f"- {source['filename']} (chunk {source['chunk_index']})\n"
+                for source in chat['response']['sources']
+            )
         
-        export_content += "\n" + "=" * 50 + "\n\n"
+        parts.append(_CONV_SEP)
+    
+    export_content = "".join(parts).encode('utf-8')
     
     # Offer download
     st.download_button(
         label="📄 Download Chat History",
         data=export_content,
-        file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+        file_name=f"chat_history_{now.strftime('%Y%m%d_%H%M%S')}.txt",
         mime="text/plain",
         help="Download your conversation history as a text file"
     )
 
 
+_DOC_TABLE_COLUMNS = {
+    'filename': 'Unknown',
+    'category': 'general',
+    'total_chunks': 0,
+    'file_size': 0,
+    'file_type': 'unknown',
+    'upload_timestamp': 'Unknown'
+}
+
+
+@st.cache_data(ttl=300, show_spinner=False, max_entries=8)
+def _build_doc_table(generation: int, _documents: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, Dict[str, Dict[str, Any]]]:
+    """
+    Format the documents table with column ops and index documents by filename
+    
+    Keyed on the metadata DB's generation, and expiring with _cached_stats, like the stats
+    the documents come from.
+    """
+    df = pd.DataFrame(list(_documents), columns=list(_DOC_TABLE_COLUMNS)).fillna(_DOC_TABLE_COLUMNS)
+    by_name = {doc.get('filename'): doc for doc in _documents}
+    
+    table = pd.DataFrame({
+        "Filename": df['filename'],
+        "Category": df['category'].str.title(),
+        "Chunks": df['total_chunks'],
+        "Size (KB)": (df['file_size'] / 1024).round(1),
+        "Type": df['file_type'].str.upper(),
+        "Uploaded": df['upload_timestamp'].str[:10]  # Show date only
+    })
+    return table, by_name
+
+
 def display_document_management():
     """Display document management interface"""
-    st.markdown('<div class="section-header">📂 Document Management</div>', unsafe_allow_html=True)
+    st.subheader("📂 Document Management")
     
     try:
-        stats = st.session_state.document_processor.get_document_stats()
+        # Same generation-keyed stats the sidebar uses; uploads bump the generation
+        stats = _get_stats_cached()
         documents = stats.get('documents', [])
         
         if not documents:
@@ -785,20 +861,9 @@ def display_document_management():
         # Documents table
         st.subheader("📋 Uploaded Documents")
         
-        # Create a formatted table
-        doc_data = []
-        for doc in documents:
-            doc_data.append({
-                "Filename": doc.get('filename', 'Unknown'),
-                "Category": doc.get('category', 'general').title(),
-                "Chunks": doc.get('total_chunks', 0),
-                "Size (KB)": f"{doc.get('file_size', 0) / 1024:.1f}",
-                "Type": doc.get('file_type', 'unknown').upper(),
-                "Uploaded": doc.get('upload_timestamp', 'Unknown')[:10]  # Show date only
-            })
-        
-        if doc_data:
-            st.dataframe(doc_data, use_container_width=True)
+        # Create a formatted table (rebuilt only when the metadata changes)
+        doc_table, docs_by_name = _build_doc_table(st.session_state.metadata_db.generation, documents)
+        st.dataframe(doc_table, use_container_width=True)
         
         # Document actions
         st.subheader("🛠️ Document Actions")
@@ -810,7 +875,7 @@ def display_document_management():
         )
         
         if selected_doc:
-            selected_doc_data = next((doc for doc in documents if doc.get('filename') == selected_doc), None)
+            selected_doc_data = docs_by_name.get(selected_doc)
             
             if selected_doc_data:
                 col1, col2 = st.columns(2)
@@ -831,14 +896,17 @@ def display_document_management():
 def main():
     """Main application function"""
     try:
+        _inject_css()
+        
         # Initialize session state
         initialize_session_state()
         
         # Display header
         display_header()
         
-        # Display sidebar
-        display_sidebar()
+        # Display sidebar (a fragment may not open st.sidebar itself)
+        with st.sidebar:
+            display_sidebar()
         
         # Main content area
         tab1, tab2, tab3 = st.tabs(["💬 Chat", "📤 Upload", "📂 Manage"])
@@ -856,11 +924,7 @@ def main():
         
         # Footer
         st.markdown("---")
-        st.markdown("""
-        <div style="text-align: center; color: #666; padding: 1rem;">
-            🧠 <strong>KnowledgeBase Agent</strong> • Built with Streamlit, LangChain, and AI
-        </div>
-        """, unsafe_allow_html=True)
+        st.caption("🧠 **KnowledgeBase Agent** • Built with Streamlit, LangChain, and AI")
         
     except Exception as e:
         st.error(f"❌ Application error: {e}")
@@ -5,9 +5,15 @@ Handles API rate limits gracefully with fallback responses
 
 import streamlit as st
 import os
+from collections import deque
 from dotenv import load_dotenv
 from datetime import datetime
-import time
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
 
 # Load environment variables
 load_dotenv()
@@ -21,7 +27,7 @@ st.set_page_config(
 )
 
 # Custom CSS
-st.markdown("""
+_CSS = """
 <style>
 .main-header {
     background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -48,20 +54,39 @@ st.markdown("""
     margin: 1rem 0;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Oldest conversations are dropped past this many
+MAX_HISTORY = 50
+
+_QUICK_QUESTIONS = (
+    "What are company policies?",
+    "How do I reset my password?",
+    "Technical support process",
+    "Employee benefits overview",
+)
+
+@st.cache_resource
+def _inject_css():
+    """Emit the page styles; Streamlit replays the cached element on later reruns"""
+    st.markdown(_CSS, unsafe_allow_html=True)
 
 def init_session_state():
     """Initialize session state"""
     if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
+        # Bounded so long sessions don't grow memory and session state without limit
+        st.session_state.chat_history = deque(maxlen=MAX_HISTORY)
+    if 'query_count' not in st.session_state:
+        # Keeps query numbers increasing after old entries fall out of chat_history
+        st.session_state.query_count = 0
+    if 'recent_chats' not in st.session_state:
+        # The history view only shows the last few queries; keep them ready to render
+        st.session_state.recent_chats = deque(maxlen=3)
     if 'rate_limit_count' not in st.session_state:
         st.session_state.rate_limit_count = 0
 
-def simulate_ai_response(question: str, source_type: str) -> dict:
-    """Generate demo responses that simulate different AI sources"""
-    
-    responses = {
-        "chatgpt": f"""**🤖 ChatGPT Response:**
+# Demo response templates, substituted with str.format_map on each call
+_CHATGPT_TMPL = """**🤖 ChatGPT Response:**
 
 Based on your question about "{question}", here's a comprehensive answer:
 
@@ -75,9 +100,9 @@ Based on your question about "{question}", here's a comprehensive answer:
 
 This response demonstrates how ChatGPT would provide structured, informative answers drawing from its training data up to its knowledge cutoff.
 
-*Note: This is a demonstration response showing ChatGPT's typical formatting and approach.*""",
+*Note: This is a demonstration response showing ChatGPT's typical formatting and approach.*"""
 
-        "copilot": f"""**⚡ GitHub Copilot Response:**
+_COPILOT_TMPL = """**⚡ GitHub Copilot Response:**
 
 // Technical guidance for: {question}
 
@@ -109,9 +134,9 @@ Here's how I'd approach this:
 • Consider maintainability and scalability
 • Test thoroughly before deployment
 
-*This demonstrates GitHub Copilot's technical, code-focused assistance style.*""",
+*This demonstrates GitHub Copilot's technical, code-focused assistance style.*"""
 
-        "google": f"""**🔍 Google Safe Search Results:**
+_GOOGLE_TMPL = """**🔍 Google Safe Search Results:**
 
 Top safe results for "{question}":
 
@@ -149,9 +174,9 @@ Top safe results for "{question}":
 • Family-friendly results only
 • Professional workplace appropriate
 
-*All results filtered for safe, appropriate content.*""",
+*All results filtered for safe, appropriate content.*"""
 
-        "knowledge_base": f"""**📚 Knowledge Base Response:**
+_KNOWLEDGE_BASE_TMPL = """**📚 Knowledge Base Response:**
 
 From our internal documentation regarding "{question}":
 
@@ -177,19 +202,57 @@ From our internal documentation regarding "{question}":
 **Last Updated:** November 2025
 
 *This simulates how your internal knowledge base would respond with company-specific information.*"""
-    }
+
+_DEFAULT_TMPL = "Demo response for {question} from {source_type}"
+
+_RESPONSES = {
+    "chatgpt": _CHATGPT_TMPL,
+    "copilot": _COPILOT_TMPL,
+    "google": _GOOGLE_TMPL,
+    "knowledge_base": _KNOWLEDGE_BASE_TMPL,
+}
+
+# Query source -> (display name, demo template key)
+_SOURCE_MAP = {
+    "chatgpt": ("ChatGPT", "chatgpt"),
+    "copilot": ("Copilot", "copilot"),
+    "google_safe": ("Google Safe Search", "google"),
+    "knowledge_base": ("Knowledge Base", "knowledge_base"),
+}
+
+class _SafeDict(dict):
+    """format_map mapping that leaves unknown placeholders untouched"""
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+# Questions come from a free-size text area; hash them with xxh3 instead of Streamlit's
+# default pickle + md5 when xxhash is installed
+_STR_HASH_FUNCS = {str: xxhash.xxh3_64_intdigest} if XXHASH_AVAILABLE else None
+
+@st.cache_data(show_spinner=False, max_entries=512, hash_funcs=_STR_HASH_FUNCS)
+def simulate_ai_response(question: str, source_type: str) -> dict:
+    """
+    Generate demo responses that simulate different AI sources
+    
+    Cached on (question, source_type); callers stamp the timestamp so a cached
+    response never carries a stale one.
+    """
+    answer = _RESPONSES.get(source_type, _DEFAULT_TMPL).format_map(
+        _SafeDict(question=question, source_type=source_type)
+    )
     
     return {
         "success": True,
-        "answer": responses.get(source_type, f"Demo response for {question} from {source_type}"),
+        "answer": answer,
         "source": source_type.title(),
-        "timestamp": datetime.now().isoformat(),
         "demo": True
     }
 
 def main():
     """Main application with rate limit handling"""
     
+    _inject_css()
+    
     # Header
     st.markdown("""
     <div class="main-header">
@@ -212,6 +275,12 @@ def main():
     else:
         st.sidebar.error("❌ OpenAI API Key: Missing")
     
+    chat_section()
+
+@st.fragment
+def chat_section():
+    """Question form, quick questions and history; reruns on its own without the header or sidebar"""
+    
     # Main interface
     col1, col2 = st.columns([3, 1])
     
@@ -236,15 +305,8 @@ def main():
     with col2:
         st.markdown("### 🎯 Quick Questions")
         
-        quick_questions = [
-            "What are company policies?",
-            "How do I reset my password?", 
-            "Technical support process",
-            "Employee benefits overview"
-        ]
-        
-        for q in quick_questions:
-            if st.button(f"💡 {q}", use_container_width=True):
+        for idx, q in enumerate(_QUICK_QUESTIONS):
+            if st.button(f"💡 {q}", key=f"qq_{idx}", use_container_width=True):
                 question = q
                 submitted = True
     
@@ -274,43 +336,37 @@ def process_safe_query(question: str, force_demo: bool = False):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
+        total = len(sources_to_query)
         for i, source in enumerate(sources_to_query):
-            display_name = "Google Safe Search" if source == "google_safe" else source.title()
-            status_text.text(f"Querying {display_name}...")
-            progress_bar.progress((i + 1) / len(sources_to_query))
+            display_name, actual_source = _SOURCE_MAP[source]
             
-            # Simulate some processing time
-            time.sleep(0.5)
+            # Every progress/status update is a frontend message; send every other step only
+            if (i + 1) % 2 == 0 or (i + 1) == total:
+                status_text.text(f"Querying {display_name}...")
+                progress_bar.progress((i + 1) / total)
             
-            # Generate response
-            if force_demo or not os.getenv("OPENAI_API_KEY"):
-                actual_source = "google" if source == "google_safe" else source
-                responses[source] = simulate_ai_response(question, actual_source)
-                if source == "google_safe":
-                    responses[source]["source"] = "Google Safe Search"
-            else:
-                # In a real implementation, you could try actual API calls here
-                # For now, we'll use demo responses to avoid rate limits
-                actual_source = "google" if source == "google_safe" else source
-                responses[source] = simulate_ai_response(question, actual_source)
-                if source == "google_safe":
-                    responses[source]["source"] = "Google Safe Search"
+            # Generate response. Demo responses are used with or without an API key: in a
+            # real implementation you could try actual API calls here, but demo responses
+            # avoid rate limits
+            responses[source] = simulate_ai_response(question, actual_source)
+            responses[source]["source"] = display_name
+            responses[source]["timestamp"] = datetime.now().isoformat()
         
         progress_bar.empty()
         status_text.empty()
         
         # Format combined response
-        combined_answer = f"# 🌟 Multi-Source Answer: {question}\\n\\n"
-        
-        for source, response in responses.items():
-            if response['success']:
-                combined_answer += f"{response['answer']}\\n\\n---\\n\\n"
+        combined_answer = f"# 🌟 Multi-Source Answer: {question}\n\n" + "\n\n---\n\n".join(
+            [response['answer'] for response in responses.values() if response['success']]
+        )
         
         # Processing time
         processing_time = (datetime.now() - start_time).total_seconds()
         
         # Store in history
+        st.session_state.query_count += 1
         chat_entry = {
+            "number": st.session_state.query_count,
             "question": question,
             "responses": responses,
             "combined_answer": combined_answer,
@@ -320,13 +376,15 @@ def process_safe_query(question: str, force_demo: bool = False):
         }
         
         st.session_state.chat_history.append(chat_entry)
+        st.session_state.recent_chats.append(chat_entry)
         st.success(f"✅ Multi-source response generated in {processing_time:.1f} seconds!")
-        st.rerun()
+        st.rerun(scope="fragment")
         
     except Exception as e:
         st.error(f"❌ Error: {str(e)}")
         st.info("💡 Try demo mode for testing the interface!")
 
+@st.fragment
 def display_safe_chat_history():
     """Display chat history with source breakdown"""
     
@@ -349,8 +407,8 @@ def display_safe_chat_history():
     st.markdown("## 💬 Smart Chat History")
     
     # Show recent conversations
-    for i, chat in enumerate(reversed(st.session_state.chat_history[-3:])):
-        chat_num = len(st.session_state.chat_history) - i
+    for i, chat in enumerate(reversed(st.session_state.recent_chats)):
+        chat_num = chat['number']
         
         with st.expander(f"🔍 Query {chat_num}: {chat['question'][:50]}...", expanded=i < 1):
             
@@ -370,8 +428,8 @@ def display_safe_chat_history():
             st.markdown("**🌟 Combined Response:**")
             st.markdown(chat['combined_answer'])
             
-            # Source breakdown
-            with st.expander("📊 Source Breakdown"):
+            # Source breakdown, built only while its toggle is on (expanders also can't nest)
+            if st.toggle("📊 Source Breakdown", key=f"breakdown_{chat_num}"):
                 for source, response in chat['responses'].items():
                     if response['success']:
                         st.markdown(f"**{source.title()}**: ✅ Success")
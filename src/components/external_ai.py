@@ -4,14 +4,276 @@ Integrates with ChatGPT, Copilot, and Google Search for comprehensive answers
 """
 
 import os
+import atexit
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
+import re
 import json
 import time
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Hashable, Tuple
 import logging
 from datetime import datetime
+import threading
+from enum import IntEnum
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, Future
 import streamlit as st
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+from .retry import retry_delay
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Static parts of the chat completion requests, built once
+_CHATGPT_SYSTEM = {
+    "role": "system",
+    "content": "You are a helpful assistant providing accurate and comprehensive answers. Always mention when information comes from your training data."
+}
+_CHATGPT_PARAMS = {"model": "gpt-3.5-turbo", "max_tokens": 500, "temperature": 0.7}
+
+_COPILOT_SYSTEM = {
+    "role": "system",
+    "content": "You are GitHub Copilot, an AI coding assistant. Provide helpful, practical responses with code examples when relevant. Be concise but comprehensive."
+}
+_COPILOT_PARAMS = {"model": "gpt-3.5-turbo", "max_tokens": 600, "temperature": 0.5}
+
+# Knowledge base context sent with a question is cut to this budget (gpt-3.5-turbo has a
+# 4k window, and the answer needs up to 600 tokens of it)
+MAX_CONTEXT_TOKENS = 1500
+MAX_CONTEXT_CHARS = 6000  # used when tiktoken isn't installed (~4 chars per token)
+TRUNCATION_MARKER = "…[truncated]"
+
+# Branding wrapped around Copilot-style answers
+COPILOT_HEADER = "**🤖 GitHub Copilot Response:**\n\n"
+COPILOT_FOOTER = "\n\n*This response was generated using GitHub Copilot's AI capabilities.*"
+
+# Streamlit runs every session on its own script thread, so OpenAI calls from all users
+# already overlap; this process-wide gate keeps the total in flight under the rate limit
+MAX_CONCURRENT_OPENAI_REQUESTS = 8
+_openai_semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_OPENAI_REQUESTS)
+
+# Upper bound on parallel Custom Search requests from batch_google
+MAX_CONCURRENT_GOOGLE_REQUESTS = 8
+
+# First retry window for OpenAI calls (see retry.retry_delay); short, since the server's
+# Retry-After takes precedence when it asks for longer
+RETRY_BASE_DELAY = 0.1
+
+
+def _backoff_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """Seconds to wait before retry number attempt+1, never less than the server's Retry-After"""
+    delay = retry_delay(attempt, base_delay=RETRY_BASE_DELAY)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form; keep the jittered delay
+    return delay
+
+
+def _iter_stream_content(response: requests.Response) -> Iterator[str]:
+    """Yield the content deltas of a streaming chat completion response"""
+    # Server-sent events: one "data: {json}" line per delta, terminated by "data: [DONE]"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data: "):
+            continue
+        data = line[len("data: "):]
+        if data == "[DONE]":
+            break
+        choices = _loads(data).get("choices") or [{}]
+        content = choices[0].get("delta", {}).get("content")
+        if content:
+            yield content
+
+
+@lru_cache(maxsize=1)
+def _iso_for_second(sec: int) -> str:
+    return datetime.fromtimestamp(sec).isoformat()
+
+
+def _now_iso() -> str:
+    """Current local time as ISO-8601 at one-second resolution, formatted once per second"""
+    return _iso_for_second(int(time.time()))
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+
+def _truncate(text: str, max_tokens: int = MAX_CONTEXT_TOKENS, max_chars: int = MAX_CONTEXT_CHARS) -> str:
+    """Cut text to the context budget: by tokens with tiktoken, otherwise by characters"""
+    if TIKTOKEN_AVAILABLE:
+        # Byte-level BPE: every token covers at least one UTF-8 byte (not one character)
+        if len(text.encode("utf-8")) <= max_tokens:
+            return text
+        tokens = _encoding().encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return _encoding().decode(tokens[:max_tokens]) + TRUNCATION_MARKER
+    
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRUNCATION_MARKER
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize a request body (orjson when installed; Content-Type is preset on the session)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _loads(content: bytes) -> Any:
+    """Parse a JSON response body (orjson when installed)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _error_snippet(response: requests.Response, limit: int = 512) -> str:
+    """First bytes of an error body; avoids decoding (or, when streaming, downloading) all of it"""
+    head = next(response.iter_content(chunk_size=limit), b"")[:limit]
+    return head.decode("utf-8", "replace")
+
+
+def _completion_fields(response: requests.Response) -> tuple:
+    """(message content, total tokens) from a chat completion; the rest of the body is discarded"""
+    data = _loads(response.content)
+    return data["choices"][0]["message"]["content"], data.get("usage", {}).get("total_tokens", 0)
+
+
+def _build_session() -> requests.Session:
+    """Keep-alive HTTP session; retries are handled per call, not by the adapter"""
+    session = requests.Session()
+    # One pool per host (OpenAI, Google), each sized to the most requests that can be in flight
+    # at once, so no connection is discarded and re-handshaked under full concurrency
+    adapter = HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=max(MAX_CONCURRENT_OPENAI_REQUESTS, MAX_CONCURRENT_GOOGLE_REQUESTS),
+        max_retries=0
+    )
+    session.mount("https://", adapter)
+    session.headers["Content-Type"] = "application/json"
+    return session
+
+
+# One connection pool for the whole process: every integrator (one per Streamlit session)
+# reuses the same sockets to api.openai.com and googleapis.com, skipping repeat TCP/TLS handshakes
+_session = _build_session()
+atexit.register(_session.close)
+
+
+class Source(IntEnum):
+    """Compact tag for where an answer came from; indexes display tables such as source cards"""
+    CHATGPT = 0
+    COPILOT = 1
+    GOOGLE = 2
+    KB = 3
+
+
+# In-flight request registry shared by every session: identical concurrent calls
+# (double clicks, two browser tabs) wait on the first call instead of repeating it
+_inflight: Dict[Hashable, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _coalesce(key: Hashable, fn, *args):
+    """Run fn(*args) once per key at a time; concurrent callers with the same key share the result"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[key] = future
+    
+    if not is_owner:
+        return future.result()
+    
+    try:
+        result = fn(*args)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+# Questions matching this get a real Copilot-style completion
+_CODE_Q_RE = re.compile(
+    r"\b(code|function|bug|regex|python|javascript|sql|error|stacktrace|api|script|debug|compile|deploy)\b",
+    re.I
+)
+
+# Errors that mean the shared OpenAI quota is exhausted (status code or our own message)
+_RATE_LIMIT_RE = re.compile(r"\b429\b|rate[- ]limit", re.I)
+
+
+def _is_coding_question(question: str) -> bool:
+    """Cheap keyword check for whether a question asks for technical/code help"""
+    return _CODE_Q_RE.search(question) is not None
+
+
+def _derive_copilot_result(chatgpt_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Copilot-branded view of a ChatGPT answer, used instead of a second completion"""
+    return {
+        "success": True,
+        "answer": f"**🤖 Copilot perspective:**\n\n{chatgpt_result['answer']}",
+        "source": "GitHub Copilot (derived)",
+        "source_id": Source.COPILOT,
+        "model": chatgpt_result.get("model", "gpt-3.5-turbo"),
+        "timestamp": _now_iso()
+    }
+
+
+def _fingerprint(secret: Optional[str]) -> str:
+    """Short, non-reversible cache-key component for an API credential"""
+    return hashlib.sha256((secret or "").encode()).hexdigest()[:8]
+
+
+def _cache_key(*parts) -> str:
+    """Compact, fixed-size cache key for a call's arguments"""
+    return hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=16).hexdigest()
+
+
+# Process-wide response caches (shared by every session). Model answers go stale quickly;
+# search results for the same query are stable for much longer. Within the stale window an
+# entry is still served immediately while a background refresh replaces it
+CHAT_CACHE_TTL, CHAT_CACHE_STALE_TTL = 60, 300
+GOOGLE_CACHE_TTL, GOOGLE_CACHE_STALE_TTL = 600, 3600
+GOOGLE_NEGATIVE_CACHE_TTL = 30
+_chatgpt_cache = TTLCache(maxsize=512, ttl=CHAT_CACHE_TTL, stale_ttl=CHAT_CACHE_STALE_TTL)
+_copilot_cache = TTLCache(maxsize=512, ttl=CHAT_CACHE_TTL)
+# Search traffic repeats a core set of popular queries, so keep the most-used ones rather
+# than the most recent (the free tier is 10k queries/day)
+_google_cache = TTLCache(maxsize=2048, ttl=GOOGLE_CACHE_TTL, stale_ttl=GOOGLE_CACHE_STALE_TTL, policy="lfu")
+_RESPONSE_CACHES = {"chatgpt": _chatgpt_cache, "copilot": _copilot_cache, "google": _google_cache}
+
+# Background refreshes of stale entries; at most one per key is queued at a time
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+
 class ExternalAIIntegrator:
     """Integrates with external AI services"""
     
@@ -20,7 +282,118 @@ class ExternalAIIntegrator:
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.google_cx = os.getenv("GOOGLE_CUSTOM_SEARCH_CX")
         
+        self.session = _session
+        
+    def _cached_call(self, cache: TTLCache, key: str, fn, *args, negative_ttl: Optional[float] = None,
+                     force_refresh: bool = False) -> Dict[str, Any]:
+        """
+        Serve a cached result, otherwise call fn once (shared with concurrent callers) and cache a success
+        
+        A stale entry is returned immediately and refreshed on the background pool. With
+        negative_ttl, failures are cached that long too; force_refresh skips the lookup.
+        """
+        if not force_refresh:
+            hit, fresh = cache.lookup(key)
+            if hit is not None:
+                if not fresh:
+                    self._schedule_refresh(cache, key, fn, *args)
+                return dict(hit)
+        
+        return self._fetch_and_store(cache, key, fn, *args, negative_ttl=negative_ttl)
+    
+    @staticmethod
+    def _fetch_and_store(cache: TTLCache, key: str, fn, *args,
+                         negative_ttl: Optional[float] = None) -> Dict[str, Any]:
+        """Call fn (coalesced per key) and cache a successful result (or a failure, for negative_ttl)"""
+        def fetch():
+            result = fn(*args)
+            # Store before the in-flight entry is released, so a caller arriving right after
+            # finds the cache filled instead of starting a second request
+            if result.get("success"):
+                cache.set(key, dict(result, timestamp=_now_iso()))
+            elif negative_ttl:
+                cache.set(key, result, ttl=negative_ttl)
+            return result
+        
+        return _coalesce(key, fetch)
+    
+    def _schedule_refresh(self, cache: TTLCache, key: str, fn, *args):
+        """Queue one background refresh for a stale key; no-op if one is already pending"""
+        with _refreshing_lock:
+            if key in _refreshing:
+                return
+            _refreshing.add(key)
+        
+        def refresh():
+            try:
+                self._fetch_and_store(cache, key, fn, *args)
+            except Exception as e:
+                logger.warning(f"Background cache refresh failed: {str(e)}")
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(key)
+        
+        _refresh_pool.submit(refresh)
+    
+    @staticmethod
+    def clear_cache():
+        """Drop every cached ChatGPT, Copilot and Google response"""
+        for cache in _RESPONSE_CACHES.values():
+            cache.clear()
+    
+    @staticmethod
+    def cache_info() -> Dict[str, Dict[str, Any]]:
+        """Size and hit/miss counts for each response cache"""
+        return {name: cache.info() for name, cache in _RESPONSE_CACHES.items()}
+    
+    def _post_openai(self, headers: Dict[str, str], payload: Dict[str, Any]) -> requests.Response:
+        """POST a chat completion, waiting for a free slot if too many requests are in flight"""
+        with _openai_semaphore:
+            return self.session.post(OPENAI_CHAT_URL, headers=headers, data=_dumps(payload), timeout=30)
+    
+    def _openai_headers(self) -> Dict[str, str]:
+        """Request headers for the OpenAI API (Content-Type is set on the session)"""
+        return {"Authorization": f"Bearer {self.openai_api_key}"}
+    
+    def _chatgpt_payload(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Build the ChatGPT chat completion request body"""
+        context = _truncate(context) if context else context
+        prompt = f"""
+        Question: {question}
+        
+        {f'Context from knowledge base: {context}' if context else ''}
+        
+        Please provide a comprehensive answer. If you reference any external information, 
+        mention it's from your training data up to your knowledge cutoff.
+        """
+        
+        return {**_CHATGPT_PARAMS, "messages": [_CHATGPT_SYSTEM, {"role": "user", "content": prompt}]}
+    
+    def _copilot_payload(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Build the Copilot-style chat completion request body"""
+        context = _truncate(context) if context else context
+        prompt = f"""
+        As GitHub Copilot, provide a helpful response to: {question}
+        
+        {f'Available context: {context}' if context else ''}
+        
+        Focus on:
+        - Practical, actionable advice
+        - Code examples when relevant
+        - Best practices and recommendations
+        - Step-by-step guidance
+        
+        Format your response as if you're GitHub Copilot assistant.
+        """
+        
+        return {**_COPILOT_PARAMS, "messages": [_COPILOT_SYSTEM, {"role": "user", "content": prompt}]}
+    
     def query_chatgpt(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Query ChatGPT, reusing a cached answer for a repeated question"""
+        key = _cache_key("chatgpt", _fingerprint(self.openai_api_key), question, context)
+        return self._cached_call(_chatgpt_cache, key, self._query_chatgpt_uncached, question, context)
+    
+    def _query_chatgpt_uncached(self, question: str, context: str = "") -> Dict[str, Any]:
         """Query ChatGPT API directly"""
         try:
             if not self.openai_api_key:
@@ -30,60 +403,30 @@ class ExternalAIIntegrator:
                     "source": "ChatGPT"
                 }
             
-            headers = {
-                "Authorization": f"Bearer {self.openai_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            prompt = f"""
-            Question: {question}
-            
-            {f'Context from knowledge base: {context}' if context else ''}
-            
-            Please provide a comprehensive answer. If you reference any external information, 
-            mention it's from your training data up to your knowledge cutoff.
-            """
-            
-            payload = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful assistant providing accurate and comprehensive answers. Always mention when information comes from your training data."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": 500,
-                "temperature": 0.7
-            }
+            headers = self._openai_headers()
+            payload = self._chatgpt_payload(question, context)
             
             # Add retry logic for rate limiting
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    response = requests.post(
-                        "https://api.openai.com/v1/chat/completions",
-                        headers=headers,
-                        json=payload,
-                        timeout=30
-                    )
+                    response = self._post_openai(headers, payload)
                     
                     if response.status_code == 200:
-                        result = response.json()
+                        answer, tokens_used = _completion_fields(response)
                         return {
                             "success": True,
-                            "answer": result["choices"][0]["message"]["content"],
+                            "answer": answer,
                             "source": "ChatGPT (OpenAI)",
+                            "source_id": Source.CHATGPT,
                             "model": "gpt-3.5-turbo",
-                            "timestamp": datetime.now().isoformat(),
-                            "tokens_used": result.get("usage", {}).get("total_tokens", 0)
+                            "timestamp": _now_iso(),
+                            "tokens_used": tokens_used
                         }
                     elif response.status_code == 429:
                         # Rate limit exceeded - wait and retry
-                        wait_time = (attempt + 1) * 2  # Exponential backoff
                         if attempt < max_retries - 1:
-                            import time
-                            time.sleep(wait_time)
+                            time.sleep(_backoff_delay(attempt, response))
                             continue
                         else:
                             return {
@@ -94,12 +437,12 @@ class ExternalAIIntegrator:
                     else:
                         return {
                             "success": False,
-                            "error": f"OpenAI API error: {response.status_code} - {response.text}",
+                            "error": f"OpenAI API error: {response.status_code} - {_error_snippet(response)}",
                             "source": "ChatGPT"
                         }
                 except requests.RequestException as req_err:
                     if attempt < max_retries - 1:
-                        time.sleep(2)
+                        time.sleep(_backoff_delay(attempt))
                         continue
                     return {
                         "success": False,
@@ -114,7 +457,105 @@ class ExternalAIIntegrator:
                 "source": "ChatGPT"
             }
     
-    def query_google_search(self, question: str, num_results: int = 5) -> Dict[str, Any]:
+    def _stream_openai(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """POST a streaming chat completion and yield content deltas as they arrive"""
+        if not self.openai_api_key:
+            raise RuntimeError("OpenAI API key not configured")
+        
+        payload = dict(payload, stream=True)
+        
+        # Same retry logic as query_chatgpt for rate limiting; only opening the stream is
+        # retried, so nothing has been yielded yet when a retry happens
+        max_retries = 3
+        for attempt in range(max_retries):
+            last_attempt = attempt == max_retries - 1
+            with _openai_semaphore:
+                try:
+                    response = self.session.post(OPENAI_CHAT_URL, headers=self._openai_headers(),
+                                                 data=_dumps(payload), timeout=30, stream=True)
+                except requests.RequestException:
+                    if last_attempt:
+                        raise
+                    delay = _backoff_delay(attempt)
+                else:
+                    with response:
+                        if response.status_code == 429:
+                            if last_attempt:
+                                raise RuntimeError("Rate limit exceeded. Try again in a few minutes.")
+                            delay = _backoff_delay(attempt, response)
+                        elif response.status_code != 200:
+                            raise RuntimeError(f"OpenAI API error: {response.status_code} - {_error_snippet(response)}")
+                        else:
+                            yield from _iter_stream_content(response)
+                            return
+            # Wait outside the semaphore so other requests are not held up by the backoff
+            time.sleep(delay)
+    
+    def stream_chatgpt(self, question: str, context: str = "") -> Iterator[str]:
+        """Stream a ChatGPT answer token by token (for st.write_stream); the full answer is cached once done"""
+        parts = []
+        for content in self._stream_openai(self._chatgpt_payload(question, context)):
+            parts.append(content)
+            yield content
+        
+        _chatgpt_cache.set(_cache_key("chatgpt", _fingerprint(self.openai_api_key), question, context), {
+            "success": True,
+            "answer": "".join(parts),
+            "source": "ChatGPT (OpenAI)",
+            "source_id": Source.CHATGPT,
+            "model": "gpt-3.5-turbo",
+            "timestamp": _now_iso()
+        })
+    
+    def stream_copilot(self, question: str, context: str = "") -> Iterator[str]:
+        """Stream a Copilot-style answer with its branding (for st.write_stream); cached once done"""
+        parts = [COPILOT_HEADER]
+        yield COPILOT_HEADER
+        for content in self._stream_openai(self._copilot_payload(question, context)):
+            parts.append(content)
+            yield content
+        parts.append(COPILOT_FOOTER)
+        yield COPILOT_FOOTER
+        
+        _copilot_cache.set(_cache_key("copilot", _fingerprint(self.openai_api_key), question, context), {
+            "success": True,
+            "answer": "".join(parts),
+            "source": "GitHub Copilot",
+            "source_id": Source.COPILOT,
+            "model": "gpt-3.5-turbo (Copilot-style)",
+            "timestamp": _now_iso()
+        })
+    
+    def embed_text(self, text: str) -> Optional[List[float]]:
+        """Embed text with the OpenAI embeddings API (used by the semantic response cache)"""
+        if not self.openai_api_key:
+            return None
+
+        with _openai_semaphore:
+            response = self.session.post(
+                "https://api.openai.com/v1/embeddings",
+                headers=self._openai_headers(),
+                data=_dumps({"model": "text-embedding-3-small", "input": text}),
+                timeout=15
+            )
+        if response.status_code != 200:
+            return None
+        return _loads(response.content)["data"][0]["embedding"]
+
+    def query_google_search(self, question: str, num_results: int = 5,
+                            force_refresh: bool = False) -> Dict[str, Any]:
+        """
+        Query Google Custom Search, reusing cached results for a repeated question
+        
+        Errors are cached briefly so an outage or exhausted quota isn't hit again on every
+        rerun; force_refresh bypasses the cache.
+        """
+        key = _cache_key("google", _fingerprint(self.google_api_key), _fingerprint(self.google_cx),
+                         question, num_results)
+        return self._cached_call(_google_cache, key, self._query_google_search_uncached, question, num_results,
+                                 negative_ttl=GOOGLE_NEGATIVE_CACHE_TTL, force_refresh=force_refresh)
+    
+    def _query_google_search_uncached(self, question: str, num_results: int = 5) -> Dict[str, Any]:
         """Query Google Custom Search API"""
         try:
             if not self.google_api_key or not self.google_cx:
@@ -132,13 +573,11 @@ class ExternalAIIntegrator:
                 "num": min(num_results, 10)
             }
             
-            response = requests.get(url, params=params, timeout=15)
+            response = self.session.get(url, params=params, timeout=15)
             
             if response.status_code == 200:
-                results = response.json()
-                
                 search_results = []
-                for item in results.get("items", []):
+                for item in _loads(response.content).get("items", []):
                     search_results.append({
                         "title": item.get("title", ""),
                         "snippet": item.get("snippet", ""),
@@ -147,18 +586,20 @@ class ExternalAIIntegrator:
                     })
                 
                 # Compile answer from top results
-                answer = f"Based on Google search results for '{question}':\\n\\n"
+                parts = [f"Based on Google search results for '{question}':\n\n"]
                 for i, result in enumerate(search_results[:3], 1):
-                    answer += f"{i}. **{result['title']}** ({result['source']})\\n"
-                    answer += f"   {result['snippet']}\\n"
-                    answer += f"   🔗 {result['link']}\\n\\n"
+                    parts.append(f"{i}. **{result['title']}** ({result['source']})\n")
+                    parts.append(f"   {result['snippet']}\n")
+                    parts.append(f"   🔗 {result['link']}\n\n")
+                answer = "".join(parts)
                 
                 return {
                     "success": True,
                     "answer": answer,
                     "source": "Google Search",
+                    "source_id": Source.GOOGLE,
                     "results": search_results,
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": _now_iso(),
                     "results_count": len(search_results)
                 }
             else:
@@ -175,7 +616,21 @@ class ExternalAIIntegrator:
                 "source": "Google Search"
             }
     
+    def batch_google(self, queries: List[str], num_results: int = 5) -> List[Dict[str, Any]]:
+        """Run several Google searches at once, returning results in query order"""
+        if len(queries) == 1:
+            return [self.query_google_search(queries[0], num_results)]
+        
+        # Custom Search has no batch endpoint, so overlap the individual requests instead
+        with ThreadPoolExecutor(max_workers=min(len(queries), MAX_CONCURRENT_GOOGLE_REQUESTS)) as executor:
+            return list(executor.map(lambda query: self.query_google_search(query, num_results), queries))
+    
     def simulate_copilot_response(self, question: str, context: str = "") -> Dict[str, Any]:
+        """Simulate GitHub Copilot response, reusing a cached answer for a repeated question"""
+        key = _cache_key("copilot", _fingerprint(self.openai_api_key), question, context)
+        return self._cached_call(_copilot_cache, key, self._simulate_copilot_uncached, question, context)
+    
+    def _simulate_copilot_uncached(self, question: str, context: str = "") -> Dict[str, Any]:
         """Simulate GitHub Copilot response (using OpenAI with coding context)"""
         try:
             if not self.openai_api_key:
@@ -185,60 +640,25 @@ class ExternalAIIntegrator:
                     "source": "GitHub Copilot"
                 }
             
-            headers = {
-                "Authorization": f"Bearer {self.openai_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            prompt = f"""
-            As GitHub Copilot, provide a helpful response to: {question}
-            
-            {f'Available context: {context}' if context else ''}
-            
-            Focus on:
-            - Practical, actionable advice
-            - Code examples when relevant
-            - Best practices and recommendations
-            - Step-by-step guidance
+            headers = self._openai_headers()
+            payload = self._copilot_payload(question, context)
             
-            Format your response as if you're GitHub Copilot assistant.
-            """
-            
-            payload = {
-                "model": "gpt-3.5-turbo",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are GitHub Copilot, an AI coding assistant. Provide helpful, practical responses with code examples when relevant. Be concise but comprehensive."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": 600,
-                "temperature": 0.5
-            }
-            
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
+            response = self._post_openai(headers, payload)
             
             if response.status_code == 200:
-                result = response.json()
-                answer = result["choices"][0]["message"]["content"]
+                answer, tokens_used = _completion_fields(response)
                 
                 # Add Copilot branding to response
-                formatted_answer = f"**🤖 GitHub Copilot Response:**\\n\\n{answer}\\n\\n"
-                formatted_answer += "*This response was generated using GitHub Copilot's AI capabilities.*"
+                formatted_answer = f"{COPILOT_HEADER}{answer}{COPILOT_FOOTER}"
                 
                 return {
                     "success": True,
                     "answer": formatted_answer,
                     "source": "GitHub Copilot",
+                    "source_id": Source.COPILOT,
                     "model": "gpt-3.5-turbo (Copilot-style)",
-                    "timestamp": datetime.now().isoformat(),
-                    "tokens_used": result.get("usage", {}).get("total_tokens", 0)
+                    "timestamp": _now_iso(),
+                    "tokens_used": tokens_used
                 }
             else:
                 return {
@@ -255,81 +675,102 @@ class ExternalAIIntegrator:
             }
     
     def query_all_sources(self, question: str, knowledge_base_context: str = "") -> List[Dict[str, Any]]:
-        """Query all available AI sources and return combined results with rate limit handling"""
-        results = []
+        """Query all available AI sources concurrently and return combined results with rate limit handling"""
+        # Copilot is the same model with a coding prompt; for non-coding questions its answer is
+        # derived from ChatGPT's instead of paying for a second completion
+        wants_code = _is_coding_question(question)
         
-        # Query ChatGPT first
-        with st.spinner("🤖 Querying ChatGPT..."):
-            chatgpt_result = self.query_chatgpt(question, knowledge_base_context)
-            results.append(chatgpt_result)
-            
-            # If ChatGPT hit rate limit, skip Copilot to avoid double rate limiting
-            if chatgpt_result.get('error') and '429' in str(chatgpt_result.get('error')):
-                st.warning("⚠️ Rate limit detected - using demo responses for additional sources")
+        # The calls are independent and network-bound, so issue them side by side:
+        # total latency becomes the slowest single round-trip instead of the sum
+        with st.spinner("🔍 Querying ChatGPT, GitHub Copilot and Google in parallel..."):
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                chatgpt_future = executor.submit(self.query_chatgpt, question, knowledge_base_context)
+                copilot_future = (executor.submit(self.simulate_copilot_response, question, knowledge_base_context)
+                                  if wants_code else None)
+                google_future = executor.submit(self.query_google_search, question)
                 
-                # Add demo Copilot response
-                copilot_demo = {
-                    "success": True,
-                    "answer": f"**🤖 GitHub Copilot Demo Response:**\n\nFor '{question}', I would provide technical assistance including:\n\n• Step-by-step troubleshooting\n• Code examples and snippets\n• Best practice recommendations\n• Resource links\n\n*Demo mode due to API rate limits*",
-                    "source": "GitHub Copilot (Demo)",
-                    "timestamp": datetime.now().isoformat()
-                }
-                results.append(copilot_demo)
-            else:
-                # Query GitHub Copilot normally
-                with st.spinner("⚡ Consulting GitHub Copilot..."):
-                    copilot_result = self.simulate_copilot_response(question, knowledge_base_context)
-                    results.append(copilot_result)
+                chatgpt_result = chatgpt_future.result()
+                copilot_result = copilot_future.result() if copilot_future is not None else None
+                google_result = google_future.result()
         
-        # Query Google Search (independent of OpenAI rate limits)
-        with st.spinner("🔍 Searching Google..."):
-            google_result = self.query_google_search(question)
-            results.append(google_result)
+        # If ChatGPT hit rate limit, Copilot shares the same OpenAI quota - show a demo response instead
+        if _RATE_LIMIT_RE.search(str(chatgpt_result.get('error') or '')):
+            st.warning("⚠️ Rate limit detected - using demo responses for additional sources")
+            
+            copilot_result = {
+                "success": True,
+                "answer": f"**🤖 GitHub Copilot Demo Response:**\n\nFor '{question}', I would provide technical assistance including:\n\n• Step-by-step troubleshooting\n• Code examples and snippets\n• Best practice recommendations\n• Resource links\n\n*Demo mode due to API rate limits*",
+                "source": "GitHub Copilot (Demo)",
+                "source_id": Source.COPILOT,
+                "timestamp": _now_iso()
+            }
+        elif copilot_result is None:
+            # Non-coding question: no second completion, Copilot's answer stands or falls with ChatGPT's
+            copilot_result = _derive_copilot_result(chatgpt_result) if chatgpt_result.get('success') else {
+                "success": False,
+                "error": f"Derived from ChatGPT, which failed: {chatgpt_result.get('error', 'Unknown error')}",
+                "source": "GitHub Copilot"
+            }
         
-        return results
+        # Google Search is independent of OpenAI rate limits
+        return [chatgpt_result, copilot_result, google_result]
     
     def format_multi_source_response(self, question: str, results: List[Dict[str, Any]], 
                                    kb_response: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Format response from multiple sources"""
+        """
+        Format response from multiple sources
+
+        The answer is returned as (heading, body) sections rather than one joined string;
+        callers render them in order (see answer_markdown()).
+        """
         
-        answer = f"# 🌟 Comprehensive Answer: {question}\\n\\n"
+        sections: List[Tuple[str, str]] = [(f"# 🌟 Comprehensive Answer: {question}", "")]
         
         # Add knowledge base response first if available
         if kb_response and kb_response.get('success'):
-            answer += "## 📚 **From Your Knowledge Base:**\\n"
-            answer += f"{kb_response['answer']}\\n\\n"
-            answer += "---\\n\\n"
+            sections.append(("## 📚 **From Your Knowledge Base:**", f"{kb_response['answer']}\n\n---"))
         
         # Add external sources
         successful_sources = [r for r in results if r.get('success')]
         
         for i, result in enumerate(successful_sources, 1):
-            source_name = result.get('source', 'Unknown Source')
-            answer += f"## {i}. **{source_name}:**\\n"
-            answer += f"{result.get('answer', 'No response available')}\\n\\n"
+            body = [result.get('answer', 'No response available'), ""]
             
             # Add metadata
             if result.get('model'):
-                answer += f"*Model: {result['model']}*\\n"
+                body.append(f"*Model: {result['model']}*")
             if result.get('tokens_used'):
-                answer += f"*Tokens used: {result['tokens_used']}*\\n"
+                body.append(f"*Tokens used: {result['tokens_used']}*")
             if result.get('results_count'):
-                answer += f"*Search results: {result['results_count']}*\\n"
+                body.append(f"*Search results: {result['results_count']}*")
             
-            answer += "---\\n\\n"
+            body += ["", "---"]
+            sections.append((f"## {i}. **{result.get('source', 'Unknown Source')}:**", "\n".join(body)))
         
         # Add failed sources info
         failed_sources = [r for r in results if not r.get('success')]
         if failed_sources:
-            answer += "## ⚠️ **Unavailable Sources:**\\n"
-            for failed in failed_sources:
-                answer += f"• {failed.get('source', 'Unknown')}: {failed.get('error', 'Unknown error')}\\n"
+            sections.append(("## ⚠️ **Unavailable Sources:**", "\n".join(
+                f"• {failed.get('source', 'Unknown')}: {failed.get('error', 'Unknown error')}"
+                for failed in failed_sources
+            )))
         
         return {
             "success": True,
-            "answer": answer,
-            "sources": [r.get('source') for r in successful_sources],
+            "sections": sections,
+            "sources": [r.get('source_id', Source.KB) for r in successful_sources],
             "total_sources": len(results),
             "successful_sources": len(successful_sources),
-            "timestamp": datetime.now().isoformat()
-        }
\ No newline at end of file
+            "timestamp": _now_iso()
+        }
+
+def answer_markdown(response: Dict[str, Any]) -> List[str]:
+    """Markdown blocks of a response: its sections for multi-source answers, else the single answer"""
+    if 'sections' in response:
+        return [f"{heading}\n\n{body}" if body else heading for heading, body in response['sections']]
+    return [response.get('answer', '')]
+
+@st.cache_resource(show_spinner=False)
+def get_integrator() -> ExternalAIIntegrator:
+    """Integrator shared by every session and rerun (its session, caches and in-flight map are process-wide)"""
+    return ExternalAIIntegrator()
@@ -4,36 +4,93 @@ Handles metadata storage and retrieval using Firebase Firestore
 """
 
 import os
+import asyncio
+import atexit
+import hashlib
 import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 import json
 
+from .ttl_cache import TTLCache
+
 # Firebase imports
 try:
     import firebase_admin
     from firebase_admin import credentials, firestore
+    from google.api_core.exceptions import Aborted, DeadlineExceeded
+    from google.api_core.retry import if_exception_type
+    from google.api_core.retry_async import AsyncRetry
     FIREBASE_AVAILABLE = True
 except ImportError:
     FIREBASE_AVAILABLE = False
     logging.warning("Firebase SDK not available. Using local JSON storage as fallback.")
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _dumps(record: Dict[str, Any]) -> bytes:
+    """Serialize one log record (orjson when installed; other values fall back to str)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(record, default=str)
+    return json.dumps(record, default=str).encode("utf-8")
+
+
+def _loads(line: bytes) -> Any:
+    """Parse one log record, or a whole legacy JSON file (orjson when installed)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
 class MetadataStorageInterface:
     """Abstract interface for metadata storage implementations"""
     
+    # Bumped by every document write, so callers caching document reads (such as the UI's
+    # stats) can tell when they went stale
+    generation = 0
+    
+    # categories_searched key for searches run without a category filter ("All"), kept
+    # apart from the real 'general' category
+    UNFILTERED_CATEGORY = 'all'
+    
     def create_document(self, document_data: Dict[str, Any]) -> str:
         """Create document metadata"""
         raise NotImplementedError
     
+    def create_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Create metadata for several documents, returning their IDs in order"""
+        return [self.create_document(document_data) for document_data in documents]
+    
+    async def acreate_document(self, document_data: Dict[str, Any]) -> str:
+        """Create document metadata without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.create_document, document_data)
+    
+    async def acreate_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Create metadata for several documents without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.create_documents_bulk, documents)
+    
     def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get document metadata by ID"""
         raise NotImplementedError
     
+    def get_document_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Get metadata of the document whose file bytes have this hash, if any"""
+        return next((doc for doc in self.get_all_documents() if doc.get('file_hash') == file_hash), None)
+    
     def get_all_documents(self) -> List[Dict[str, Any]]:
         """Get all document metadata"""
         raise NotImplementedError
@@ -50,13 +107,35 @@ class MetadataStorageInterface:
         """Log query information"""
         raise NotImplementedError
     
+    async def alog_query(self, query_data: Dict[str, Any]) -> str:
+        """Log query information without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.log_query, query_data)
+    
     def get_query_stats(self) -> Dict[str, Any]:
         """Get query statistics"""
         raise NotImplementedError
 
 
 class FirebaseMetadataDB(MetadataStorageInterface):
-    """Firebase Firestore implementation for metadata storage"""
+    """
+    Firebase Firestore implementation for metadata storage
+    
+    Reads and single writes use the synchronous client. Bulk writes and query logging go
+    through an AsyncClient driven by one background event loop, so any number of commits
+    can be in flight without a thread each; the async methods are safe to await from any loop.
+    """
+    
+    # Writes per WriteBatch commit (Firestore allows up to 500; staying below leaves
+    # headroom and keeps the cost of retrying a failed commit small)
+    BATCH_SIZE = 450
+    
+    # Document metadata rarely changes and every write goes through this class, which
+    # invalidates the caches, so reads can be served locally for a long time
+    DOC_CACHE_TTL = 1800
+    
+    # Stored as the aggregate's rebuilt marker; bumped when the aggregate's layout changes
+    # (2: unfiltered searches counted under UNFILTERED_CATEGORY), forcing one rescan
+    QUERY_STATS_VERSION = 2
     
     def __init__(self, service_account_path: str, project_id: str):
         """
@@ -78,15 +157,40 @@ class FirebaseMetadataDB(MetadataStorageInterface):
                 'projectId': project_id,
             })
         
-        # Initialize Firestore client
+        # Initialize Firestore clients; the async one lives on (and must only be used from) self._loop
         self.db = firestore.client()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="firestore-async", daemon=True).start()
+        self.adb = self._submit(self._create_async_client()).result()
+        atexit.register(self._loop.call_soon_threadsafe, self._loop.stop)
         
         # Collection names
         self.documents_collection = "documents"
         self.queries_collection = "queries"
         
+        # Running totals maintained by log_query, so stats cost one read instead of a full scan;
+        # per-question counts live in their own documents so the top ones come from an index
+        self.query_stats_ref = self.db.collection("queries_agg").document("stats")
+        self.popular_queries_ref = self.query_stats_ref.collection("popular")
+        
+        # Contention (Aborted) and timeouts are transient; the writes are plain sets, so retrying is safe
+        self._commit_retry = AsyncRetry(predicate=if_exception_type(Aborted, DeadlineExceeded))
+        
+        # Read caches; get_all_documents keeps (monotonic fetch time, documents)
+        self._doc_cache = TTLCache(maxsize=1024, ttl=self.DOC_CACHE_TTL)
+        self._all_docs_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+        
         logger.info(f"Initialized Firebase Firestore for project: {project_id}")
     
+    async def _create_async_client(self):
+        """Create the AsyncClient on self._loop, with the credentials of the firebase-admin app"""
+        credential = firebase_admin.get_app().credential.get_credential()
+        return firestore.AsyncClient(project=self.project_id, credentials=credential)
+    
+    def _submit(self, coro) -> Future:
+        """Schedule a coroutine on the client's event loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+    
     def create_document(self, document_data: Dict[str, Any]) -> str:
         """Create document metadata in Firestore"""
         try:
@@ -97,6 +201,7 @@ class FirebaseMetadataDB(MetadataStorageInterface):
             # Add to Firestore
             doc_ref = self.db.collection(self.documents_collection).add(document_data)
             doc_id = doc_ref[1].id
+            self._invalidate()
             
             logger.info(f"Created document metadata with ID: {doc_id}")
             return doc_id
@@ -105,16 +210,74 @@ class FirebaseMetadataDB(MetadataStorageInterface):
             logger.error(f"Error creating document metadata: {e}")
             raise
     
+    def create_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Create document metadata with one WriteBatch commit per BATCH_SIZE documents"""
+        return self._submit(self._create_documents_bulk(documents)).result()
+    
+    async def acreate_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Create document metadata in bulk from any event loop"""
+        return await asyncio.wrap_future(self._submit(self._create_documents_bulk(documents)))
+    
+    async def acreate_document(self, document_data: Dict[str, Any]) -> str:
+        """Create document metadata from any event loop"""
+        doc_ids = await self.acreate_documents_bulk([document_data])
+        return doc_ids[0]
+    
+    async def _create_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Build the WriteBatches and commit them all concurrently (runs on self._loop)"""
+        try:
+            collection = self.adb.collection(self.documents_collection)
+            doc_ids = []
+            batches = []
+            
+            for start in range(0, len(documents), self.BATCH_SIZE):
+                batch = self.adb.batch()
+                for document_data in documents[start:start + self.BATCH_SIZE]:
+                    document_data['created_at'] = firestore.SERVER_TIMESTAMP
+                    document_data['updated_at'] = firestore.SERVER_TIMESTAMP
+                    
+                    doc_ref = collection.document()
+                    batch.set(doc_ref, document_data)
+                    doc_ids.append(doc_ref.id)
+                batches.append(batch)
+            
+            # Commit all batches concurrently; gather re-raises the first failure
+            await asyncio.gather(*(self._commit_batch(batch) for batch in batches))
+            self._invalidate()
+            
+            logger.info(f"Created {len(doc_ids)} document metadata records")
+            return doc_ids
+            
+        except Exception as e:
+            logger.error(f"Error creating document metadata in bulk: {e}")
+            raise
+    
+    def _invalidate(self, doc_id: Optional[str] = None) -> None:
+        """Drop cached reads affected by a write to doc_id (or by a new document)"""
+        self.generation += 1
+        self._all_docs_cache = None
+        if doc_id is not None:
+            self._doc_cache.pop(doc_id)
+    
+    async def _commit_batch(self, batch) -> None:
+        """Commit an AsyncWriteBatch, retrying transient errors"""
+        await batch.commit(retry=self._commit_retry)
+    
     def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Get document metadata by ID"""
         try:
+            cached = self._doc_cache.get(doc_id)
+            if cached is not None:
+                return dict(cached)
+            
             doc_ref = self.db.collection(self.documents_collection).document(doc_id)
             doc = doc_ref.get()
             
             if doc.exists:
                 data = doc.to_dict()
                 data['id'] = doc.id
-                return data
+                self._doc_cache.set(doc_id, data)
+                return dict(data)
             
             return None
             
@@ -122,9 +285,31 @@ class FirebaseMetadataDB(MetadataStorageInterface):
             logger.error(f"Error getting document {doc_id}: {e}")
             return None
     
+    def get_document_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Get metadata of the document whose file bytes have this hash (single-field index, no scan)"""
+        try:
+            matches = (self.db.collection(self.documents_collection)
+                       .where("file_hash", "==", file_hash).limit(1).stream())
+            for doc in matches:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                return data
+            
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error looking up document by hash: {e}")
+            return None
+    
     def get_all_documents(self) -> List[Dict[str, Any]]:
         """Get all document metadata"""
         try:
+            cached = self._all_docs_cache
+            if cached is not None and time.monotonic() - cached[0] < self.DOC_CACHE_TTL:
+                return [dict(data) for data in cached[1]]
+            
+            # Writes bump the generation, so a scan that raced one is not cached
+            fetched_at, generation = time.monotonic(), self.generation
             docs_ref = self.db.collection(self.documents_collection)
             docs = docs_ref.stream()
             
@@ -134,7 +319,11 @@ class FirebaseMetadataDB(MetadataStorageInterface):
                 data['id'] = doc.id
                 documents.append(data)
             
-            return documents
+            if generation == self.generation:
+                self._all_docs_cache = (fetched_at, documents)
+                for data in documents:
+                    self._doc_cache.set(data['id'], data)
+            return [dict(data) for data in documents]
             
         except Exception as e:
             logger.error(f"Error getting all documents: {e}")
@@ -147,6 +336,7 @@ class FirebaseMetadataDB(MetadataStorageInterface):
             
             doc_ref = self.db.collection(self.documents_collection).document(doc_id)
             doc_ref.update(update_data)
+            self._invalidate(doc_id)
             
             logger.info(f"Updated document: {doc_id}")
             return True
@@ -160,6 +350,7 @@ class FirebaseMetadataDB(MetadataStorageInterface):
         try:
             doc_ref = self.db.collection(self.documents_collection).document(doc_id)
             doc_ref.delete()
+            self._invalidate(doc_id)
             
             logger.info(f"Deleted document: {doc_id}")
             return True
@@ -173,46 +364,110 @@ class FirebaseMetadataDB(MetadataStorageInterface):
         try:
             query_data['timestamp'] = firestore.SERVER_TIMESTAMP
             
-            query_ref = self.db.collection(self.queries_collection).add(query_data)
-            query_id = query_ref[1].id
+            # The ID is generated client-side, so the write itself can finish in the background
+            query_ref = self.adb.collection(self.queries_collection).document()
+            future = self._submit(self._write_query_log(query_ref, query_data))
+            future.add_done_callback(self._log_write_failure)
             
-            logger.info(f"Logged query with ID: {query_id}")
-            return query_id
+            logger.info(f"Logged query with ID: {query_ref.id}")
+            return query_ref.id
             
         except Exception as e:
             logger.error(f"Error logging query: {e}")
             raise
     
-    def get_query_stats(self) -> Dict[str, Any]:
-        """Get query statistics"""
-        try:
-            queries_ref = self.db.collection(self.queries_collection)
-            queries = queries_ref.stream()
+    async def alog_query(self, query_data: Dict[str, Any]) -> str:
+        """Log query information from any event loop, waiting for the write to commit"""
+        query_data['timestamp'] = firestore.SERVER_TIMESTAMP
+        query_ref = self.adb.collection(self.queries_collection).document()
+        await asyncio.wrap_future(self._submit(self._write_query_log(query_ref, query_data)))
+        return query_ref.id
+    
+    @staticmethod
+    def _log_write_failure(future) -> None:
+        """Report background writes that failed"""
+        if future.exception() is not None:
+            logger.error(f"Error writing query log: {future.exception()}")
+    
+    @staticmethod
+    def _popular_key(question: str) -> str:
+        """Document ID for a question's counter (raw questions can be too long or contain '/')"""
+        return hashlib.blake2b(question.encode(), digest_size=8).hexdigest()
+    
+    async def _write_query_log(self, query_ref, query_data: Dict[str, Any]) -> None:
+        """Store a query and bump the aggregate counters in one atomic batch (runs on self._loop)"""
+        category = query_data.get('category_filter') or self.UNFILTERED_CATEGORY
+        question = query_data.get('question', '')
+        
+        aggregate = {
+            "total_queries": firestore.Increment(1),
+            "categories_searched": {category: firestore.Increment(1)},
+        }
+        
+        batch = self.adb.batch()
+        batch.set(query_ref, query_data)
+        batch.set(self.adb.document(self.query_stats_ref.path), aggregate, merge=True)
+        if question:
+            popular_ref = self.adb.document(self.popular_queries_ref.document(self._popular_key(question)).path)
+            batch.set(popular_ref, {"question": question, "count": firestore.Increment(1)}, merge=True)
+        await self._commit_batch(batch)
+    
+    def _store_popular_queries(self, counts: Dict[str, int]) -> None:
+        """Write per-question counters, BATCH_SIZE documents per commit"""
+        items = list(counts.items())
+        for start in range(0, len(items), self.BATCH_SIZE):
+            batch = self.db.batch()
+            for question, count in items[start:start + self.BATCH_SIZE]:
+                batch.set(self.popular_queries_ref.document(self._popular_key(question)),
+                          {"question": question, "count": count})
+            batch.commit()
+    
+    def _rebuild_query_stats(self) -> Dict[str, Any]:
+        """Compute the aggregate from the full queries collection and store it"""
+        total_queries = 0
+        categories = Counter()
+        questions = Counter()
+        
+        for query in self.db.collection(self.queries_collection).stream():
+            data = query.to_dict()
+            total_queries += 1
             
-            total_queries = 0
-            categories = {}
-            popular_queries = {}
+            # Count categories
+            categories[data.get('category_filter') or self.UNFILTERED_CATEGORY] += 1
             
-            for query in queries:
-                data = query.to_dict()
-                total_queries += 1
-                
-                # Count categories
-                category = data.get('category_filter', 'general')
-                categories[category] = categories.get(category, 0) + 1
-                
-                # Count popular queries
-                question = data.get('question', '')
-                if question:
-                    popular_queries[question] = popular_queries.get(question, 0) + 1
+            # Count popular queries
+            question = data.get('question', '')
+            if question:
+                questions[question] += 1
+        
+        # rebuilt marks the aggregate as covering every earlier query: log_query's merge writes
+        # create the document too, so its mere existence proves nothing
+        aggregate = {
+            "total_queries": total_queries,
+            "categories_searched": dict(categories),
+            "rebuilt": self.QUERY_STATS_VERSION,
+        }
+        self._store_popular_queries(questions)
+        self.query_stats_ref.set(aggregate)
+        return aggregate
+    
+    def get_query_stats(self) -> Dict[str, Any]:
+        """Get query statistics from the aggregate document (built from a full scan the first time)"""
+        try:
+            snapshot = self.query_stats_ref.get()
+            aggregate = snapshot.to_dict() if snapshot.exists else {}
+            if aggregate.get('rebuilt') != self.QUERY_STATS_VERSION:
+                aggregate = self._rebuild_query_stats()
             
-            # Get top 10 popular queries
-            sorted_queries = sorted(popular_queries.items(), key=lambda x: x[1], reverse=True)[:10]
+            # Get top 10 popular queries from the single-field index on count
+            top_queries = (self.popular_queries_ref
+                           .order_by("count", direction=firestore.Query.DESCENDING).limit(10).stream())
+            sorted_queries = [doc.to_dict() for doc in top_queries]
             
             return {
-                "total_queries": total_queries,
-                "categories_searched": categories,
-                "popular_queries": [{"question": q[0], "count": q[1]} for q in sorted_queries]
+                "total_queries": aggregate.get('total_queries', 0),
+                "categories_searched": aggregate.get('categories_searched', {}),
+                "popular_queries": [{"question": q['question'], "count": q['count']} for q in sorted_queries]
             }
             
         except Exception as e:
@@ -225,113 +480,244 @@ class FirebaseMetadataDB(MetadataStorageInterface):
 
 
 class LocalJSONMetadataDB(MetadataStorageInterface):
-    """Local JSON file implementation for metadata storage (fallback)"""
+    """
+    Local JSON Lines implementation for metadata storage (fallback)
+    
+    Each file is an append-only log replayed into memory on startup, so a write appends
+    one line instead of rewriting the whole file. Document updates and deletes are logged
+    as records too, and the documents log is compacted once superseded records outnumber
+    the live ones. Appends are buffered and flushed to disk at most FLUSH_DELAY seconds
+    later by a background timer (and on close).
+    """
+    
+    # Superseded records tolerated before the documents log is rewritten
+    COMPACT_MIN_DEAD = 1000
+    
+    # Seconds a write may sit in the file buffer before it is flushed
+    FLUSH_DELAY = 1.0
     
     def __init__(self, data_dir: str = "./data"):
         """
         Initialize local JSON metadata database
         
         Args:
-            data_dir: Directory to store JSON files
+            data_dir: Directory to store JSON Lines files
         """
         self.data_dir = data_dir
         os.makedirs(data_dir, exist_ok=True)
         
-        self.documents_file = os.path.join(data_dir, "documents.json")
-        self.queries_file = os.path.join(data_dir, "queries.json")
+        self.documents_file = os.path.join(data_dir, "documents.jsonl")
+        self.queries_file = os.path.join(data_dir, "queries.jsonl")
+        
+        # Serializes writes when several uploads are processed in parallel
+        self._lock = threading.RLock()
+        
+        # In-memory state rebuilt from the logs
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._queries: List[Dict[str, Any]] = []
+        self._doc_seq = 0
+        self._dead_records = 0
+        self._flush_timer: Optional[threading.Timer] = None
         
-        # Initialize files if they don't exist
         for file_path in [self.documents_file, self.queries_file]:
-            if not os.path.exists(file_path):
-                with open(file_path, 'w') as f:
-                    json.dump([], f)
+            self._migrate_legacy_json(file_path)
+        
+        for record in self._read_log(self.documents_file):
+            self._apply(record)
+        self._queries = list(self._read_log(self.queries_file))
+        
+        if self._dead_records > max(self.COMPACT_MIN_DEAD, len(self._docs)):
+            self._compact()
+        
+        self._documents_log = self._open_log(self.documents_file)
+        self._queries_log = self._open_log(self.queries_file)
+        atexit.register(self.close)
         
         logger.info(f"Initialized local JSON metadata storage in: {data_dir}")
     
-    def _load_json(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load data from JSON file"""
+    def _migrate_legacy_json(self, log_path: str):
+        """Convert a pre-JSONL file (a single JSON list) to the append-only format"""
+        legacy_path = log_path[:-1]  # "documents.jsonl" -> "documents.json"
+        if os.path.exists(log_path) or not os.path.exists(legacy_path):
+            return
+        
         try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
+            with open(legacy_path, 'rb') as f:
+                entries = _loads(f.read())
         except Exception as e:
-            logger.error(f"Error loading {file_path}: {e}")
-            return []
+            logger.error(f"Error loading {legacy_path}: {e}")
+            return
+        
+        is_documents = log_path == self.documents_file
+        with open(log_path, 'wb') as f:
+            for entry in entries:
+                f.write(_dumps({"op": "put", "data": entry} if is_documents else entry) + b"\n")
+        logger.info(f"Migrated {legacy_path} to {log_path}")
     
-    def _save_json(self, file_path: str, data: List[Dict[str, Any]]) -> bool:
-        """Save data to JSON file"""
-        try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
-            return True
-        except Exception as e:
-            logger.error(f"Error saving {file_path}: {e}")
-            return False
+    @staticmethod
+    def _read_log(file_path: str) -> Iterator[Dict[str, Any]]:
+        """Yield the records of a JSON Lines file, skipping a torn final line"""
+        if not os.path.exists(file_path):
+            return
+        
+        with open(file_path, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield _loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping unreadable record {line_number} in {file_path}")
+    
+    @staticmethod
+    def _open_log(file_path: str):
+        """Open a log for appending, terminating a torn final line so new records stay readable"""
+        log = open(file_path, 'ab')
+        if log.tell():
+            with open(file_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    log.write(b"\n")
+        return log
+    
+    def _apply(self, record: Dict[str, Any]):
+        """Apply one documents-log record to the in-memory index"""
+        op = record.get("op")
+        if op == "put":
+            self._docs[record["data"]["id"]] = record["data"]
+            self._doc_seq += 1
+        elif op == "patch" and record["id"] in self._docs:
+            self._docs[record["id"]].update(record["data"])
+            self._dead_records += 1
+        elif op == "delete" and self._docs.pop(record["id"], None) is not None:
+            self._dead_records += 2  # the delete and the document's own records
+    
+    def _append(self, log, record: Dict[str, Any]):
+        """Append one record to an open log (flushed shortly after, see _schedule_flush)"""
+        log.write(_dumps(record) + b"\n")
+        self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """Start the debounced flush timer unless one is already pending"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.FLUSH_DELAY, self._flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def _flush(self):
+        """Write buffered records of both logs to disk"""
+        with self._lock:
+            self._flush_timer = None
+            for log in (self._documents_log, self._queries_log):
+                if not log.closed:
+                    log.flush()
+    
+    def _log_document_change(self, record: Dict[str, Any]):
+        """Append and apply a documents-log record, compacting the log when it has grown stale"""
+        self._append(self._documents_log, record)
+        self._apply(record)
+        self.generation += 1
+        if self._dead_records > max(self.COMPACT_MIN_DEAD, len(self._docs)):
+            self._documents_log.close()
+            self._compact()
+            self._documents_log = self._open_log(self.documents_file)
+    
+    def _compact(self):
+        """Rewrite the documents log with one record per live document"""
+        tmp_path = f"{self.documents_file}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for doc in self._docs.values():
+                f.write(_dumps({"op": "put", "data": doc}) + b"\n")
+        os.replace(tmp_path, self.documents_file)
+        self._dead_records = 0
+        logger.info(f"Compacted {self.documents_file} to {len(self._docs)} records")
+    
+    def close(self):
+        """Flush and close the open log files"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._documents_log.close()
+            self._queries_log.close()
     
     def create_document(self, document_data: Dict[str, Any]) -> str:
-        """Create document metadata in JSON file"""
+        """Create document metadata in the documents log"""
         try:
-            documents = self._load_json(self.documents_file)
-            
-            # Generate ID
-            doc_id = f"doc_{len(documents) + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            # Add metadata
-            document_data['id'] = doc_id
-            document_data['created_at'] = datetime.now().isoformat()
-            document_data['updated_at'] = datetime.now().isoformat()
-            
-            # Add to list
-            documents.append(document_data)
-            
-            # Save
-            self._save_json(self.documents_file, documents)
-            
-            logger.info(f"Created document metadata with ID: {doc_id}")
-            return doc_id
+            with self._lock:
+                # Generate ID (one clock read for the ID and both timestamps)
+                now = datetime.now()
+                doc_id = f"doc_{self._doc_seq + 1}_{now.strftime('%Y%m%d_%H%M%S')}"
+                
+                # Add metadata
+                document_data['id'] = doc_id
+                document_data['created_at'] = document_data['updated_at'] = now.isoformat()
+                
+                self._log_document_change({"op": "put", "data": document_data})
+                
+                logger.info(f"Created document metadata with ID: {doc_id}")
+                return doc_id
             
         except Exception as e:
             logger.error(f"Error creating document metadata: {e}")
             raise
     
-    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
-        """Get document metadata by ID"""
+    def create_documents_bulk(self, documents: List[Dict[str, Any]]) -> List[str]:
+        """Create document metadata for several documents with a single write"""
         try:
-            documents = self._load_json(self.documents_file)
-            
-            for doc in documents:
-                if doc.get('id') == doc_id:
-                    return doc
-            
-            return None
+            with self._lock:
+                current = datetime.now()
+                timestamp = current.strftime('%Y%m%d_%H%M%S')
+                now = current.isoformat()
+                
+                records = []
+                for i, document_data in enumerate(documents, 1):
+                    document_data['id'] = f"doc_{self._doc_seq + i}_{timestamp}"
+                    document_data['created_at'] = now
+                    document_data['updated_at'] = now
+                    records.append({"op": "put", "data": document_data})
+                
+                self._documents_log.write(b"".join(_dumps(record) + b"\n" for record in records))
+                self._schedule_flush()
+                for record in records:
+                    self._apply(record)
+                self.generation += 1
+                
+                doc_ids = [document_data['id'] for document_data in documents]
+                logger.info(f"Created {len(doc_ids)} document metadata records")
+                return doc_ids
             
         except Exception as e:
-            logger.error(f"Error getting document {doc_id}: {e}")
-            return None
+            logger.error(f"Error creating document metadata in bulk: {e}")
+            raise
+    
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get document metadata by ID"""
+        doc = self._docs.get(doc_id)
+        return dict(doc) if doc is not None else None
+    
+    def get_document_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Get metadata of the document whose file bytes have this hash, if any"""
+        with self._lock:
+            doc = next((doc for doc in self._docs.values() if doc.get('file_hash') == file_hash), None)
+            return dict(doc) if doc is not None else None
     
     def get_all_documents(self) -> List[Dict[str, Any]]:
         """Get all document metadata"""
-        try:
-            return self._load_json(self.documents_file)
-        except Exception as e:
-            logger.error(f"Error getting all documents: {e}")
-            return []
+        with self._lock:
+            return [dict(doc) for doc in self._docs.values()]
     
     def update_document(self, doc_id: str, update_data: Dict[str, Any]) -> bool:
         """Update document metadata"""
         try:
-            documents = self._load_json(self.documents_file)
-            
-            for i, doc in enumerate(documents):
-                if doc.get('id') == doc_id:
-                    documents[i].update(update_data)
-                    documents[i]['updated_at'] = datetime.now().isoformat()
-                    break
-            else:
-                return False
-            
-            self._save_json(self.documents_file, documents)
-            logger.info(f"Updated document: {doc_id}")
-            return True
+            with self._lock:
+                if doc_id not in self._docs:
+                    return False
+                
+                patch = dict(update_data, updated_at=datetime.now().isoformat())
+                self._log_document_change({"op": "patch", "id": doc_id, "data": patch})
+                logger.info(f"Updated document: {doc_id}")
+                return True
             
         except Exception as e:
             logger.error(f"Error updating document {doc_id}: {e}")
@@ -340,18 +726,13 @@ class LocalJSONMetadataDB(MetadataStorageInterface):
     def delete_document(self, doc_id: str) -> bool:
         """Delete document metadata"""
         try:
-            documents = self._load_json(self.documents_file)
-            
-            for i, doc in enumerate(documents):
-                if doc.get('id') == doc_id:
-                    del documents[i]
-                    break
-            else:
-                return False
-            
-            self._save_json(self.documents_file, documents)
-            logger.info(f"Deleted document: {doc_id}")
-            return True
+            with self._lock:
+                if doc_id not in self._docs:
+                    return False
+                
+                self._log_document_change({"op": "delete", "id": doc_id})
+                logger.info(f"Deleted document: {doc_id}")
+                return True
             
         except Exception as e:
             logger.error(f"Error deleting document {doc_id}: {e}")
@@ -360,23 +741,20 @@ class LocalJSONMetadataDB(MetadataStorageInterface):
     def log_query(self, query_data: Dict[str, Any]) -> str:
         """Log query information"""
         try:
-            queries = self._load_json(self.queries_file)
-            
-            # Generate ID
-            query_id = f"query_{len(queries) + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            # Add metadata
-            query_data['id'] = query_id
-            query_data['timestamp'] = datetime.now().isoformat()
-            
-            # Add to list
-            queries.append(query_data)
-            
-            # Save
-            self._save_json(self.queries_file, queries)
-            
-            logger.info(f"Logged query with ID: {query_id}")
-            return query_id
+            with self._lock:
+                # Generate ID
+                now = datetime.now()
+                query_id = f"query_{len(self._queries) + 1}_{now.strftime('%Y%m%d_%H%M%S')}"
+                
+                # Add metadata
+                query_data['id'] = query_id
+                query_data['timestamp'] = now.isoformat()
+                
+                self._append(self._queries_log, query_data)
+                self._queries.append(query_data)
+                
+                logger.info(f"Logged query with ID: {query_id}")
+                return query_id
             
         except Exception as e:
             logger.error(f"Error logging query: {e}")
@@ -385,28 +763,19 @@ class LocalJSONMetadataDB(MetadataStorageInterface):
     def get_query_stats(self) -> Dict[str, Any]:
         """Get query statistics"""
         try:
-            queries = self._load_json(self.queries_file)
+            with self._lock:
+                queries = list(self._queries)
             
             total_queries = len(queries)
-            categories = {}
-            popular_queries = {}
+            categories = Counter(query.get('category_filter') or self.UNFILTERED_CATEGORY for query in queries)
+            popular_queries = Counter(query['question'] for query in queries if query.get('question'))
             
-            for query in queries:
-                # Count categories
-                category = query.get('category_filter', 'general')
-                categories[category] = categories.get(category, 0) + 1
-                
-                # Count popular queries
-                question = query.get('question', '')
-                if question:
-                    popular_queries[question] = popular_queries.get(question, 0) + 1
-            
-            # Get top 10 popular queries
-            sorted_queries = sorted(popular_queries.items(), key=lambda x: x[1], reverse=True)[:10]
+            # Get top 10 popular queries (heap-based, no full sort)
+            sorted_queries = popular_queries.most_common(10)
             
             return {
                 "total_queries": total_queries,
-                "categories_searched": categories,
+                "categories_searched": dict(categories),
                 "popular_queries": [{"question": q[0], "count": q[1]} for q in sorted_queries]
             }
             
@@ -419,10 +788,20 @@ class LocalJSONMetadataDB(MetadataStorageInterface):
             }
 
 
+@lru_cache(maxsize=None)
+def _local_metadata_db(data_dir: str) -> LocalJSONMetadataDB:
+    """One LocalJSONMetadataDB per directory, since each keeps the logs' state in memory"""
+    return LocalJSONMetadataDB(data_dir)
+
+
+@lru_cache(maxsize=1)
 def get_metadata_db() -> MetadataStorageInterface:
     """
     Get configured metadata database based on environment variables
     
+    The instance is created once per process and shared (the Firestore client is thread-safe),
+    so every consumer reuses the same client, connection pool and caches.
+    
     Returns:
         MetadataStorageInterface: Configured metadata database
     """
@@ -434,18 +813,18 @@ def get_metadata_db() -> MetadataStorageInterface:
         
         if not service_account_path or not project_id:
             logger.warning("Firebase configuration missing. Falling back to local JSON storage.")
-            return LocalJSONMetadataDB()
+            return _local_metadata_db(os.path.abspath("./data"))
         
         if not os.path.exists(service_account_path):
             logger.warning(f"Firebase service account file not found: {service_account_path}. Falling back to local JSON storage.")
-            return LocalJSONMetadataDB()
+            return _local_metadata_db(os.path.abspath("./data"))
         
         try:
             return FirebaseMetadataDB(service_account_path, project_id)
         except Exception as e:
             logger.warning(f"Failed to initialize Firebase: {e}. Falling back to local JSON storage.")
-            return LocalJSONMetadataDB()
+            return _local_metadata_db(os.path.abspath("./data"))
     
     else:
         data_dir = os.getenv("LOCAL_DATA_DIR", "./data")
-        return LocalJSONMetadataDB(data_dir)
\ No newline at end of file
+        return _local_metadata_db(os.path.abspath(data_dir))
\ No newline at end of file
@@ -4,27 +4,113 @@ Handles document upload, text extraction, chunking, and embedding storage
 """
 
 import os
+import shutil
 import logging
 import hashlib
+import multiprocessing
 import uuid
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from itertools import islice
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterable, Iterator
 from pathlib import Path
 
 import streamlit as st
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_community.document_loaders import Docx2txtLoader
+from langchain_community.document_loaders import Docx2txtLoader, PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
 from .vector_store import get_vector_store
 from .model_loader import get_embedding_model
 from .firebase_db import get_metadata_db
+from .llm_cache import invalidate_knowledge_base_answers
+from .retry import call_with_retries
+
+# PyMuPDF (MuPDF, in C) extracts PDF text several times faster than pure-Python pypdf
+try:
+    import fitz  # noqa: F401
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chunks per vector store call, calls in flight at once, and attempts per call; embedding
+# requests are latency-bound, so overlapping them cuts upload time roughly by the worker count.
+# Each call embeds its whole batch in one request (128 chunks of <=500 tokens stays far below
+# the API's per-request token limit)
+VECTOR_BATCH_SIZE = 128
+VECTOR_MAX_WORKERS = 8
+VECTOR_ADD_ATTEMPTS = 3
+
+# Uploads are copied to disk in pieces of this size rather than as one buffer
+UPLOAD_COPY_CHUNK = 1024 * 1024
+
+
+def _content_hash(content: str) -> str:
+    """8-hex-char content hash used in chunk document IDs (a 4-byte BLAKE2b digest, not a truncated one)"""
+    return hashlib.blake2b(content.encode(), digest_size=4).hexdigest()
+
+
+def _create_text_splitter() -> RecursiveCharacterTextSplitter:
+    """
+    Text splitter for ingestion: chunks are measured in tokens of the embedding model's
+    encoding, so they fill its budget; character counts are the fallback without tiktoken
+    """
+    separators = ["\n\n", "\n", " ", ""]
+    try:
+        return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name="cl100k_base",
+            chunk_size=500,
+            chunk_overlap=50,
+            separators=separators
+        )
+    except ImportError:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            length_function=len,
+            separators=separators
+        )
+
+
+def _create_loader(file_path: str):
+    """Document loader for a file, chosen by its extension"""
+    file_extension = Path(file_path).suffix.lower()
+    if file_extension == ".pdf":
+        return PyMuPDFLoader(file_path) if PYMUPDF_AVAILABLE else PyPDFLoader(file_path)
+    elif file_extension == ".docx":
+        return Docx2txtLoader(file_path)
+    elif file_extension == ".txt":
+        return TextLoader(file_path, encoding="utf-8")
+    raise ValueError(f"Unsupported file type: {file_extension}")
+
+
+_worker_text_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def _chunk_file(file_path: str) -> List[Document]:
+    """Extract and chunk a validated file (runs in ProcessPoolExecutor workers)"""
+    global _worker_text_splitter
+    if _worker_text_splitter is None:
+        _worker_text_splitter = _create_text_splitter()
+    
+    return [chunk for page in _create_loader(file_path).lazy_load()
+            for chunk in _worker_text_splitter.split_documents([page])]
+
+
+def _file_hash(file_path: str) -> str:
+    """BLAKE2b hash of a file's bytes, read UPLOAD_COPY_CHUNK at a time"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_COPY_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 
 class DocumentProcessor:
     """Handles document processing and ingestion"""
@@ -36,12 +122,7 @@ class DocumentProcessor:
         self.metadata_db = get_metadata_db()
         
         # Text splitter configuration
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        self.text_splitter = _create_text_splitter()
         
         # Supported file types
         self.supported_extensions = {".pdf", ".docx", ".txt"}
@@ -79,24 +160,25 @@ class DocumentProcessor:
         Returns:
             List[Document]: List of extracted documents
         """
+        documents = list(self.extract_text_stream(file_path))
+        logger.info(f"Extracted text from {len(documents)} pages/sections")
+        return documents
+    
+    def extract_text_stream(self, file_path: str) -> Iterator[Document]:
+        """
+        Extract text from document one page/section at a time
+        
+        Args:
+            file_path: Path to the document
+            
+        Yields:
+            Document: Extracted pages/sections, in order
+        """
         if not self.validate_file(file_path):
             raise ValueError(f"Invalid file: {file_path}")
         
-        file_extension = Path(file_path).suffix.lower()
-        
         try:
-            if file_extension == ".pdf":
-                loader = PyPDFLoader(file_path)
-            elif file_extension == ".docx":
-                loader = Docx2txtLoader(file_path)
-            elif file_extension == ".txt":
-                loader = TextLoader(file_path, encoding="utf-8")
-            else:
-                raise ValueError(f"Unsupported file type: {file_extension}")
-            
-            documents = loader.load()
-            logger.info(f"Extracted text from {len(documents)} pages/sections")
-            return documents
+            yield from _create_loader(file_path).lazy_load()
             
         except Exception as e:
             logger.error(f"Error extracting text from {file_path}: {e}")
@@ -112,10 +194,26 @@ class DocumentProcessor:
         Returns:
             List[Document]: List of chunked documents
         """
+        chunked_docs = list(self.chunk_documents_stream(documents))
+        logger.info(f"Split documents into {len(chunked_docs)} chunks")
+        return chunked_docs
+    
+    def chunk_documents_stream(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        Split documents into chunks one document at a time
+        
+        The splitter never carries overlap across documents, so this yields the same
+        chunks as chunk_documents without holding every page or chunk at once.
+        
+        Args:
+            documents: Documents to chunk, e.g. from extract_text_stream
+            
+        Yields:
+            Document: Chunked documents, in order
+        """
         try:
-            chunked_docs = self.text_splitter.split_documents(documents)
-            logger.info(f"Split documents into {len(chunked_docs)} chunks")
-            return chunked_docs
+            for document in documents:
+                yield from self.text_splitter.split_documents([document])
             
         except Exception as e:
             logger.error(f"Error chunking documents: {e}")
@@ -132,10 +230,11 @@ class DocumentProcessor:
         Returns:
             str: Unique document ID
         """
-        content_hash = hashlib.md5(content.encode()).hexdigest()
-        return f"{Path(filename).stem}_{content_hash[:8]}"
+        return f"{Path(filename).stem}_{_content_hash(content)}"
     
-    def prepare_metadata(self, document: Document, filename: str, chunk_index: int) -> Dict[str, Any]:
+    def prepare_metadata(self, document: Document, filename: str, chunk_index: int,
+                         upload_timestamp: Optional[str] = None,
+                         document_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Prepare metadata for document chunk
         
@@ -143,6 +242,8 @@ class DocumentProcessor:
             document: Document chunk
             filename: Original filename
             chunk_index: Index of the chunk
+            upload_timestamp: Precomputed upload time (defaults to now)
+            document_id: Precomputed document ID (defaults to generate_document_id)
             
         Returns:
             Dict[str, Any]: Metadata dictionary
@@ -151,8 +252,8 @@ class DocumentProcessor:
             "filename": filename,
             "chunk_index": chunk_index,
             "chunk_size": len(document.page_content),
-            "upload_timestamp": datetime.now().isoformat(),
-            "document_id": self.generate_document_id(document.page_content, filename)
+            "upload_timestamp": upload_timestamp or datetime.now().isoformat(),
+            "document_id": document_id or self.generate_document_id(document.page_content, filename)
         }
         
         # Add any existing metadata from document
@@ -161,6 +262,212 @@ class DocumentProcessor:
         
         return base_metadata
     
+    def _stream_chunks(self, file_path: str, category: str, document_ids: List[str]) -> Iterator[Document]:
+        """
+        Extract and chunk a file lazily, attaching storage metadata to each chunk
+        
+        Args:
+            file_path: Path to the document file
+            category: Category for the document
+            document_ids: List the chunks' document IDs are appended to as they are yielded
+            
+        Returns:
+            Iterator[Document]: Chunks ready for the vector store, in order
+        """
+        chunks = self.chunk_documents_stream(self.extract_text_stream(file_path))
+        return self._attach_metadata(chunks, file_path, category, document_ids)
+    
+    def _attach_metadata(self, chunks: Iterable[Document], file_path: str, category: str,
+                         document_ids: List[str]) -> Iterator[Document]:
+        """
+        Attach storage metadata to a file's chunks
+        
+        Args:
+            chunks: The file's chunks, in order
+            file_path: Path to the document file
+            category: Category for the document
+            document_ids: List the chunks' document IDs are appended to as they are yielded
+            
+        Yields:
+            Document: Chunks ready for the vector store, in order
+        """
+        path = Path(file_path)
+        filename = path.name
+        
+        # Per-file values are computed once
+        stem = path.stem
+        upload_timestamp = datetime.now().isoformat()
+        
+        for i, chunk in enumerate(chunks):
+            document_id = f"{stem}_{_content_hash(chunk.page_content)}"
+            document_ids.append(document_id)
+            
+            # Generate metadata
+            metadata = self.prepare_metadata(chunk, filename, i, upload_timestamp, document_id)
+            metadata["category"] = category.lower()  # matched exactly by query-time filters
+            
+            # Create new document with metadata
+            yield Document(page_content=chunk.page_content, metadata=metadata)
+    
+    @staticmethod
+    def _file_details(file_path: str, category: str, file_hash: Optional[str],
+                      document_ids: List[str]) -> Dict[str, Any]:
+        """File-level details shared by the prepared and streamed ingestion paths"""
+        if not document_ids:
+            raise ValueError("No content extracted from document")
+        
+        path = Path(file_path)
+        return {
+            "filename": path.name,
+            "category": category,
+            "file_size": os.path.getsize(file_path),
+            "file_type": path.suffix.lower(),
+            "file_hash": file_hash or _file_hash(file_path),
+            "document_ids": document_ids
+        }
+    
+    def _prepare_file(self, file_path: str, category: str, file_hash: Optional[str] = None,
+                      chunks: Optional[Iterable[Document]] = None) -> Dict[str, Any]:
+        """
+        Extract, chunk and attach metadata to a file, without touching any store
+        
+        Args:
+            file_path: Path to the document file
+            category: Category for the document
+            file_hash: Precomputed hash of the file's bytes (computed if omitted)
+            chunks: The file's chunks, if already extracted (e.g. by a worker process)
+            
+        Returns:
+            Dict[str, Any]: Prepared chunks, their document IDs and file details
+        """
+        document_ids: List[str] = []
+        if chunks is None:
+            processed_docs = list(self._stream_chunks(file_path, category, document_ids))
+        else:
+            processed_docs = list(self._attach_metadata(chunks, file_path, category, document_ids))
+        
+        prepared = self._file_details(file_path, category, file_hash, document_ids)
+        prepared["processed_docs"] = processed_docs
+        return prepared
+    
+    def _add_batch(self, docs: List[Document]) -> List[str]:
+        """
+        Add one batch to the vector store, retrying transient errors with jittered exponential backoff
+        
+        The IDs are fixed before the first attempt, so a retry after a partly applied write
+        overwrites the same vectors instead of adding duplicates.
+        """
+        ids = [str(uuid.uuid4()) for _ in docs]
+        return call_with_retries(self.vector_store.add_documents, docs, ids=ids, attempts=VECTOR_ADD_ATTEMPTS)
+    
+    def _add_to_vector_store(self, docs: List[Document]) -> List[str]:
+        """
+        Embed and store chunks in concurrent batches of VECTOR_BATCH_SIZE
+        
+        Args:
+            docs: Chunks to store
+            
+        Returns:
+            List[str]: Vector store IDs, in the same order as docs
+        """
+        batches = [docs[i:i + VECTOR_BATCH_SIZE] for i in range(0, len(docs), VECTOR_BATCH_SIZE)]
+        if len(batches) <= 1:
+            return self._add_batch(docs)
+        
+        # map() keeps batch order, so IDs line up with docs; it re-raises the first failure
+        with ThreadPoolExecutor(max_workers=min(VECTOR_MAX_WORKERS, len(batches))) as executor:
+            return [vector_id for ids in executor.map(self._add_batch, batches) for vector_id in ids]
+    
+    def _document_info(self, prepared: Dict[str, Any], vector_ids: List[str],
+                       upload_timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build the metadata record for a prepared file whose chunks are already in the vector store
+        
+        Args:
+            prepared: Output of _prepare_file
+            vector_ids: Vector store IDs of the file's chunks
+            upload_timestamp: Precomputed upload time (defaults to now)
+            
+        Returns:
+            Dict[str, Any]: Document metadata to save
+        """
+        return {
+            "filename": prepared["filename"],
+            "category": prepared["category"],
+            "total_chunks": len(prepared["document_ids"]),
+            "upload_timestamp": upload_timestamp or datetime.now().isoformat(),
+            "file_size": prepared["file_size"],
+            "file_type": prepared["file_type"],
+            "vector_ids": vector_ids,
+            "document_ids": prepared["document_ids"],
+            "file_hash": prepared["file_hash"]
+        }
+    
+    def _success_result(self, prepared: Dict[str, Any], metadata_id: str) -> Dict[str, Any]:
+        """Build a successful processing result"""
+        filename = prepared["filename"]
+        total_chunks = len(prepared["document_ids"])
+        
+        logger.info(f"Successfully processed document: {filename}")
+        return {
+            "success": True,
+            "filename": filename,
+            "chunks_created": total_chunks,
+            "metadata_id": metadata_id,
+            "message": f"Successfully processed {filename} into {total_chunks} chunks"
+        }
+    
+    def _store_prepared(self, prepared: Dict[str, Any], vector_ids: List[str]) -> Dict[str, Any]:
+        """
+        Save metadata for a prepared file whose chunks are already in the vector store
+        
+        Args:
+            prepared: Output of _prepare_file
+            vector_ids: Vector store IDs of the file's chunks
+            
+        Returns:
+            Dict[str, Any]: Processing results
+        """
+        metadata_id = self.metadata_db.create_document(self._document_info(prepared, vector_ids))
+        invalidate_knowledge_base_answers()
+        return self._success_result(prepared, metadata_id)
+    
+    def _find_ingested(self, file_path: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Hash a file and look up a previous ingestion of the same bytes
+        
+        Args:
+            file_path: Path to the document file
+            
+        Returns:
+            Tuple[str, Optional[Dict[str, Any]]]: The file hash and the existing metadata record, if any
+        """
+        file_hash = _file_hash(file_path)
+        return file_hash, self.metadata_db.get_document_by_hash(file_hash)
+    
+    def _duplicate_result(self, filename: str, existing: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the result for a file whose content was already ingested"""
+        logger.info(f"Skipping {filename}: identical to {existing.get('filename')} ({existing.get('id')})")
+        return {
+            "success": True,
+            "duplicate": True,
+            "filename": filename,
+            "chunks_created": existing.get("total_chunks", 0),
+            "metadata_id": existing.get("id"),
+            "message": f"{filename} was already processed as {existing.get('filename', filename)}; skipped"
+        }
+    
+    def _error_result(self, filename: str, error: Exception) -> Dict[str, Any]:
+        """Build a failed processing result"""
+        error_msg = f"Error processing {filename}: {str(error)}"
+        logger.error(error_msg)
+        return {
+            "success": False,
+            "filename": filename,
+            "error": error_msg,
+            "message": error_msg
+        }
+    
     def process_and_store(self, file_path: str, category: str = "general") -> Dict[str, Any]:
         """
         Process document and store in vector database
@@ -175,73 +482,73 @@ class DocumentProcessor:
         filename = Path(file_path).name
         
         try:
-            # Extract text from document
-            st.info(f"📄 Extracting text from {filename}...")
-            documents = self.extract_text(file_path)
-            
-            if not documents:
-                raise ValueError("No content extracted from document")
-            
-            # Chunk documents
-            st.info("✂️ Splitting document into chunks...")
-            chunked_docs = self.chunk_documents(documents)
+            # Identical bytes were embedded before: reuse that ingestion
+            file_hash, existing = self._find_ingested(file_path)
+            if existing:
+                return self._duplicate_result(filename, existing)
             
-            # Prepare documents for storage
-            processed_docs = []
-            document_ids = []
+            # Extract, chunk and store in windows of concurrent batches, so only one
+            # window of pages and chunks is held in memory rather than the whole file
+            st.info(f"📄 Extracting, chunking and embedding {filename}...")
+            document_ids: List[str] = []
+            chunks = self._stream_chunks(file_path, category, document_ids)
+            vector_ids: List[str] = []
+            while batch := list(islice(chunks, VECTOR_BATCH_SIZE * VECTOR_MAX_WORKERS)):
+                vector_ids.extend(self._add_to_vector_store(batch))
             
-            for i, chunk in enumerate(chunked_docs):
-                # Generate metadata
-                metadata = self.prepare_metadata(chunk, filename, i)
-                metadata["category"] = category
-                
-                # Create new document with metadata
-                processed_doc = Document(
-                    page_content=chunk.page_content,
-                    metadata=metadata
-                )
-                
-                processed_docs.append(processed_doc)
-                document_ids.append(metadata["document_id"])
-            
-            # Store in vector database
-            st.info("🔄 Generating embeddings and storing in vector database...")
-            vector_ids = self.vector_store.add_documents(processed_docs)
-            
-            # Store metadata in database
-            document_info = {
-                "filename": filename,
-                "category": category,
-                "total_chunks": len(processed_docs),
-                "upload_timestamp": datetime.now().isoformat(),
-                "file_size": os.path.getsize(file_path),
-                "file_type": Path(file_path).suffix.lower(),
-                "vector_ids": vector_ids,
-                "document_ids": document_ids
-            }
+            prepared = self._file_details(file_path, category, file_hash, document_ids)
+            return self._store_prepared(prepared, vector_ids)
             
-            # Save to metadata database
-            metadata_id = self.metadata_db.create_document(document_info)
+        except Exception as e:
+            return self._error_result(filename, e)
+    
+    @staticmethod
+    def _save_upload(uploaded_file: Any, directory: str) -> str:
+        """
+        Stream an uploaded file to disk under its original name
+        
+        Args:
+            uploaded_file: Streamlit uploaded file
+            directory: Directory to write into, used for this file only (so concurrent
+                uploads with the same name never collide)
             
-            result = {
-                "success": True,
-                "filename": filename,
-                "chunks_created": len(processed_docs),
-                "metadata_id": metadata_id,
-                "message": f"Successfully processed {filename} into {len(processed_docs)} chunks"
-            }
+        Returns:
+            str: Path of the saved file
+        """
+        file_path = os.path.join(directory, uploaded_file.name)
+        uploaded_file.seek(0)
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, length=UPLOAD_COPY_CHUNK)
+        return file_path
+    
+    def process_uploaded_file(self, uploaded_file: Any, category: str = "general") -> Dict[str, Any]:
+        """
+        Process a single uploaded file from Streamlit (reports progress with st.info, so call it
+        from the script thread)
+        
+        Args:
+            uploaded_file: Streamlit uploaded file
+            category: Category for the document
             
-            logger.info(f"Successfully processed document: {filename}")
-            return result
+        Returns:
+            Dict[str, Any]: Processing result for the file
+        """
+        upload_dir = "uploads"
+        os.makedirs(upload_dir, exist_ok=True)
+        
+        try:
+            # Save uploaded file temporarily; the directory is removed even if processing fails
+            with tempfile.TemporaryDirectory(dir=upload_dir) as tmp_dir:
+                file_path = self._save_upload(uploaded_file, tmp_dir)
+                return self.process_and_store(file_path, category)
             
         except Exception as e:
-            error_msg = f"Error processing {filename}: {str(e)}"
-            logger.error(error_msg)
+            logger.error(f"Error processing uploaded file {uploaded_file.name}: {e}")
             return {
                 "success": False,
-                "filename": filename,
-                "error": error_msg,
-                "message": error_msg
+                "filename": uploaded_file.name,
+                "error": str(e),
+                "message": f"Failed to process {uploaded_file.name}: {str(e)}"
             }
     
     def process_uploaded_files(self, uploaded_files: List[Any], category: str = "general") -> List[Dict[str, Any]]:
@@ -255,33 +562,150 @@ class DocumentProcessor:
         Returns:
             List[Dict[str, Any]]: Processing results for each file
         """
-        results = []
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        # The vector store invalidates its search caches once for the whole upload
+        with self.vector_store.bulk_ingest():
+            return [self.process_uploaded_file(uploaded_file, category) for uploaded_file in uploaded_files]
+    
+    def process_uploaded_files_batched(self, uploaded_files: List[Any], category: str = "general",
+                                       batch_size: int = 1024, max_workers: int = 8,
+                                       progress_callback: Optional[Callable[[float, str], None]] = None
+                                       ) -> List[Dict[str, Any]]:
+        """
+        Process uploaded files, embedding chunks from all files together in large batches
         
-        for uploaded_file in uploaded_files:
-            try:
-                # Save uploaded file temporarily
-                file_path = os.path.join(upload_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
-                # Process the file
-                result = self.process_and_store(file_path, category)
-                results.append(result)
-                
-                # Clean up temporary file
-                os.remove(file_path)
+        Files are saved and hashed on threads, then extracted and chunked in parallel worker
+        processes (parsing is CPU-bound); their chunks are pooled and sent to the vector
+        store batch_size at a time (each step split into concurrent VECTOR_BATCH_SIZE calls),
+        so K small files don't cost at least K sequential embedding round-trips.
+        
+        Args:
+            uploaded_files: List of Streamlit uploaded files
+            category: Category for the documents
+            batch_size: Maximum chunks stored per progress step
+            max_workers: Maximum files parsed at once
+            progress_callback: Optional callable receiving (fraction_done, status_text)
+            
+        Returns:
+            List[Dict[str, Any]]: Processing results for each file, in upload order
+        """
+        report = progress_callback or (lambda fraction, text: None)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(uploaded_files)
+        prepared_files = []
+        copies: List[Tuple[int, int]] = []  # (index of a repeated file, index of its first copy)
+        workers = max(1, min(max_workers, len(uploaded_files)))
+        
+        # Worker processes are spawned, not forked: forking the threaded Streamlit server
+        # can copy locks held by other threads. A single file is parsed in-process, since
+        # starting an interpreter would cost more than it saves
+        if len(uploaded_files) > 1:
+            parser = ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1),
+                                         mp_context=multiprocessing.get_context("spawn"))
+        else:
+            parser = ThreadPoolExecutor(max_workers=1)
+        
+        with tempfile.TemporaryDirectory() as upload_dir:
+            def save(uploaded_file):
+                """(path, hash, None), or (None, None, duplicate result) for already ingested content"""
+                file_path = self._save_upload(uploaded_file, tempfile.mkdtemp(dir=upload_dir))
+                file_hash, existing = self._find_ingested(file_path)
+                if existing:
+                    return None, None, self._duplicate_result(uploaded_file.name, existing)
+                if not self.validate_file(file_path):
+                    raise ValueError(f"Invalid file: {file_path}")
+                return file_path, file_hash, None
+            
+            # Stage 1: save every file, then parse and chunk them in parallel (half of the
+            # progress bar); the pools shut down before the upload directory is removed
+            with ThreadPoolExecutor(max_workers=workers) as executor, parser:
+                saves = {executor.submit(save, f): idx for idx, f in enumerate(uploaded_files)}
+                chunkings = {}
+                first_by_hash: Dict[str, int] = {}
+                done = 0
+                for future in as_completed(saves):
+                    idx = saves[future]
+                    try:
+                        file_path, file_hash, duplicate = future.result()
+                        if duplicate:
+                            results[idx] = duplicate
+                            done += 1
+                        elif file_hash in first_by_hash:
+                            # Same content twice in this upload: only the first copy saved is
+                            # processed, the others get its result once it is stored (stage 3)
+                            copies.append((idx, first_by_hash[file_hash]))
+                            done += 1
+                        else:
+                            first_by_hash[file_hash] = idx
+                            chunkings[parser.submit(_chunk_file, file_path)] = (idx, file_path, file_hash)
+                    except Exception as e:
+                        results[idx] = self._error_result(uploaded_files[idx].name, e)
+                        done += 1
                 
+                for future in as_completed(chunkings):
+                    idx, file_path, file_hash = chunkings[future]
+                    try:
+                        prepared_files.append((idx, self._prepare_file(file_path, category, file_hash,
+                                                                       chunks=future.result())))
+                    except Exception as e:
+                        results[idx] = self._error_result(uploaded_files[idx].name, e)
+                    done += 1
+                    report(0.5 * done / len(uploaded_files), f"Parsed {done} of {len(uploaded_files)} files")
+        
+        # Stage 2: embed and store all chunks together, batch_size at a time
+        prepared_files.sort(key=lambda item: item[0])
+        all_docs = [doc for _, prepared in prepared_files for doc in prepared["processed_docs"]]
+        all_vector_ids: List[str] = []
+        batch_error: Optional[Exception] = None
+        
+        with self.vector_store.bulk_ingest():
+            for start in range(0, len(all_docs), batch_size):
+                try:
+                    all_vector_ids.extend(self._add_to_vector_store(all_docs[start:start + batch_size]))
+                except Exception as e:
+                    batch_error = e
+                    break
+                stored = min(start + batch_size, len(all_docs))
+                report(0.5 + 0.5 * stored / len(all_docs), f"Embedded {stored} of {len(all_docs)} chunks")
+        
+        # Stage 3: hand each file its slice of vector IDs and record all metadata in one bulk
+        # write; files whose chunks did not all make it into the store are reported as failed
+        stored_files = []
+        offset = 0
+        for idx, prepared in prepared_files:
+            end = offset + len(prepared["processed_docs"])
+            if end > len(all_vector_ids):
+                results[idx] = self._error_result(
+                    prepared["filename"], batch_error or RuntimeError("Vector store returned too few IDs")
+                )
+            else:
+                stored_files.append((idx, prepared, all_vector_ids[offset:end]))
+            offset = end
+        
+        if stored_files:
+            try:
+                upload_timestamp = datetime.now().isoformat()
+                metadata_ids = self.metadata_db.create_documents_bulk([
+                    self._document_info(prepared, vector_ids, upload_timestamp)
+                    for _, prepared, vector_ids in stored_files
+                ])
+                invalidate_knowledge_base_answers()
+                for (idx, prepared, _), metadata_id in zip(stored_files, metadata_ids):
+                    results[idx] = self._success_result(prepared, metadata_id)
             except Exception as e:
-                error_result = {
-                    "success": False,
-                    "filename": uploaded_file.name,
-                    "error": str(e),
-                    "message": f"Failed to process {uploaded_file.name}: {str(e)}"
-                }
-                results.append(error_result)
-                logger.error(f"Error processing uploaded file {uploaded_file.name}: {e}")
+                for idx, prepared, _ in stored_files:
+                    results[idx] = self._error_result(prepared["filename"], e)
+        
+        for idx, first_idx in copies:
+            first = results[first_idx]
+            if first.get("success"):
+                results[idx] = self._duplicate_result(uploaded_files[idx].name, {
+                    "filename": first["filename"],
+                    "total_chunks": first.get("chunks_created", 0),
+                    "id": first.get("metadata_id")
+                })
+            else:
+                results[idx] = self._error_result(
+                    uploaded_files[idx].name, RuntimeError(f"identical to {first['filename']}, which failed")
+                )
         
         return results
     
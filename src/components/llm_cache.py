@@ -0,0 +1,248 @@
+"""
+LLM Response Cache Module
+Two-tier cache (exact match + semantic similarity) for repeated questions
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+import weakref
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "./.cache/llm"
+
+# Query mode under which knowledge base answers are cached (fast_main); they go stale
+# whenever documents are ingested, see invalidate_knowledge_base_answers
+KB_ANSWER_MODE = "fast"
+
+# Live caches in this process, so ingestion can drop their knowledge base answers
+_instances: "weakref.WeakSet[LLMCache]" = weakref.WeakSet()
+
+
+class LLMCache:
+    """
+    Cache answers keyed on (query_mode, question) with an optional embedding-similarity fallback
+
+    Entries expire ttl seconds after they are stored, in memory and on disk. The semantic
+    tier is a fixed [maxsize, dim] matrix used as a ring buffer, so it stays bounded and an
+    insert is O(1); a row whose entry was evicted or expired simply misses.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, maxsize: int = 512, ttl: float = 600.0,
+                 similarity_threshold: float = 0.92,
+                 embed_fn: Optional[Callable[[str], Optional[List[float]]]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn if NUMPY_AVAILABLE else None
+        self.stats = {"hits": 0, "misses": 0}
+
+        self._lock = threading.Lock()
+        # key -> (expiry wall-clock time, query mode, response); wall-clock like diskcache's expiry
+        self._memory: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+
+        # Semantic tier: unit-length question embeddings, each row tagged with its key and mode
+        self._matrix = None  # [maxsize, dim] float32, allocated on first insert
+        self._row_keys: List[Optional[str]] = [None] * maxsize
+        self._row_modes = np.full(maxsize, -1, dtype=np.int32) if NUMPY_AVAILABLE else None
+        self._mode_ids: Dict[str, int] = {}
+        self._next_row = 0
+        self._rows_used = 0
+
+        # Persist across Streamlit reloads when diskcache is installed
+        self._disk = None
+        if DISKCACHE_AVAILABLE:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                self._disk = diskcache.Cache(cache_dir)
+            except Exception as e:
+                logger.warning(f"Disk cache unavailable, using memory only: {str(e)}")
+
+        _instances.add(self)
+
+    @staticmethod
+    def make_key(question: str, query_mode: str) -> str:
+        """Build the exact-match cache key"""
+        payload = json.dumps({"mode": query_mode, "q": question.strip()}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, query_mode: str) -> Optional[Dict[str, Any]]:
+        """Return a cached response for the question, or None on a miss"""
+        return self.lookup(question, query_mode)[0]
+
+    def lookup(self, question: str, query_mode: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """
+        Return (cached response or None, question embedding or None)
+
+        The embedding is computed only when the semantic tier had to be searched; pass it
+        back to set() after a miss so the question is not embedded twice.
+        """
+        key = self.make_key(question, query_mode)
+        vector = None
+
+        hit = self._get_exact(key)
+        if hit is None and self.embed_fn:
+            vector = self._embed(question)
+            if vector is not None:
+                hit = self._get_semantic(vector, query_mode)
+
+        with self._lock:
+            self.stats["hits" if hit is not None else "misses"] += 1
+        return hit, vector
+
+    def set(self, question: str, query_mode: str, response: Dict[str, Any],
+            ttl: Optional[float] = None, vector: Any = None):
+        """
+        Store a response for ttl seconds (default self.ttl); failed responses are never cached
+
+        vector is the question's embedding from lookup(), if it computed one.
+        """
+        if not response or not response.get("success"):
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        key = self.make_key(question, query_mode)
+        self._remember(key, query_mode, response, time.time() + ttl)
+
+        if self._disk is not None:
+            try:
+                self._disk.set(key, response, expire=ttl, tag=query_mode)
+            except Exception as e:
+                logger.warning(f"Failed to write disk cache entry: {str(e)}")
+
+        if self.embed_fn:
+            if vector is None:
+                vector = self._embed(question)
+            if vector is not None:
+                self._add_row(key, query_mode, vector)
+
+    def clear(self, query_mode: Optional[str] = None):
+        """Drop every cached entry (or only those of one query mode); a full clear resets statistics"""
+        with self._lock:
+            if query_mode is None:
+                self._memory.clear()
+                self._row_keys = [None] * self.maxsize
+                if self._row_modes is not None:
+                    self._row_modes.fill(-1)
+                self.stats = {"hits": 0, "misses": 0}
+            else:
+                for key in [key for key, entry in self._memory.items() if entry[1] == query_mode]:
+                    del self._memory[key]
+                mode_id = self._mode_ids.get(query_mode)
+                if mode_id is not None:
+                    self._row_modes[self._row_modes == mode_id] = -1
+
+        if self._disk is not None:
+            try:
+                if query_mode is None:
+                    self._disk.clear()
+                else:
+                    self._disk.evict(query_mode)
+            except Exception as e:
+                logger.warning(f"Failed to clear disk cache: {str(e)}")
+
+    def _remember(self, key: str, query_mode: str, response: Dict[str, Any], expires_at: float):
+        """Insert into the in-memory LRU tier"""
+        with self._lock:
+            self._memory[key] = (expires_at, query_mode, response)
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def _get_exact(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up the in-memory tier first, then disk"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._memory.move_to_end(key)
+                    return entry[2]
+                del self._memory[key]
+
+        if self._disk is not None:
+            response, expires_at, query_mode = self._disk.get(key, expire_time=True, tag=True)
+            if response is not None:
+                self._remember(key, query_mode, response, expires_at or time.time() + self.ttl)
+                return response
+        return None
+
+    def _add_row(self, key: str, query_mode: str, vector):
+        """Write an embedding into the next ring-buffer row, overwriting the oldest when full"""
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+                self._row_modes.fill(-1)
+                self._next_row = self._rows_used = 0
+
+            row = self._next_row
+            self._matrix[row] = vector
+            self._row_keys[row] = key
+            self._row_modes[row] = self._mode_ids.setdefault(query_mode, len(self._mode_ids))
+            self._next_row = (row + 1) % self.maxsize
+            self._rows_used = max(self._rows_used, row + 1)
+
+    def _get_semantic(self, vector, query_mode: str) -> Optional[Dict[str, Any]]:
+        """Return the answer of the most similar cached question above the threshold"""
+        with self._lock:
+            mode_id = self._mode_ids.get(query_mode)
+            if self._matrix is None or mode_id is None:
+                return None
+
+            # Rows are unit-normalized, so the dot product is the cosine similarity
+            scores = self._matrix[:self._rows_used] @ vector
+            scores[self._row_modes[:self._rows_used] != mode_id] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            key = self._row_keys[best]
+        return self._get_exact(key)
+
+    def _embed(self, text: str):
+        """Embed and L2-normalize text, returning None if embedding fails"""
+        try:
+            raw = self.embed_fn(text)
+        except Exception as e:
+            logger.warning(f"Embedding for semantic cache failed: {str(e)}")
+            return None
+        if not raw:
+            return None
+
+        vector = np.asarray(raw, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+
+def invalidate_knowledge_base_answers(cache_dir: str = DEFAULT_CACHE_DIR):
+    """
+    Drop cached knowledge base answers after the document set changed
+
+    Clears them from every cache in this process and from the shared disk cache; memory
+    tiers of other processes keep theirs until the TTL runs out.
+    """
+    for cache in list(_instances):
+        cache.clear(KB_ANSWER_MODE)
+
+    if DISKCACHE_AVAILABLE and os.path.isdir(cache_dir):
+        try:
+            with diskcache.Cache(cache_dir) as disk:
+                disk.evict(KB_ANSWER_MODE)
+        except Exception as e:
+            logger.warning(f"Failed to clear cached knowledge base answers: {str(e)}")
@@ -4,23 +4,39 @@ Handles loading and configuration of different LLM models (OpenAI GPT, Claude, G
 """
 
 import os
+import atexit
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import threading
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
 from abc import ABC, abstractmethod
 
-from langchain_openai import OpenAI, ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_google_genai import ChatGoogleGenerativeAI
+import httpx
 from langchain_core.language_models import BaseLanguageModel
 
+# Provider SDKs (langchain_openai, langchain_anthropic, langchain_google_genai) are imported
+# by the model classes that use them, so only the configured provider is ever loaded
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# One keep-alive connection pool for every OpenAI client in the process (chat models and
+# embeddings), so calls after the first skip the TCP/TLS handshake to api.openai.com
+_http_client = httpx.Client(
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    timeout=60
+)
+atexit.register(_http_client.close)
+
 
 class ModelInterface(ABC):
     """Abstract interface for language model implementations"""
     
+    __slots__ = ()
+    
     @abstractmethod
     def get_model(self) -> BaseLanguageModel:
         """Get the language model instance"""
@@ -35,6 +51,8 @@ class ModelInterface(ABC):
 class OpenAIModel(ModelInterface):
     """OpenAI GPT model implementation"""
     
+    __slots__ = ("api_key", "model_name", "temperature", "model")
+    
     def __init__(self, api_key: str, model_name: str = "gpt-3.5-turbo", temperature: float = 0.0):
         """
         Initialize OpenAI model
@@ -48,14 +66,13 @@ class OpenAIModel(ModelInterface):
         self.model_name = model_name
         self.temperature = temperature
         
-        # Set API key
-        os.environ["OPENAI_API_KEY"] = api_key
-        
         # Initialize model based on type
+        from langchain_openai import ChatOpenAI
         self.model = ChatOpenAI(
             model_name=model_name,
             temperature=temperature,
-            api_key=api_key
+            api_key=api_key,
+            http_client=_http_client
         )
         
         logger.info(f"Initialized OpenAI model: {model_name}")
@@ -72,6 +89,8 @@ class OpenAIModel(ModelInterface):
 class ClaudeModel(ModelInterface):
     """Anthropic Claude model implementation"""
     
+    __slots__ = ("api_key", "model_name", "temperature", "model")
+    
     def __init__(self, api_key: str, model_name: str = "claude-2", temperature: float = 0.0):
         """
         Initialize Claude model
@@ -85,10 +104,8 @@ class ClaudeModel(ModelInterface):
         self.model_name = model_name
         self.temperature = temperature
         
-        # Set API key
-        os.environ["ANTHROPIC_API_KEY"] = api_key
-        
         # Initialize model
+        from langchain_anthropic import ChatAnthropic
         self.model = ChatAnthropic(
             model=model_name,
             temperature=temperature,
@@ -109,6 +126,8 @@ class ClaudeModel(ModelInterface):
 class GeminiModel(ModelInterface):
     """Google Gemini model implementation"""
     
+    __slots__ = ("api_key", "model_name", "temperature", "model")
+    
     def __init__(self, api_key: str, model_name: str = "gemini-pro", temperature: float = 0.0):
         """
         Initialize Gemini model
@@ -122,10 +141,8 @@ class GeminiModel(ModelInterface):
         self.model_name = model_name
         self.temperature = temperature
         
-        # Set API key
-        os.environ["GOOGLE_API_KEY"] = api_key
-        
         # Initialize model
+        from langchain_google_genai import ChatGoogleGenerativeAI
         self.model = ChatGoogleGenerativeAI(
             model=model_name,
             temperature=temperature,
@@ -146,30 +163,31 @@ class GeminiModel(ModelInterface):
 class ModelFactory:
     """Factory class to create model instances"""
     
-    # Model configurations
+    # Created models, keyed by (provider, model name, temperature, API key digest) so repeated
+    # calls share one warm client; the digest keeps raw keys out of the cache
+    MODEL_CACHE_SIZE = 32
+    _model_cache: "OrderedDict[Tuple[str, str, float, str], ModelInterface]" = OrderedDict()
+    _model_cache_lock = threading.Lock()
+    
+    # Model configurations: (provider, model name) -> (model class, default temperature)
     MODEL_CONFIGS = {
-        "openai": {
-            "gpt-3.5-turbo": {"class": OpenAIModel, "default_temp": 0.0},
-            "gpt-4": {"class": OpenAIModel, "default_temp": 0.0},
-            "gpt-4-turbo": {"class": OpenAIModel, "default_temp": 0.0},
-            "text-davinci-003": {"class": OpenAIModel, "default_temp": 0.0},
-        },
-        "claude": {
-            "claude-2": {"class": ClaudeModel, "default_temp": 0.0},
-            "claude-3-sonnet": {"class": ClaudeModel, "default_temp": 0.0},
-            "claude-3-opus": {"class": ClaudeModel, "default_temp": 0.0},
-            "claude-instant": {"class": ClaudeModel, "default_temp": 0.0},
-        },
-        "gemini": {
-            "gemini-pro": {"class": GeminiModel, "default_temp": 0.0},
-            "gemini-pro-vision": {"class": GeminiModel, "default_temp": 0.0},
-        }
+        ("openai", "gpt-3.5-turbo"): (OpenAIModel, 0.0),
+        ("openai", "gpt-4"): (OpenAIModel, 0.0),
+        ("openai", "gpt-4-turbo"): (OpenAIModel, 0.0),
+        ("openai", "text-davinci-003"): (OpenAIModel, 0.0),
+        ("claude", "claude-2"): (ClaudeModel, 0.0),
+        ("claude", "claude-3-sonnet"): (ClaudeModel, 0.0),
+        ("claude", "claude-3-opus"): (ClaudeModel, 0.0),
+        ("claude", "claude-instant"): (ClaudeModel, 0.0),
+        ("gemini", "gemini-pro"): (GeminiModel, 0.0),
+        ("gemini", "gemini-pro-vision"): (GeminiModel, 0.0),
     }
     
     @staticmethod
     def create_model(provider: str, model_name: str, api_key: str, temperature: Optional[float] = None) -> ModelInterface:
         """
-        Create model instance based on provider and model name
+        Create model instance based on provider and model name, reusing a cached instance
+        for the same provider, model, temperature and API key
         
         Args:
             provider: Model provider ('openai', 'claude', 'gemini')
@@ -182,39 +200,49 @@ class ModelFactory:
         """
         provider = provider.lower()
         
-        if provider not in ModelFactory.MODEL_CONFIGS:
-            raise ValueError(f"Unsupported provider: {provider}")
-        
-        provider_config = ModelFactory.MODEL_CONFIGS[provider]
-        
-        if model_name not in provider_config:
+        model_config = ModelFactory.MODEL_CONFIGS.get((provider, model_name))
+        if model_config is None:
+            if all(known != provider for known, _ in ModelFactory.MODEL_CONFIGS):
+                raise ValueError(f"Unsupported provider: {provider}")
             raise ValueError(f"Unsupported model {model_name} for provider {provider}")
         
-        model_config = provider_config[model_name]
-        model_class = model_config["class"]
+        model_class, default_temp = model_config
         
         if temperature is None:
-            temperature = model_config["default_temp"]
+            temperature = default_temp
         
-        return model_class(
-            api_key=api_key,
-            model_name=model_name,
-            temperature=temperature
-        )
+        key = (provider, model_name, temperature, hashlib.blake2b(api_key.encode(), digest_size=8).hexdigest())
+        with ModelFactory._model_cache_lock:
+            model = ModelFactory._model_cache.get(key)
+            if model is None:
+                model = model_class(
+                    api_key=api_key,
+                    model_name=model_name,
+                    temperature=temperature
+                )
+                ModelFactory._model_cache[key] = model
+                if len(ModelFactory._model_cache) > ModelFactory.MODEL_CACHE_SIZE:
+                    ModelFactory._model_cache.popitem(last=False)
+            else:
+                ModelFactory._model_cache.move_to_end(key)
+            return model
     
     @staticmethod
     def get_available_models() -> Dict[str, list]:
         """Get all available models grouped by provider"""
-        return {
-            provider: list(models.keys())
-            for provider, models in ModelFactory.MODEL_CONFIGS.items()
-        }
+        models = defaultdict(list)
+        for provider, model_name in ModelFactory.MODEL_CONFIGS:
+            models[provider].append(model_name)
+        return dict(models)
 
 
+@lru_cache(maxsize=1)
 def get_model() -> ModelInterface:
     """
     Get configured model instance based on environment variables
     
+    The instance is created once per process and shared by every QueryEngine.
+    
     Returns:
         ModelInterface: Configured model instance
     """
@@ -248,12 +276,13 @@ def get_model() -> ModelInterface:
     )
 
 
+@lru_cache(maxsize=1)
 def get_embedding_model():
-    """Get embedding model for vector store operations"""
+    """Get embedding model for vector store operations (one shared instance per process)"""
     from langchain_openai import OpenAIEmbeddings
     
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY is required for embeddings")
     
-    return OpenAIEmbeddings(api_key=api_key)
\ No newline at end of file
+    return OpenAIEmbeddings(api_key=api_key, http_client=_http_client)
\ No newline at end of file
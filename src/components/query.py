@@ -4,13 +4,18 @@ Handles the RAG (Retrieval-Augmented Generation) pipeline for answering question
 """
 
 import os
+import atexit
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Generator, Iterator
 
 from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
 
+from .retry import call_with_retries, acall_with_retries
+from .ttl_cache import TTLCache
 from .vector_store import get_vector_store
 from .model_loader import get_model
 from .firebase_db import get_metadata_db
@@ -19,21 +24,73 @@ from .firebase_db import get_metadata_db
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Query logging is optional, so it runs off the response path; shutdown at exit waits for
+# queued entries so none are lost
+_log_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="query-log")
+atexit.register(_log_pool.shutdown)
+
+
+# Static query suggestions; get_query_suggestions returns copies so callers may modify them
+_BASE_SUGGESTIONS = (
+    "What are the company policies?",
+    "How do I submit a vacation request?",
+    "What are the working hours?",
+    "What is the dress code policy?",
+    "How do I access company resources?",
+    "What are the benefits provided?",
+    "How do I report an issue?",
+    "What is the remote work policy?",
+    "How do I get IT support?",
+    "What are the safety protocols?"
+)
+
+_CATEGORY_SUGGESTIONS = {
+    "hr": (
+        "What is the hiring process?",
+        "How do I update my personal information?",
+        "What is the performance review process?",
+        "How do I request time off?",
+        "What are the employee benefits?"
+    ),
+    "policies": (
+        "What is the code of conduct?",
+        "What is the data privacy policy?",
+        "What are the security guidelines?",
+        "What is the expense reimbursement policy?",
+        "What is the travel policy?"
+    ),
+    "sops": (
+        "How do I perform system maintenance?",
+        "What is the incident response procedure?",
+        "How do I deploy new software?",
+        "What is the backup procedure?",
+        "How do I handle customer complaints?"
+    )
+}
+
+
+def _log_failure(future) -> None:
+    """Report query log writes that failed"""
+    if future.exception() is not None:
+        logger.warning(f"Failed to log query: {future.exception()}")
+
 
 class QueryEngine:
     """Handles question answering using RAG pipeline"""
     
-    def __init__(self):
-        """Initialize query engine with dependencies"""
-        self.vector_store = get_vector_store()
-        self.llm_model = get_model()
-        self.metadata_db = get_metadata_db()
-        
-        # Initialize the language model
-        self.llm = self.llm_model.get_model()
-        
-        # Default prompt template for QA
-        self.qa_prompt_template = """
+    # Engines are long-lived and their attributes fixed; prompts are class attributes
+    __slots__ = ("vector_store", "llm_model", "metadata_db", "llm", "_model_name")
+    
+    # Retrieval results shared by every engine, keyed by (vector store generation, normalized
+    # query, k, category), so repeated questions skip the embedding call and the vector search
+    # and any write to the store makes older entries unreachable
+    _retrieval_cache = TTLCache(maxsize=1024, ttl=300)
+    
+    # Citation previews show at most this many characters of a chunk
+    PREVIEW_LENGTH = 200
+    
+    # Default prompt template for QA, built once and shared by every engine
+    qa_prompt_template = """
 Use the following pieces of context to answer the human's question. 
 If you don't know the answer based on the provided context, just say that you don't know, don't try to make up an answer.
 
@@ -43,12 +100,29 @@ Context:
 Question: {question}
 
 Helpful Answer:"""
+    
+    # Create prompt template; answers are formatted with the bound str.format directly,
+    # which gives the same text without PromptTemplate's per-call validation
+    prompt = PromptTemplate(
+        template=qa_prompt_template,
+        input_variables=["context", "question"]
+    )
+    _format_prompt = qa_prompt_template.format
+    
+    def __init__(self):
+        """
+        Initialize query engine with dependencies
         
-        # Create prompt template
-        self.prompt = PromptTemplate(
-            template=self.qa_prompt_template,
-            input_variables=["context", "question"]
-        )
+        The vector store, model and metadata database are process-wide singletons and the
+        prompts are class attributes, so creating an engine does no setup work of its own.
+        """
+        self.vector_store = get_vector_store()
+        self.llm_model = get_model()
+        self.metadata_db = get_metadata_db()
+        
+        # Initialize the language model; its name is fixed, so it is read once for every response
+        self.llm = self.llm_model.get_model()
+        self._model_name = self.llm_model.get_model_name()
         
         logger.info("Initialized QueryEngine")
     
@@ -65,23 +139,66 @@ Helpful Answer:"""
             List[Document]: Retrieved documents
         """
         try:
-            # Get documents from vector store
-            documents = self.vector_store.similarity_search(query, k=k)
+            cache_key, cached = self._cached_retrieval(query, k, category_filter)
+            if cached is not None:
+                return cached
             
-            # Filter by category if specified
-            if category_filter:
-                documents = [
-                    doc for doc in documents 
-                    if doc.metadata.get('category', '').lower() == category_filter.lower()
-                ]
+            documents = call_with_retries(
+                self.vector_store.similarity_search, query, k=k, filter=self._category_filter(category_filter)
+            )
+            return self._store_retrieval(cache_key, documents)
+            
+        except Exception as e:
+            logger.error(f"Error retrieving documents: {e}")
+            return []
+    
+    async def aretrieve_documents(self, query: str, k: int = 5,
+                                  category_filter: Optional[str] = None) -> List[Document]:
+        """Async variant of retrieve_documents(), sharing its cache"""
+        try:
+            cache_key, cached = self._cached_retrieval(query, k, category_filter)
+            if cached is not None:
+                return cached
             
-            logger.info(f"Retrieved {len(documents)} relevant documents")
-            return documents
+            documents = await acall_with_retries(
+                self.vector_store.asimilarity_search, query, k=k, filter=self._category_filter(category_filter)
+            )
+            return self._store_retrieval(cache_key, documents)
             
         except Exception as e:
             logger.error(f"Error retrieving documents: {e}")
             return []
     
+    @staticmethod
+    def _category_filter(category_filter: Optional[str]) -> Optional[Dict[str, str]]:
+        """
+        Metadata filter for a category; it is applied during the search (categories are
+        stored lowercase), so k matching documents come back
+        """
+        return {"category": category_filter.lower()} if category_filter else None
+    
+    def _cached_retrieval(self, query: str, k: int,
+                          category_filter: Optional[str]) -> Tuple[Tuple, Optional[List[Document]]]:
+        """The retrieval cache key for a query and a copy of its cached documents, if any"""
+        cache_key = (self.vector_store.generation, query.lower().strip(), k, category_filter)
+        cached = self._retrieval_cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        
+        logger.info(f"Retrieved {len(cached)} relevant documents (cached)")
+        return cache_key, list(cached)
+    
+    def _store_retrieval(self, cache_key: Tuple, documents: List[Document]) -> List[Document]:
+        """Cache freshly retrieved documents and return a copy for the caller"""
+        self._retrieval_cache.set(cache_key, documents)
+        logger.info(f"Retrieved {len(documents)} relevant documents")
+        return list(documents)
+    
+    @classmethod
+    def invalidate_cache(cls):
+        """Drop cached retrieval results (e.g. after the vector store was changed externally)"""
+        cls._retrieval_cache.clear()
+    
     def format_context(self, documents: List[Document]) -> str:
         """
         Format retrieved documents into context string
@@ -92,18 +209,41 @@ Helpful Answer:"""
         Returns:
             str: Formatted context string
         """
+        return self._build_context_and_citations(documents)[0]
+    
+    def _build_context_and_citations(self, documents: List[Document]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Format the context string and extract citations in one pass over the documents
+        
+        Args:
+            documents: List of retrieved documents
+            
+        Returns:
+            Tuple[str, List[Dict[str, Any]]]: Formatted context string and citation information
+        """
         if not documents:
-            return "No relevant context found."
+            return "No relevant context found.", []
         
         context_parts = []
-        for i, doc in enumerate(documents):
-            filename = doc.metadata.get('filename', 'Unknown')
-            chunk_index = doc.metadata.get('chunk_index', 0)
+        citations = []
+        preview_length = self.PREVIEW_LENGTH
+        for i, doc in enumerate(documents, 1):
+            metadata = doc.metadata
+            content = doc.page_content
+            filename = metadata.get('filename', 'Unknown')
+            chunk_index = metadata.get('chunk_index', 0)
             
-            context_part = f"[Source {i+1}: {filename} (chunk {chunk_index})]\n{doc.page_content}\n"
-            context_parts.append(context_part)
+            context_parts.append(f"[Source {i}: {filename} (chunk {chunk_index})]\n{content}\n")
+            citations.append({
+                "source_number": i,
+                "filename": filename,
+                "chunk_index": chunk_index,
+                "category": metadata.get('category', 'general'),
+                "upload_timestamp": metadata.get('upload_timestamp', 'Unknown'),
+                "content_preview": f"{content[:preview_length]}..." if len(content) > preview_length else content
+            })
         
-        return "\n".join(context_parts)
+        return "\n".join(context_parts), citations
     
     def generate_answer(self, query: str, context: str) -> str:
         """
@@ -118,26 +258,70 @@ Helpful Answer:"""
         """
         try:
             # Format prompt with context and question
-            formatted_prompt = self.prompt.format(context=context, question=query)
+            formatted_prompt = self._format_prompt(context=context, question=query)
             
-            # Generate response
-            response = self.llm.invoke(formatted_prompt)
+            # Generate response (only this call is retried, not the retrieval before it)
+            response = call_with_retries(self.llm.invoke, formatted_prompt)
+            
+            logger.info("Generated answer successfully")
+            return self._response_text(response)
             
-            # Extract text from response (handling different response formats)
-            if hasattr(response, 'content'):
-                answer = response.content
-            elif isinstance(response, str):
-                answer = response
-            else:
-                answer = str(response)
+        except Exception as e:
+            logger.error(f"Error generating answer: {e}")
+            return f"Sorry, I encountered an error while generating the answer: {str(e)}"
+    
+    async def agenerate_answer(self, query: str, context: str) -> str:
+        """Async variant of generate_answer()"""
+        try:
+            response = await acall_with_retries(self.llm.ainvoke, self._format_prompt(context=context, question=query))
             
             logger.info("Generated answer successfully")
-            return answer.strip()
+            return self._response_text(response)
             
         except Exception as e:
             logger.error(f"Error generating answer: {e}")
             return f"Sorry, I encountered an error while generating the answer: {str(e)}"
     
+    @staticmethod
+    def _raw_text(response: Any) -> str:
+        """Text of an LLM response or stream chunk; chat models (the common case) return messages"""
+        try:
+            return response.content
+        except AttributeError:
+            return response if isinstance(response, str) else str(response)
+    
+    @classmethod
+    def _response_text(cls, response: Any) -> str:
+        """Extract the answer text from a complete LLM response"""
+        return cls._raw_text(response).strip()
+    
+    def generate_answer_stream(self, query: str, context: str) -> Iterator[str]:
+        """
+        Generate answer using LLM with retrieved context, yielding text as it arrives
+        
+        Args:
+            query: User question
+            context: Retrieved context
+            
+        Yields:
+            str: Answer text chunks
+        """
+        try:
+            formatted_prompt = self._format_prompt(context=context, question=query)
+            
+            # Chat models stream message chunks, completion models stream plain strings
+            for chunk in self.llm.stream(formatted_prompt):
+                # Not stripped: the whitespace between tokens is part of the answer
+                text = self._raw_text(chunk)
+                if text:
+                    yield text
+            
+            logger.info("Streamed answer successfully")
+            
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield f"Sorry, I encountered an error while generating the answer: {str(e)}"
+    
     def extract_citations(self, documents: List[Document]) -> List[Dict[str, Any]]:
         """
         Extract citation information from documents
@@ -148,20 +332,57 @@ Helpful Answer:"""
         Returns:
             List[Dict[str, Any]]: Citation information
         """
-        citations = []
+        return self._build_context_and_citations(documents)[1]
+    
+    def _no_documents_response(self, question: str, query_timestamp: str) -> Dict[str, Any]:
+        """Response returned when retrieval finds nothing"""
+        return {
+            "answer": "I couldn't find any relevant information to answer your question. Please try rephrasing or upload more documents.",
+            "sources": [],
+            "query": question,
+            "timestamp": query_timestamp,
+            "model": self._model_name,
+            "success": False
+        }
+    
+    def _error_response(self, question: str, error: Exception) -> Dict[str, Any]:
+        """Response returned when the pipeline raises"""
+        return {
+            "answer": f"Sorry, I encountered an error while processing your question: {str(error)}",
+            "sources": [],
+            "query": question,
+            "timestamp": datetime.now().isoformat(),
+            "model": self._model_name,
+            "success": False,
+            "error": str(error)
+        }
+    
+    def _finish_response(self, question: str, answer: str, citations: List[Dict[str, Any]],
+                         category_filter: Optional[str], query_timestamp: str) -> Dict[str, Any]:
+        """Build the success response for a generated answer and log the query"""
+        response = {
+            "answer": answer,
+            "sources": citations,
+            "query": question,
+            "timestamp": query_timestamp,
+            "model": self._model_name,
+            "documents_retrieved": len(citations),
+            "category_filter": category_filter,
+            "success": True
+        }
         
-        for i, doc in enumerate(documents):
-            citation = {
-                "source_number": i + 1,
-                "filename": doc.metadata.get('filename', 'Unknown'),
-                "chunk_index": doc.metadata.get('chunk_index', 0),
-                "category": doc.metadata.get('category', 'general'),
-                "upload_timestamp": doc.metadata.get('upload_timestamp', 'Unknown'),
-                "content_preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-            }
-            citations.append(citation)
+        # Log query to database (optional, in the background)
+        future = _log_pool.submit(self.metadata_db.log_query, {
+            "question": question,
+            "answer": answer,
+            "documents_retrieved": len(citations),
+            "timestamp": query_timestamp,
+            "model": self._model_name,
+            "category_filter": category_filter
+        })
+        future.add_done_callback(_log_failure)
         
-        return citations
+        return response
     
     def query(self, question: str, k: int = 5, category_filter: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -184,62 +405,122 @@ Helpful Answer:"""
             documents = self.retrieve_documents(question, k=k, category_filter=category_filter)
             
             if not documents:
-                return {
-                    "answer": "I couldn't find any relevant information to answer your question. Please try rephrasing or upload more documents.",
-                    "sources": [],
-                    "query": question,
-                    "timestamp": query_timestamp,
-                    "model": self.llm_model.get_model_name(),
-                    "success": False
-                }
-            
-            # Format context
-            context = self.format_context(documents)
+                return self._no_documents_response(question, query_timestamp)
+            
+            # Format context and citations together
+            context, citations = self._build_context_and_citations(documents)
             
             # Generate answer
             answer = self.generate_answer(question, context)
             
-            # Extract citations
-            citations = self.extract_citations(documents)
-            
-            # Prepare response
-            response = {
-                "answer": answer,
-                "sources": citations,
-                "query": question,
-                "timestamp": query_timestamp,
-                "model": self.llm_model.get_model_name(),
-                "documents_retrieved": len(documents),
-                "category_filter": category_filter,
-                "success": True
-            }
+            return self._finish_response(question, answer, citations, category_filter, query_timestamp)
             
-            # Log query to database (optional)
-            try:
-                self.metadata_db.log_query({
-                    "question": question,
-                    "answer": answer,
-                    "documents_retrieved": len(documents),
-                    "timestamp": query_timestamp,
-                    "model": self.llm_model.get_model_name(),
-                    "category_filter": category_filter
-                })
-            except Exception as e:
-                logger.warning(f"Failed to log query: {e}")
+        except Exception as e:
+            logger.error(f"Error processing query: {e}")
+            return self._error_response(question, e)
+    
+    async def aquery(self, question: str, k: int = 5, category_filter: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async variant of query(), so many questions can share one event loop
+        
+        Retrieval runs in the vector store's async path and generation through the model's
+        ainvoke; the query is logged in the background as in query().
+        
+        Args:
+            question: User question
+            k: Number of documents to retrieve
+            category_filter: Optional category filter
             
-            return response
+        Returns:
+            Dict[str, Any]: Query response with answer and metadata
+        """
+        try:
+            query_timestamp = datetime.now().isoformat()
+            logger.info(f"Processing query: {question}")
+            
+            documents = await self.aretrieve_documents(question, k=k, category_filter=category_filter)
+            
+            if not documents:
+                return self._no_documents_response(question, query_timestamp)
+            
+            context, citations = self._build_context_and_citations(documents)
+            answer = await self.agenerate_answer(question, context)
+            
+            return self._finish_response(question, answer, citations, category_filter, query_timestamp)
             
         except Exception as e:
             logger.error(f"Error processing query: {e}")
-            return {
-                "answer": f"Sorry, I encountered an error while processing your question: {str(e)}",
-                "sources": [],
-                "query": question,
-                "timestamp": datetime.now().isoformat(),
-                "model": self.llm_model.get_model_name(),
-                "success": False,
-                "error": str(e)
-            }
+            return self._error_response(question, e)
+    
+    def query_stream(self, question: str, k: int = 5,
+                     category_filter: Optional[str] = None) -> Generator[str, None, Dict[str, Any]]:
+        """
+        Streaming variant of query()
+        
+        Yields answer text chunks as the model produces them, then returns the same
+        response dict query() would (retrieve it with ``response = yield from ...``
+        or from StopIteration.value).
+        
+        Args:
+            question: User question
+            k: Number of documents to retrieve
+            category_filter: Optional category filter
+            
+        Returns:
+            Dict[str, Any]: Query response with answer and metadata
+        """
+        try:
+            query_timestamp = datetime.now().isoformat()
+            logger.info(f"Processing streaming query: {question}")
+            
+            documents = self.retrieve_documents(question, k=k, category_filter=category_filter)
+            
+            if not documents:
+                response = self._no_documents_response(question, query_timestamp)
+                yield response["answer"]
+                return response
+            
+            context, citations = self._build_context_and_citations(documents)
+            
+            answer_parts = []
+            for text in self.generate_answer_stream(question, context):
+                answer_parts.append(text)
+                yield text
+            
+            return self._finish_response(question, "".join(answer_parts).strip(), citations, category_filter, query_timestamp)
+            
+        except Exception as e:
+            logger.error(f"Error processing query: {e}")
+            response = self._error_response(question, e)
+            yield response["answer"]
+            return response
+    
+    def query_events(self, question: str, k: int = 5,
+                     category_filter: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Event-style variant of query_stream() for callers that can't use its return value
+        
+        Yields {"type": "token", "data": text} for each answer chunk, then
+        {"type": "sources", "data": citations} and finally {"type": "response", "data": response}.
+        
+        Args:
+            question: User question
+            k: Number of documents to retrieve
+            category_filter: Optional category filter
+        
+        Yields:
+            Dict[str, Any]: Stream events
+        """
+        stream = self.query_stream(question, k=k, category_filter=category_filter)
+        while True:
+            try:
+                yield {"type": "token", "data": next(stream)}
+            except StopIteration as stop:
+                response = stop.value
+                break
+        
+        yield {"type": "sources", "data": response["sources"]}
+        yield {"type": "response", "data": response}
     
     def get_query_suggestions(self, category: Optional[str] = None) -> List[str]:
         """
@@ -251,48 +532,9 @@ Helpful Answer:"""
         Returns:
             List[str]: List of suggested queries
         """
-        base_suggestions = [
-            "What are the company policies?",
-            "How do I submit a vacation request?",
-            "What are the working hours?",
-            "What is the dress code policy?",
-            "How do I access company resources?",
-            "What are the benefits provided?",
-            "How do I report an issue?",
-            "What is the remote work policy?",
-            "How do I get IT support?",
-            "What are the safety protocols?"
-        ]
-        
-        # Category-specific suggestions
-        category_suggestions = {
-            "hr": [
-                "What is the hiring process?",
-                "How do I update my personal information?",
-                "What is the performance review process?",
-                "How do I request time off?",
-                "What are the employee benefits?"
-            ],
-            "policies": [
-                "What is the code of conduct?",
-                "What is the data privacy policy?",
-                "What are the security guidelines?",
-                "What is the expense reimbursement policy?",
-                "What is the travel policy?"
-            ],
-            "sops": [
-                "How do I perform system maintenance?",
-                "What is the incident response procedure?",
-                "How do I deploy new software?",
-                "What is the backup procedure?",
-                "How do I handle customer complaints?"
-            ]
-        }
-        
-        if category and category.lower() in category_suggestions:
-            return category_suggestions[category.lower()]
-        
-        return base_suggestions
+        if category:
+            return list(_CATEGORY_SUGGESTIONS.get(category.lower(), _BASE_SUGGESTIONS))
+        return list(_BASE_SUGGESTIONS)
     
     def get_search_stats(self) -> Dict[str, Any]:
         """
@@ -315,11 +557,13 @@ Helpful Answer:"""
 class AdvancedQueryEngine(QueryEngine):
     """Advanced query engine with additional features"""
     
-    def __init__(self):
-        super().__init__()
-        
-        # More sophisticated prompt templates
-        self.detailed_prompt_template = """
+    __slots__ = ()
+    
+    # Questions answered at once by query_with_followup
+    MAX_CONCURRENT_QUERIES = 8
+    
+    # More sophisticated prompt templates
+    detailed_prompt_template = """
 You are a helpful assistant that answers questions based on company documents. 
 Use the provided context to give detailed, accurate answers.
 
@@ -336,16 +580,19 @@ Context:
 Question: {question}
 
 Detailed Answer:"""
-        
-        self.detailed_prompt = PromptTemplate(
-            template=self.detailed_prompt_template,
-            input_variables=["context", "question"]
-        )
+    
+    detailed_prompt = PromptTemplate(
+        template=detailed_prompt_template,
+        input_variables=["context", "question"]
+    )
     
     def query_with_followup(self, question: str, follow_up_questions: List[str] = None, k: int = 5) -> Dict[str, Any]:
         """
         Enhanced query method that can handle follow-up questions
         
+        The main question and the follow-ups are answered concurrently, so K follow-ups
+        take about as long as the slowest single query rather than K of them in a row.
+        
         Args:
             question: Main question
             follow_up_questions: Optional follow-up questions
@@ -354,23 +601,22 @@ Detailed Answer:"""
         Returns:
             Dict[str, Any]: Enhanced response with follow-up answers
         """
-        # Get main answer
-        main_response = self.query(question, k=k)
-        
         if not follow_up_questions:
-            return main_response
+            return self.query(question, k=k)
         
-        # Process follow-up questions
-        follow_ups = []
-        for follow_up in follow_up_questions:
-            follow_up_response = self.query(follow_up, k=k)
-            follow_ups.append({
+        # Retrieval and generation are network-bound, so one thread per question
+        questions = [question, *follow_up_questions]
+        with ThreadPoolExecutor(max_workers=min(len(questions), self.MAX_CONCURRENT_QUERIES)) as executor:
+            main_response, *follow_up_responses = executor.map(lambda q: self.query(q, k=k), questions)
+        
+        main_response["follow_ups"] = [
+            {
                 "question": follow_up,
                 "answer": follow_up_response["answer"],
                 "sources": follow_up_response["sources"]
-            })
-        
-        main_response["follow_ups"] = follow_ups
+            }
+            for follow_up, follow_up_response in zip(follow_up_questions, follow_up_responses)
+        ]
         return main_response
 
 
@@ -0,0 +1,66 @@
+"""
+Retry Module
+Classifies client errors as transient (worth retrying) or permanent, and retries calls
+that fail transiently with jittered exponential backoff
+"""
+
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Default attempts per call, and the full-jitter exponential backoff between them: callers
+# that hit a rate limit together (e.g. pool threads) spread their retries instead of
+# retrying in lockstep
+CALL_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# Client errors that signal a transient condition (OpenAI/Anthropic SDKs, httpx, Google API core)
+_TRANSIENT_ERRORS = frozenset({
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",
+    "ConnectError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError",
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+})
+
+
+def is_transient(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    # status_code: OpenAI/Anthropic SDKs and httpx; status: Pinecone's API exceptions
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in _TRANSIENT_ERRORS
+
+
+def retry_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Seconds to wait before retry number attempt+1"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retries(func, *args, attempts: int = CALL_ATTEMPTS, **kwargs):
+    """Call func, retrying transient errors with jittered exponential backoff"""
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            logger.warning(f"Transient error ({e}), retrying")
+            time.sleep(retry_delay(attempt))
+
+
+async def acall_with_retries(func, *args, attempts: int = CALL_ATTEMPTS, **kwargs):
+    """Async variant of call_with_retries for coroutine functions"""
+    for attempt in range(attempts):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            logger.warning(f"Transient error ({e}), retrying")
+            await asyncio.sleep(retry_delay(attempt))
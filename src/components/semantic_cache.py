@@ -0,0 +1,109 @@
+"""
+Semantic Cache Module
+Thread-safe cache of search results keyed by clusters of query embeddings: a lookup
+hits when the query is close enough in cosine similarity to a cached cluster, not only
+when it is identical to an earlier query
+"""
+
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Bounded cache mapping clusters of similar query embeddings to results
+
+    Each entry is the centroid of the queries that hit it rather than a single past query:
+    a hit folds the query into the centroid (running mean of the unit vectors), so one row
+    covers a whole cluster of paraphrases. Centroids are unit-length float32 rows of one
+    contiguous matrix, so a lookup is a single matrix-vector product. Entries are grouped by
+    namespace (e.g. the search's k and filter) and a lookup only matches entries of its own
+    namespace. When full, the least frequently hit centroid is replaced.
+    """
+
+    def __init__(self, capacity: int = 1024, threshold: float = 0.95):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.stats = {"hits": 0, "misses": 0}
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # [capacity, dim] centroids, allocated on first set
+        # Norm of each cluster's sum of queries; centroid * norm is that sum, so the running
+        # mean is updated without keeping a second [capacity, dim] matrix
+        self._sum_norms = np.zeros(capacity, dtype=np.float32)
+        self._counts = np.zeros(capacity, dtype=np.int64)
+        self._namespace_ids = np.zeros(capacity, dtype=np.int32)
+        self._values: List[Any] = [None] * capacity
+        self._namespaces: Dict[Hashable, int] = {}
+        self._size = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        """Unit-length float32 copy of a vector, so cosine similarity is a plain dot product"""
+        array = np.array(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        if norm:
+            array /= norm
+        return array
+
+    def get(self, vector: Sequence[float], namespace: Hashable = None) -> Optional[Any]:
+        """Return the result of the closest cluster, or None below the threshold"""
+        query = self._normalize(vector)
+        with self._lock:
+            namespace_id = self._namespaces.get(namespace)
+            if namespace_id is None or self._size == 0:
+                self.stats["misses"] += 1
+                return None
+
+            # One float32 matrix-vector product (BLAS SGEMV) over the contiguous live rows
+            similarities = self._vectors[:self._size] @ query
+            if len(self._namespaces) > 1:
+                similarities[self._namespace_ids[:self._size] != namespace_id] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+
+            total = self._vectors[best] * self._sum_norms[best] + query
+            self._sum_norms[best] = np.linalg.norm(total)
+            np.divide(total, self._sum_norms[best], out=self._vectors[best])
+            self._counts[best] += 1
+            self.stats["hits"] += 1
+            return self._values[best]
+
+    def set(self, vector: Sequence[float], value: Any, namespace: Hashable = None):
+        """Start a new cluster at this query, replacing the least frequently hit one when full"""
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+                self._vectors = np.zeros((self.capacity, query.shape[0]), dtype=np.float32)
+                self._size = 0
+
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._counts))
+
+            self._vectors[slot] = query
+            self._sum_norms[slot] = 1.0
+            self._counts[slot] = 1
+            self._namespace_ids[slot] = self._namespaces.setdefault(namespace, len(self._namespaces))
+            self._values[slot] = value
+
+    def clear(self):
+        """Drop every entry (e.g. after the underlying data changed)"""
+        with self._lock:
+            self._size = 0
+            self._values = [None] * self.capacity
+            self._namespaces.clear()
+
+    def info(self) -> Dict[str, Any]:
+        """Current size, limits and hit/miss counts"""
+        with self._lock:
+            return {"size": self._size, "capacity": self.capacity, "threshold": self.threshold, **self.stats}
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,109 @@
+"""
+TTL Cache Module
+Thread-safe LRU/LFU cache whose entries expire after a time-to-live, with an
+optional stale window for stale-while-revalidate callers
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Bounded mapping whose entries are fresh for ttl seconds after they were stored
+
+    With stale_ttl set (>= ttl), entries are kept until stale_ttl and lookup() can still
+    serve them, flagged as stale, while the caller refreshes them. When full, the least
+    recently used entry is evicted ("lru") or the least frequently used one ("lfu").
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0, stale_ttl: Optional[float] = None,
+                 policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl or ttl, ttl)
+        self.policy = policy
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0}
+
+        self._lock = threading.RLock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._uses: Dict[Hashable, int] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or no longer fresh"""
+        value, fresh = self.lookup(key)
+        return value if fresh else None
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """Return (value, is_fresh); value is None once the entry is past its stale window"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    self._discard(key)
+                self.stats["misses"] += 1
+                return None, False
+
+            self._data.move_to_end(key)
+            self._uses[key] = self._uses.get(key, 0) + 1
+            fresh = entry[1] > now
+            self.stats["hits" if fresh else "stale_hits"] += 1
+            return entry[0], fresh
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, evicting one entry when full
+
+        A per-entry ttl (e.g. a short one for negative results) replaces both the fresh and
+        stale lifetimes, so such entries are never served stale.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if ttl is None:
+                self._data[key] = (value, now + self.ttl, now + self.stale_ttl)
+            else:
+                self._data[key] = (value, now + ttl, now + ttl)
+            self._data.move_to_end(key)
+            self._uses.setdefault(key, 0)
+            if len(self._data) > self.maxsize:
+                self._evict(exclude=key)
+
+    def pop(self, key: Hashable):
+        """Drop an entry if present (e.g. after the underlying data changed)"""
+        with self._lock:
+            if key in self._data:
+                self._discard(key)
+    
+    def _evict(self, exclude: Hashable):
+        """Drop one entry according to the eviction policy (never the one just stored)"""
+        if self.policy == "lfu":
+            victim = min((k for k in self._data if k != exclude), key=self._uses.__getitem__)
+        else:
+            victim = next(iter(self._data))
+        self._discard(victim)
+
+    def _discard(self, key: Hashable):
+        del self._data[key]
+        self._uses.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset statistics"""
+        with self._lock:
+            self._data.clear()
+            self._uses.clear()
+            self.stats = {"hits": 0, "stale_hits": 0, "misses": 0}
+
+    def info(self) -> Dict[str, Any]:
+        """Current size, limits and hit/miss counts"""
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                    "stale_ttl": self.stale_ttl, "policy": self.policy, **self.stats}
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -4,11 +4,19 @@ Handles vector database operations using Pinecone or ChromaDB
 """
 
 import os
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from abc import ABC, abstractmethod
 
 from pinecone import Pinecone, ServerlessSpec
+from pinecone.exceptions import NotFoundException
 import chromadb
 from chromadb.config import Settings
 try:
@@ -19,27 +27,189 @@ try:
     from langchain_chroma import Chroma
 except ImportError:
     from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 
+from .model_loader import get_embedding_model
+from .semantic_cache import SemanticCache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield consecutive lists of up to size items"""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
 class VectorStoreInterface(ABC):
     """Abstract interface for vector store implementations"""
     
+    # Bumped by every write, so callers caching search results can tell when they went stale
+    generation = 0
+    
+    # Cached query clusters, and how close (cosine) a new query must be to a cluster to reuse its result
+    SEMANTIC_CACHE_SIZE = 1024
+    SEMANTIC_CACHE_THRESHOLD = 0.95
+    _semantic_cache: Optional[SemanticCache] = None
+    
+    # Distinct query strings whose embeddings are kept, so a repeated question skips the
+    # embedding request
+    QUERY_EMBEDDING_CACHE_SIZE = 1024
+    _query_embeddings = None
+    
+    # Open bulk_ingest() blocks, and whether a write landed inside them; the store is shared
+    # by every session, so both are only touched under the lock
+    _bulk_depth = 0
+    _bulk_changed = False
+    _bulk_lock = threading.Lock()
+    
+    # Texts per embedding request, and requests in flight at once when embedding many texts
+    EMBED_BATCH_SIZE = 256
+    EMBED_MAX_WORKERS = 8
+    
     @abstractmethod
-    def add_documents(self, documents: List[Document]) -> List[str]:
-        """Add documents to the vector store"""
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Add documents to the vector store
+        
+        With ids given, writes are upserts under those IDs, so repeating a call (e.g. a retry
+        after a partial failure) does not duplicate vectors; otherwise fresh IDs are generated.
+        """
+        pass
+    
+    async def aadd_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """Add documents without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.add_documents(documents, ids=ids))
+    
+    def _embed_batches(self, texts: List[str]) -> Iterator[List[List[float]]]:
+        """
+        Yield the embeddings of EMBED_BATCH_SIZE texts at a time, in order, as they arrive
+        
+        Requests are sent concurrently (a single embed_documents call sends its internal batches
+        one after another), so callers can write one batch while later ones are still embedding.
+        """
+        batches = list(_batched(texts, self.EMBED_BATCH_SIZE))
+        if len(batches) <= 1:
+            yield from (self.embeddings.embed_documents(batch) for batch in batches)
+            return
+        
+        # map() keeps batch order, so vectors line up with texts
+        with ThreadPoolExecutor(max_workers=min(self.EMBED_MAX_WORKERS, len(batches))) as executor:
+            yield from executor.map(self.embeddings.embed_documents, batches)
+    
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in concurrent batched requests"""
+        return [vector for vectors in self._embed_batches(texts) for vector in vectors]
+    
+    @property
+    def semantic_cache(self) -> SemanticCache:
+        """Per-store cache of search results keyed by query embedding"""
+        if self._semantic_cache is None:
+            self._semantic_cache = SemanticCache(self.SEMANTIC_CACHE_SIZE, self.SEMANTIC_CACHE_THRESHOLD)
+        return self._semantic_cache
+    
+    def _mark_changed(self):
+        """Record a write: bump the generation and drop cached search results"""
+        with self._bulk_lock:
+            if self._bulk_depth:
+                self._bulk_changed = True
+                return
+            self.generation += 1
+        self.semantic_cache.clear()
+    
+    def _flush(self):
+        """Make grouped writes durable (nothing to do unless the backend buffers writes)"""
         pass
     
+    @contextmanager
+    def bulk_ingest(self):
+        """
+        Group many add_documents calls: cached searches are invalidated, and the backend
+        flushed, once when the outermost block exits instead of after every write
+        """
+        with self._bulk_lock:
+            self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            with self._bulk_lock:
+                self._bulk_depth -= 1
+                changed = not self._bulk_depth and self._bulk_changed
+                if changed:
+                    self._bulk_changed = False
+                    self.generation += 1
+            if changed:
+                self.semantic_cache.clear()
+                self._flush()
+    
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a search query, reusing the vector of an identical earlier query"""
+        if self._query_embeddings is None:
+            self._query_embeddings = lru_cache(maxsize=self.QUERY_EMBEDDING_CACHE_SIZE)(self.embeddings.embed_query)
+        # Copy, so callers cannot modify the cached vector
+        return list(self._query_embeddings(query))
+    
+    @staticmethod
+    def _search_namespace(k: int, filter: Optional[Dict[str, Any]]) -> Any:
+        """Semantic cache namespace of a search: results are only reused for the same k and filter"""
+        return (k, repr(sorted(filter.items())) if filter else None)
+    
+    def _cached_search(self, query: str, k: int, filter: Optional[Dict[str, Any]]) -> List[Document]:
+        """
+        Search by the query's embedding, reusing the result of a near-identical earlier query
+        
+        The query is embedded at most once (not at all when it was asked before); a cache hit
+        skips the vector DB search.
+        """
+        vector = self._embed_query(query)
+        namespace = self._search_namespace(k, filter)
+        cached = self.semantic_cache.get(vector, namespace)
+        if cached is not None:
+            return list(cached)
+        
+        generation = self.generation
+        results = self.vectorstore.similarity_search_by_vector(vector, k=k, filter=filter)
+        # Skip caching if a write landed mid-search
+        if generation == self.generation:
+            self.semantic_cache.set(vector, tuple(results), namespace)
+        return results
+    
     @abstractmethod
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
-        """Search for similar documents"""
+    def similarity_search(self, query: str, k: int = 5,
+                          filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Search for similar documents, optionally restricted to exact metadata matches"""
         pass
     
+    def similarity_search_iter(self, query: str, k: int = 5,
+                               filter: Optional[Dict[str, Any]] = None) -> Iterator[Document]:
+        """
+        Yield similar documents best first, so callers that stop early skip building the rest
+        
+        A semantically cached result is replayed; otherwise Documents are built one at a time
+        from the backend's raw response. Partially consumed results are not cached.
+        """
+        vector = self._embed_query(query)
+        cached = self.semantic_cache.get(vector, self._search_namespace(k, filter))
+        if cached is not None:
+            yield from cached
+            return
+        yield from self._iter_search_by_vector(vector, k, filter)
+    
+    def _iter_search_by_vector(self, vector: List[float], k: int,
+                               filter: Optional[Dict[str, Any]]) -> Iterator[Document]:
+        """Yield the documents nearest to a query vector (backends override this to stream)"""
+        yield from self.vectorstore.similarity_search_by_vector(vector, k=k, filter=filter)
+    
+    async def asimilarity_search(self, query: str, k: int = 5,
+                                 filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Search for similar documents without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.similarity_search(query, k=k, filter=filter))
+    
     @abstractmethod
     def delete_documents(self, ids: List[str]) -> bool:
         """Delete documents by IDs"""
@@ -49,6 +219,15 @@ class VectorStoreInterface(ABC):
 class PineconeVectorStore(VectorStoreInterface):
     """Pinecone vector store implementation"""
     
+    # Vectors per upsert request; one request carries a whole batch instead of a few records
+    UPSERT_BATCH_SIZE = 100
+    
+    # Upsert requests in flight at once (upserts are network-bound)
+    UPSERT_POOL_THREADS = 30
+    
+    # Metadata key holding a chunk's text, as LangChain's Pinecone wrapper expects when searching
+    TEXT_KEY = "text"
+    
     def __init__(self, api_key: str, environment: str, index_name: str = "knowledgebase"):
         """
         Initialize Pinecone vector store
@@ -61,7 +240,7 @@ class PineconeVectorStore(VectorStoreInterface):
         self.api_key = api_key
         self.environment = environment
         self.index_name = index_name
-        self.embeddings = OpenAIEmbeddings()
+        self.embeddings = get_embedding_model()
         
         # Initialize Pinecone
         self.pc = Pinecone(api_key=api_key)
@@ -69,19 +248,25 @@ class PineconeVectorStore(VectorStoreInterface):
         # Create index if it doesn't exist
         self._ensure_index_exists()
         
+        # One index handle (and connection pool) reused by every upsert and delete, with its own
+        # thread pool for parallel upserts
+        self.index = self.pc.Index(self.index_name, pool_threads=self.UPSERT_POOL_THREADS)
+        
         # Initialize LangChain wrapper
         self.vectorstore = LangchainPinecone.from_existing_index(
             index_name=self.index_name,
-            embedding=self.embeddings
+            embedding=self.embeddings,
+            text_key=self.TEXT_KEY
         )
         
         logger.info(f"Initialized Pinecone vector store with index: {self.index_name}")
     
     def _ensure_index_exists(self):
         """Create Pinecone index if it doesn't exist"""
-        existing_indexes = [index.name for index in self.pc.list_indexes()]
-        
-        if self.index_name not in existing_indexes:
+        # One lookup of this index instead of listing every index in the project
+        try:
+            self.pc.describe_index(self.index_name)
+        except NotFoundException:
             logger.info(f"Creating new Pinecone index: {self.index_name}")
             self.pc.create_index(
                 name=self.index_name,
@@ -93,31 +278,62 @@ class PineconeVectorStore(VectorStoreInterface):
                 )
             )
     
-    def add_documents(self, documents: List[Document]) -> List[str]:
-        """Add documents to Pinecone"""
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Add documents to Pinecone
+        
+        Texts are embedded in concurrent batched requests, and each embedded batch is upserted
+        (UPSERT_BATCH_SIZE vectors per request, in parallel on the index's thread pool) as soon
+        as it arrives, so upserts overlap the remaining embedding requests.
+        """
         try:
-            doc_ids = self.vectorstore.add_documents(documents)
+            doc_ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in documents]
+            remaining_ids, remaining_docs = iter(doc_ids), iter(documents)
+            
+            # Submit every batch before waiting on any; get() re-raises a failed upsert
+            pending = []
+            for vectors in self._embed_batches([doc.page_content for doc in documents]):
+                # vectors comes first so zip stops at the end of this batch
+                records = [
+                    {"id": doc_id, "values": vector, "metadata": {**doc.metadata, self.TEXT_KEY: doc.page_content}}
+                    for vector, doc_id, doc in zip(vectors, remaining_ids, remaining_docs)
+                ]
+                pending.extend(self.index.upsert(vectors=batch, async_req=True)
+                               for batch in _batched(records, self.UPSERT_BATCH_SIZE))
+            for result in pending:
+                result.get()
+            self._mark_changed()
             logger.info(f"Added {len(documents)} documents to Pinecone")
             return doc_ids
         except Exception as e:
             logger.error(f"Error adding documents to Pinecone: {e}")
             raise
     
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
-        """Search for similar documents in Pinecone"""
+    def similarity_search(self, query: str, k: int = 5,
+                          filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Search for similar documents in Pinecone (the filter is applied by the index, results are semantically cached)"""
         try:
-            results = self.vectorstore.similarity_search(query, k=k)
+            results = self._cached_search(query, k, filter)
             logger.info(f"Retrieved {len(results)} similar documents")
             return results
         except Exception as e:
             logger.error(f"Error searching Pinecone: {e}")
             raise
     
+    def _iter_search_by_vector(self, vector: List[float], k: int,
+                               filter: Optional[Dict[str, Any]]) -> Iterator[Document]:
+        """Yield Documents straight from the index's matches"""
+        response = self.index.query(vector=vector, top_k=k, filter=filter, include_metadata=True)
+        for match in response.matches:
+            metadata = dict(match.metadata or {})
+            text = metadata.pop(self.TEXT_KEY, "")
+            yield Document(page_content=text, metadata=metadata)
+    
     def delete_documents(self, ids: List[str]) -> bool:
         """Delete documents from Pinecone"""
         try:
-            index = self.pc.Index(self.index_name)
-            index.delete(ids=ids)
+            self.index.delete(ids=ids)
+            self._mark_changed()
             logger.info(f"Deleted {len(ids)} documents from Pinecone")
             return True
         except Exception as e:
@@ -128,6 +344,10 @@ class PineconeVectorStore(VectorStoreInterface):
 class ChromaVectorStore(VectorStoreInterface):
     """ChromaDB vector store implementation"""
     
+    # Documents per Chroma write; batches of roughly 100-250 index several times faster
+    # than one large write
+    ADD_BATCH_SIZE = 166
+    
     def __init__(self, collection_name: str = "knowledgebase", persist_directory: str = "./data/chroma_db"):
         """
         Initialize ChromaDB vector store
@@ -138,13 +358,18 @@ class ChromaVectorStore(VectorStoreInterface):
         """
         self.collection_name = collection_name
         self.persist_directory = persist_directory
-        self.embeddings = OpenAIEmbeddings()
+        self.embeddings = get_embedding_model()
         
         # Ensure persist directory exists
         os.makedirs(persist_directory, exist_ok=True)
         
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path=persist_directory)
+        self.add_batch_size = min(self.ADD_BATCH_SIZE, getattr(self.client, "max_batch_size", self.ADD_BATCH_SIZE))
+        
+        # Native collection handle for writes; embeddings are always supplied, so it needs no
+        # embedding function of its own
+        self.collection = self.client.get_or_create_collection(name=collection_name, embedding_function=None)
         
         # Initialize LangChain wrapper
         self.vectorstore = Chroma(
@@ -156,30 +381,76 @@ class ChromaVectorStore(VectorStoreInterface):
         
         logger.info(f"Initialized ChromaDB vector store with collection: {collection_name}")
     
-    def add_documents(self, documents: List[Document]) -> List[str]:
-        """Add documents to ChromaDB"""
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Add documents to ChromaDB
+        
+        Texts are embedded in concurrent batched requests up front, and each embedded batch is
+        written with its precomputed vectors straight through the native collection,
+        add_batch_size documents per write.
+        """
         try:
-            doc_ids = self.vectorstore.add_documents(documents)
+            if ids is not None:
+                doc_ids = list(ids)
+            else:
+                # One random prefix per call instead of a uuid4 per document
+                prefix = uuid.uuid4().hex
+                doc_ids = [f"{prefix}-{i}" for i in range(len(documents))]
+            remaining_ids, remaining_docs = iter(doc_ids), iter(documents)
+            
+            for vectors in self._embed_batches([doc.page_content for doc in documents]):
+                # vectors comes first so zip stops at the end of this batch
+                for batch in _batched(zip(vectors, remaining_ids, remaining_docs), self.add_batch_size):
+                    batch_vectors, batch_ids, batch_docs = zip(*batch)
+                    # upsert, so rewriting the same IDs (a retried batch) replaces rather than duplicates
+                    self.collection.upsert(
+                        ids=list(batch_ids),
+                        embeddings=list(batch_vectors),
+                        documents=[doc.page_content for doc in batch_docs],
+                        metadatas=[doc.metadata for doc in batch_docs]
+                    )
+            self._mark_changed()
             logger.info(f"Added {len(documents)} documents to ChromaDB")
             return doc_ids
         except Exception as e:
             logger.error(f"Error adding documents to ChromaDB: {e}")
             raise
     
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
-        """Search for similar documents in ChromaDB"""
+    def similarity_search(self, query: str, k: int = 5,
+                          filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        """Search for similar documents in ChromaDB (the filter is applied by the collection, results are semantically cached)"""
         try:
-            results = self.vectorstore.similarity_search(query, k=k)
+            results = self._cached_search(query, k, filter)
             logger.info(f"Retrieved {len(results)} similar documents")
             return results
         except Exception as e:
             logger.error(f"Error searching ChromaDB: {e}")
             raise
     
+    def _iter_search_by_vector(self, vector: List[float], k: int,
+                               filter: Optional[Dict[str, Any]]) -> Iterator[Document]:
+        """Yield Documents straight from the collection's query result"""
+        result = self.collection.query(query_embeddings=[vector], n_results=k, where=filter or None,
+                                       include=["documents", "metadatas"])
+        for text, metadata in zip(result["documents"][0], result["metadatas"][0]):
+            yield Document(page_content=text, metadata=metadata or {})
+    
+    def _flush(self):
+        """
+        Persist the collection once per bulk_ingest block
+        
+        Only pre-0.4 Chroma clients expose persist(); newer PersistentClients write through
+        on every add, so there is nothing left to flush.
+        """
+        persist = getattr(self.client, "persist", None)
+        if persist is not None:
+            persist()
+    
     def delete_documents(self, ids: List[str]) -> bool:
         """Delete documents from ChromaDB"""
         try:
-            self.vectorstore.delete(ids=ids)
+            self.collection.delete(ids=ids)
+            self._mark_changed()
             logger.info(f"Deleted {len(ids)} documents from ChromaDB")
             return True
         except Exception as e:
@@ -210,10 +481,14 @@ class VectorStoreFactory:
             raise ValueError(f"Unsupported vector store type: {store_type}")
 
 
+@lru_cache(maxsize=1)
 def get_vector_store() -> VectorStoreInterface:
     """
     Get configured vector store instance based on environment variables
     
+    The instance is created once per process and shared by every consumer (Streamlit reruns
+    included); call get_vector_store.cache_clear() to rebuild it after changing the configuration.
+    
     Returns:
         VectorStoreInterface: Configured vector store
     """
@@ -6,6 +6,7 @@ Run this to verify that all components are working correctly
 import os
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -72,35 +73,31 @@ def test_components():
         # Add src to path
         sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
         
-        # Test metadata database
-        print("  Testing metadata database...")
         from components.firebase_db import get_metadata_db
-        metadata_db = get_metadata_db()
-        print("  ✅ Metadata database initialized")
-        
-        # Test vector store
-        print("  Testing vector store...")
         from components.vector_store import get_vector_store
-        vector_store = get_vector_store()
-        print("  ✅ Vector store initialized")
-        
-        # Test model loader
-        print("  Testing model loader...")
         from components.model_loader import get_model
-        model = get_model()
-        print(f"  ✅ Model initialized: {model.get_model_name()}")
-        
-        # Test document processor
-        print("  Testing document processor...")
         from components.ingest import create_document_processor
-        doc_processor = create_document_processor()
-        print("  ✅ Document processor initialized")
-        
-        # Test query engine
-        print("  Testing query engine...")
         from components.query import create_query_engine
-        query_engine = create_query_engine()
-        print("  ✅ Query engine initialized")
+        
+        # Components in a stage are independent and start together; the processor and query
+        # engine come second because they reuse the shared database, store and model
+        stages = [
+            [("Metadata database", get_metadata_db),
+             ("Vector store", get_vector_store),
+             ("Model", get_model)],
+            [("Document processor", create_document_processor),
+             ("Query engine", create_query_engine)],
+        ]
+        
+        for stage in stages:
+            print(f"  Testing {', '.join(name.lower() for name, _ in stage)}...")
+            with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+                futures = {executor.submit(init): name for name, init in stage}
+                for future in as_completed(futures):
+                    component = future.result()
+                    name = futures[future]
+                    detail = f": {component.get_model_name()}" if name == "Model" else ""
+                    print(f"  ✅ {name} initialized{detail}")
         
         print("✅ All components initialized successfully!")
         return True